@@ -31,6 +31,7 @@ def create_app() -> "FastAPI":
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=["ETag", "X-Next-Cursor"],
     )
     app.include_router(api.router, prefix=settings.API_V1_STR)
 
@@ -1,13 +1,18 @@
-import shutil
+from functools import partial
 from pathlib import Path
 
 from fastapi import Depends, HTTPException, status
+from humanize import filesize
 from prisma.models import Bot, User
 
 from app.api.helpers.security import check_user
 from app.auto_gpt.api_manager import GPT_CACHE
-from app.core import settings
+from app.core import globals, settings
+from app.helpers.filesystem import remove_path
 from app.helpers.jobs import abort_job
+from app.helpers.log_streams import delete_log_stream
+from app.helpers.rotation import remove_log
+from app.helpers.usage import WorkspaceUsage, get_usage
 
 
 async def get_bot(user: User = Depends(check_user)) -> Bot:
@@ -21,6 +26,7 @@ async def delete_bot(bot: Bot) -> None:
     if bot.worker_message_id:
         await abort_job(bot.worker_message_id)
     await Bot.prisma().delete(where={"id": bot.id})
+    await delete_log_stream(globals.arq_redis, bot.id)
 
 
 async def stop_bot(bot: Bot) -> None:
@@ -50,9 +56,99 @@ def build_log_path(user_id: int) -> Path:
     return build_workspace_path(user_id, fmt="log")
 
 
-def clear_workspace(user_id: int) -> None:
-    shutil.rmtree(str(settings.WORKSPACES_DIR / f"user_{user_id}"), ignore_errors=True)
+def clear_log(user_id: int) -> None:
+    remove_log(build_log_path(user_id))
 
 
-def clear_workspace_cache(user_id: int) -> None:
-    shutil.rmtree(str(settings.WORKSPACES_DIR / f"user_{user_id}" / GPT_CACHE), ignore_errors=True)
+def build_uploads_path(user_id: int) -> Path:
+    return build_workspace_path(user_id, suffix="uploads")
+
+
+async def get_workspace_dir_path(user_id: int, path: str | None = None) -> Path:
+    """The `path` directory of the workspace, the workspace itself without it"""
+    workspace_path = build_workspace_path(user_id=user_id)
+    if not path:
+        return workspace_path
+    sub_path = workspace_path / path
+    if not sub_path.is_relative_to(workspace_path) or not await globals.filesystem.run(sub_path.is_dir):
+        raise HTTPException(status_code=400, detail="Invalid path")
+    return sub_path
+
+
+async def build_upload_destination(user_id: int, name: str, path: str | None = None) -> Path:
+    """Where a file uploaded as `name` into the `path` directory of the workspace goes"""
+    if not name or "/" in name or name in (".", ".."):
+        raise HTTPException(status_code=400, detail="Name should be a path to a file, not a directory")
+    workspace_path = build_workspace_path(user_id=user_id)
+    await globals.filesystem.run(partial(workspace_path.mkdir, exist_ok=True), name="Path.mkdir")
+    return await get_workspace_dir_path(user_id, path) / name
+
+
+def build_file_too_large_exception() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail=f"Workspace file size can not be larger than "
+        f"{filesize.naturalsize(settings.MAX_WORKSPACE_FILE_SIZE, binary=True)}",
+    )
+
+
+def build_quota_exceeded_exception() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail=f"Workspace quota of {filesize.naturalsize(settings.WORKSPACE_QUOTA, binary=True)} is exceeded, "
+        f"delete some files first",
+    )
+
+
+async def get_workspace_usage(user_id: int) -> WorkspaceUsage:
+    return await get_usage(globals.arq_redis, user_id, build_workspace_path(user_id))
+
+
+async def check_workspace_quota(user_id: int, size: int = 0) -> None:
+    """Raise if the workspace is over the quota, or would be after adding `size` bytes"""
+    if not settings.WORKSPACE_QUOTA:
+        return
+    usage = await get_workspace_usage(user_id)
+    if usage.size + size > settings.WORKSPACE_QUOTA:
+        raise build_quota_exceeded_exception()
+
+
+def build_cache_path(user_id: int) -> Path:
+    """Where the agent keeps its message history, sub-agents and budget"""
+    return build_workspace_path(user_id) / GPT_CACHE
+
+
+def build_archive_cache_path() -> Path:
+    return settings.WORKSPACES_DIR / ".archives"
+
+
+def build_preview_cache_path() -> Path:
+    return settings.WORKSPACES_DIR / ".previews"
+
+
+def build_embedding_cache_path() -> Path:
+    return settings.WORKSPACES_DIR / ".embeddings"
+
+
+async def get_workspace_file_path(user_id: int, name: str) -> Path:
+    workspace_path = build_workspace_path(user_id=user_id)
+    if GPT_CACHE in name:
+        raise HTTPException(status_code=400, detail=f"Can't list a file from `{GPT_CACHE} directory`")
+    path = workspace_path / name
+    if not path.is_relative_to(workspace_path) or not await globals.filesystem.run(path.exists):
+        raise HTTPException(status_code=400, detail="File does not exist in Workspace")
+    return path
+
+
+def build_mime_cache_path(user_id: int) -> Path:
+    return build_workspace_path(user_id, fmt="json", suffix="mime")
+
+
+async def clear_workspace(user_id: int) -> None:
+    await globals.filesystem.run(remove_path, settings.WORKSPACES_DIR / f"user_{user_id}")
+    await globals.filesystem.run(remove_path, build_uploads_path(user_id))
+    await globals.filesystem.run(remove_path, build_mime_cache_path(user_id))
+
+
+async def clear_workspace_cache(user_id: int) -> None:
+    await globals.filesystem.run(remove_path, build_cache_path(user_id))
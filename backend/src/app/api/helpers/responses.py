@@ -1,30 +1,234 @@
-from itertools import islice
+import hashlib
+import mimetypes
+import os
+import re
+from email.utils import formatdate
 from pathlib import Path
-from typing import Awaitable, Callable
+from typing import IO, Any, AsyncIterator, Awaitable, Callable
+from urllib.parse import quote
 
 import anyio
-from fastapi.responses import FileResponse, ORJSONResponse
+import orjson
+from fastapi import Request, Response, status
+from fastapi.responses import FileResponse, ORJSONResponse, StreamingResponse
 from typing_extensions import ParamSpec
-from app.helpers.readers import any_open, is_gz, tail_as_text
-from app.core import settings
+from app.helpers.line_index import LineIndex
+from app.helpers.readers import is_gz, read_since, tail_as_text, tail_segments_as_text
+from app.helpers.rotation import list_segments
+from app.core import globals, settings
 
 P = ParamSpec("P")
 
+LOG_CHUNK_SIZE = 1024 * 1024
+FILE_CHUNK_SIZE = 64 * 1024
+BYTE_RANGE = re.compile(r"bytes=(\d*)-(\d*)", re.IGNORECASE)
+# Inode of the log and an offset in it
+LOG_CURSOR = r"^\d+:\d+$"
 
-async def build_read_log_response(path: Path) -> ORJSONResponse:
-    if not path.exists() and is_gz(path):
+
+def build_etag(*parts: Any) -> str:
+    """Strong entity tag out of everything the response body depends on"""
+    return f'"{hashlib.blake2b(orjson.dumps(parts), digest_size=16).hexdigest()}"'
+
+
+def build_stat_etag(st: os.stat_result | None, *parts: Any) -> str:
+    """Entity tag of a response built from a file as of `st`, None if it doesn't exist"""
+    validator = [st.st_ino, st.st_size, st.st_mtime_ns] if st else None
+    return build_etag(validator, *parts)
+
+
+def build_file_etag(path: Path, *parts: Any) -> str:
+    """Entity tag of a response built from `path`, it changes whenever the file is replaced, grows or is rewritten"""
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        st = None
+    return build_stat_etag(st, *parts)
+
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return etag in tags or "*" in tags
+
+
+def build_not_modified_response(etag: str) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+
+def parse_range(header: str, size: int) -> tuple[int, int] | None:
+    """First and last byte of a `bytes=` range of a `size` bytes file
+
+    None means the header should be ignored and the whole file sent: it's malformed, in another unit or asks for
+    several ranges, which isn't supported. Raises `ValueError` if the range is valid but outside the file.
+    """
+    match = BYTE_RANGE.fullmatch(header.strip())
+    if not match or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if not first:
+        # Suffix range, the last N bytes
+        length = int(last)
+        if not length or not size:
+            raise ValueError(f"Range {header} is not satisfiable")
+        return max(size - length, 0), size - 1
+    start = int(first)
+    if last and start > int(last):
+        return None
+    if start >= size:
+        raise ValueError(f"Range {header} is not satisfiable")
+    return start, min(int(last), size - 1) if last else size - 1
+
+
+def build_content_disposition(filename: str) -> str:
+    """Same as `FileResponse` does it"""
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{filename}"'
+
+
+async def iter_open_file(f: IO[bytes], chunk_size: int = FILE_CHUNK_SIZE) -> AsyncIterator[bytes]:
+    """Chunks of a file opened beforehand, so it's sent whole even if it's removed meanwhile, closed at the end"""
+    try:
+        while chunk := await globals.filesystem.run(f.read, chunk_size):
+            yield chunk
+    finally:
+        f.close()
+
+
+async def iter_file_range(path: Path, start: int, end: int, chunk_size: int = FILE_CHUNK_SIZE) -> AsyncIterator[bytes]:
+    async with await anyio.open_file(path, "rb") as f:
+        await f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+async def build_file_response(request: Request, path: Path, filename: str | None = None) -> Response:
+    """Download of `path` honoring a single `Range`, answered with 206 and only those bytes
+
+    Every response advertises `Accept-Ranges` and carries the ETag of the file, so a client can resume an interrupted
+    download with `If-Range` and get the whole file instead if it changed meanwhile.
+    """
+    filename = filename or path.name
+    st = await globals.filesystem.run(path.stat)
+    etag = build_stat_etag(st)
+    last_modified = formatdate(st.st_mtime, usegmt=True)
+    headers = {"Accept-Ranges": "bytes", "ETag": etag}
+    range_header = request.headers.get("range")
+    if range_header and request.headers.get("if-range", etag) in (etag, last_modified):
+        try:
+            byte_range = parse_range(range_header, st.st_size)
+        except ValueError:
+            return Response(
+                status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                headers={**headers, "Content-Range": f"bytes */{st.st_size}"},
+            )
+        if byte_range:
+            start, end = byte_range
+            headers.update(
+                {
+                    "Content-Range": f"bytes {start}-{end}/{st.st_size}",
+                    "Content-Length": str(end - start + 1),
+                    "Content-Disposition": build_content_disposition(filename),
+                    "Last-Modified": last_modified,
+                }
+            )
+            return StreamingResponse(
+                iter_file_range(path, start, end),
+                status_code=status.HTTP_206_PARTIAL_CONTENT,
+                media_type=mimetypes.guess_type(filename)[0] or "text/plain",
+                headers=headers,
+            )
+    return FileResponse(path, filename=filename, headers=headers, stat_result=st)
+
+
+def read_log_tail(path: Path, lines: int, end: int | None = None) -> str:
+    """Tail of the log, continued from its rotated segments when the current one is too short"""
+    return tail_segments_as_text([path, *list_segments(path)], lines, end)
+
+
+def build_log_cursor(inode: int, offset: int) -> str:
+    return f"{inode}:{offset}"
+
+
+def parse_log_cursor(cursor: str) -> tuple[int, int]:
+    inode, offset = cursor.split(":")
+    return int(inode), int(offset)
+
+
+def read_log_since(path: Path, since: str | None, lines: int) -> tuple[str, str, bool]:
+    """Complete lines appended to the log after the `since` cursor, the cursor to go on from and whether it was reset
+
+    The log is read through the file the cursor is taken from, so a rotation meanwhile can't mix two files up. A
+    cursor of another file (the log was rotated) or past its end (it was truncated) gets the last `lines` lines of the
+    current log instead, as does no cursor at all.
+    """
+    with path.open("rb") as f:
+        st = os.fstat(f.fileno())
+        if since is not None:
+            inode, offset = parse_log_cursor(since)
+            # Taken before the log existed, whatever file shows up first continues it
+            if inode in (0, st.st_ino) and offset <= st.st_size:
+                text, offset = read_since(f, offset, LOG_CHUNK_SIZE, st.st_size)
+                return text, build_log_cursor(st.st_ino, offset), False
+        text = read_log_tail(path, lines, st.st_size)
+    return text, build_log_cursor(st.st_ino, st.st_size), since is not None
+
+
+async def build_read_log_response(path: Path, since: str | None = None) -> ORJSONResponse:
+    """Tail the log, or with a `since` cursor return only complete lines appended after it
+
+    `cursor` in the response is where the next `since` read should start. If the log was rotated or truncated since
+    the cursor was taken, the tail of the current one is returned instead, with `reset` set.
+    """
+    exists = await globals.filesystem.run(path.exists)
+    if not exists and is_gz(path):
         path = path.with_suffix("")
+        exists = await globals.filesystem.run(path.exists)
     text = ""
-    if path.exists():
+    cursor = None
+    reset = False
+    if exists:
         if is_gz(path):
-            with any_open(path, "rt") as r:
-                text = "".join([row for row in islice(r, 0, 1000)])
+            text = await globals.filesystem.run(tail_as_text, path, settings.TAIL_LOG_COUNT)
         elif path.suffix == ".log":
-            text = await anyio.to_thread.run_sync(tail_as_text, path, settings.TAIL_LOG_COUNT)
+            try:
+                text, cursor, reset = await globals.filesystem.run(read_log_since, path, since, settings.TAIL_LOG_COUNT)
+            except FileNotFoundError:
+                # Rotated away since it was checked, the next poll gets the new one
+                cursor = since
         else:
-            text = await anyio.to_thread.run_sync(tail_as_text, path, 10000)
+            text = await globals.filesystem.run(tail_as_text, path, 10000)
+    elif since is not None:
+        cursor = build_log_cursor(0, 0)
+        reset = parse_log_cursor(since)[1] > 0
+    return ORJSONResponse(
+        {"text": text, "cursor": cursor, "reset": reset},
+    )
+
+
+def read_log_page(path: Path, from_line: int, limit: int) -> tuple[str, int]:
+    # The worker writing the log keeps its index, requests only read it
+    index = LineIndex.open(path, read_only=True)
+    return index.read_lines(from_line, limit), index.total_lines
+
+
+async def build_read_log_page_response(path: Path, from_line: int, limit: int) -> ORJSONResponse:
+    """Return `limit` lines starting from `from_line` (zero based) using the line index of the log"""
+    text = ""
+    total_lines = 0
+    if await globals.filesystem.run(path.exists):
+        text, total_lines = await globals.filesystem.run(read_log_page, path, from_line, limit)
     return ORJSONResponse(
-        {"text": text},
+        {"text": text, "from_line": from_line, "total_lines": total_lines},
     )
 
 
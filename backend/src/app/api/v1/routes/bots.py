@@ -1,14 +1,10 @@
-import magic
-import os
-import shutil
-from pathlib import Path
-from tempfile import TemporaryFile, mktemp
-from zipfile import ZIP_DEFLATED, ZipFile
-
-import anyio
+import stat
+from datetime import datetime, timezone
+from functools import partial
+
 import yaml
-from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status, UploadFile
-from fastapi.responses import FileResponse, ORJSONResponse
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response, status, UploadFile
+from fastapi.responses import FileResponse, ORJSONResponse, StreamingResponse
 from humanize import filesize
 from prisma import Json
 from prisma.models import Bot, User
@@ -17,13 +13,41 @@ from pydantic import ValidationError
 from app.api.helpers import security, bots, responses
 from app.auto_gpt.api_manager import GPT_CACHE
 from app.core import globals, settings
-from app.helpers.system import remove_by_path
-from app.schemas.bot import AiSettingsSchema, BotInCreateSchema, BotSchema, WorkspaceFileSchema
-from app.schemas.enums import YesCount
+from app.helpers import log_streams, previews, state_store, usage
+from app.helpers.archives import ArchiveCache, iter_zip, scan_files
+from app.helpers.filesystem import remove_path
+from app.helpers.mime import MimeCache
+from app.helpers.uploads import (
+    ResumableUploads,
+    UploadConflict,
+    UploadError,
+    UploadNotFound,
+    UploadTooLarge,
+    save_stream,
+)
+from app.helpers.workspace import list_workspace
+from app.schemas.bot import (
+    AiSettingsSchema,
+    BotInCreateSchema,
+    BotSchema,
+    BudgetSchema,
+    HistorySchema,
+    UploadInCreateSchema,
+    UploadSchema,
+    WorkspaceFileSchema,
+    WorkspaceUsageSchema,
+)
+from app.schemas.enums import SortOrder, WorkspaceSort, YesCount
 
 
 CHUNK_SIZE = 1024 * 1024
 router = APIRouter(dependencies=[Depends(security.check_user)])
+# Shared by the requests, it keeps track of its size between them
+preview_cache = previews.PreviewCache(bots.build_preview_cache_path(), settings.WORKSPACE_PREVIEW_CACHE_SIZE)
+
+
+def build_resumable_uploads(user_id: int) -> ResumableUploads:
+    return ResumableUploads(bots.build_uploads_path(user_id), settings.RESUMABLE_UPLOAD_TTL)
 
 
 @router.post("/", response_model=BotSchema)
@@ -33,6 +57,7 @@ async def save_bot(*, bot_in: BotInCreateSchema, user: User = Depends(security.c
         if existing_bot.is_active:
             raise HTTPException(status_code=400, detail=f"Bot already exists, wait for it to finish or cancel")
         await Bot.prisma().delete(where={"id": existing_bot.id})
+    await bots.check_workspace_quota(user.id)
     bot = await Bot.prisma().create(
         data={
             "fast_engine": bot_in.fast_engine,
@@ -45,8 +70,9 @@ async def save_bot(*, bot_in: BotInCreateSchema, user: User = Depends(security.c
             "runs_left": 1,
         }
     )
-    bots.clear_workspace_cache(user.id)
-    bots.build_log_path(user.id).unlink(missing_ok=True)
+    await bots.clear_workspace_cache(user.id)
+    await usage.delete_usage(globals.arq_redis, user.id)
+    bots.clear_log(user.id)
     job = await globals.arq_redis.enqueue_job("run_auto_gpt", bot_id=bot.id)
     await Bot.prisma().update(data={"worker_message_id": job.job_id}, where={"id": bot.id})
     return bot.dict()
@@ -89,14 +115,66 @@ async def parse_ai_settings(*, file: UploadFile):
 
 
 @router.get("/log", response_class=ORJSONResponse)
-async def get_bot_log(*, bot: Bot = Depends(bots.get_bot)):
-    return await responses.build_read_log_response(bots.build_log_path(bot.user_id))
+async def get_bot_log(
+    *,
+    since: str | None = Query(None, regex=responses.LOG_CURSOR),
+    from_line: int | None = Query(None, ge=0),
+    limit: int = Query(1000, ge=1, le=10000),
+    request: Request,
+    bot: Bot = Depends(bots.get_bot),
+):
+    path = bots.build_log_path(bot.user_id)
+    # Taken before reading, so a log that grows meanwhile only costs the next poll a full response
+    etag = responses.build_file_etag(path, since, from_line, limit, settings.TAIL_LOG_COUNT)
+    if responses.is_not_modified(request, etag):
+        return responses.build_not_modified_response(etag)
+    if from_line is not None:
+        response = await responses.build_read_log_page_response(path, from_line, limit)
+    else:
+        response = await responses.build_read_log_response(path, since)
+    response.headers.update({"ETag": etag, "Cache-Control": "no-cache"})
+    return response
+
+
+@router.get("/budget", response_class=ORJSONResponse, response_model=BudgetSchema)
+async def get_bot_budget(*, user: User = Depends(security.check_user)):
+    """Tokens and money spent by the agent as of its last API call, zeros if it made none"""
+    budget = await globals.filesystem.run(
+        state_store.read_budget, bots.build_cache_path(user.id), settings.MEMORY_INDEX
+    )
+    return BudgetSchema(**(budget or {}))
+
+
+@router.get("/history", response_class=ORJSONResponse, response_model=HistorySchema)
+async def get_bot_history(
+    *,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    user: User = Depends(security.check_user),
+):
+    """A page of the message history of the agent, oldest first, and the count of all its messages"""
+    messages, total = await globals.filesystem.run(
+        state_store.read_history, bots.build_cache_path(user.id), settings.MEMORY_INDEX, offset, offset + limit
+    )
+    return HistorySchema(messages=messages, total=total)
+
+
+@router.get("/log/stream", response_class=StreamingResponse)
+async def stream_bot_log(*, last_id: str | None = None, request: Request, bot: Bot = Depends(bots.get_bot)):
+    """Server-sent events with new log lines, replayed from `last_id` (or `Last-Event-ID`)"""
+    last_id = last_id or request.headers.get("last-event-id") or "0-0"
+    return StreamingResponse(
+        log_streams.iter_log_events(globals.arq_redis, bot.id, last_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @router.get("/continue", status_code=status.HTTP_204_NO_CONTENT)
 async def continue_bot(count: YesCount, bot: Bot = Depends(bots.get_bot)):
     if bot.runs_left:
         raise HTTPException(status_code=400, detail="Bot is already running")
+    await bots.check_workspace_quota(bot.user_id)
     await Bot.prisma().update(
         data={"runs_left": count.value},
         where={"id": bot.id},
@@ -112,60 +190,153 @@ async def stop_bot(bot: Bot = Depends(bots.get_bot)):
 
 @router.post("/workspace", status_code=status.HTTP_204_NO_CONTENT)
 async def upload_to_workspace(*, file: UploadFile, path: str | None = None, user: User = Depends(security.check_user)):
-    workspace_path = bots.build_workspace_path(user_id=user.id)
-    if "/" in file.filename:
-        raise HTTPException(status_code=400, detail="Name should be a path to a file, not a directory")
-    if not workspace_path.exists():
-        workspace_path.mkdir()
-    workspace_path = bots.build_workspace_path(user_id=user.id)
-    if path:
-        sub_path = workspace_path / path
-        if not sub_path.is_relative_to(workspace_path) or not sub_path.exists() or not sub_path.is_dir():
-            raise HTTPException(status_code=400, detail="Invalid path")
-    else:
-        sub_path = workspace_path
-    with TemporaryFile() as temp_file:
-        real_file_size = 0
+    destination = await bots.build_upload_destination(user.id, file.filename, path)
+    replaced_size = await globals.filesystem.run(usage.get_file_size, destination)
+    max_size = settings.MAX_WORKSPACE_FILE_SIZE
+    if settings.WORKSPACE_QUOTA:
+        workspace_usage = await bots.get_workspace_usage(user.id)
+        quota_left = max(settings.WORKSPACE_QUOTA - workspace_usage.size, 0)
+        max_size = min(max_size, quota_left + (replaced_size or 0))
+
+    async def iter_file():
         while content := await file.read(CHUNK_SIZE):
-            real_file_size += len(content)
-            if real_file_size > settings.MAX_WORKSPACE_FILE_SIZE:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail=f"Workspace file size can not be larger than "
-                    f"{filesize.naturalsize(settings.MAX_WORKSPACE_FILE_SIZE, binary=True)}",
-                )
-            temp_file.write(content)
-        temp_file.seek(0)
-        async with (await anyio.open_file(sub_path / file.filename, "wb")) as w:
-            await w.write(temp_file.read())
+            yield content
+
+    try:
+        size = await save_stream(destination, iter_file(), max_size)
+    except UploadTooLarge:
+        if max_size < settings.MAX_WORKSPACE_FILE_SIZE:
+            raise bots.build_quota_exceeded_exception()
+        raise bots.build_file_too_large_exception()
+    await usage.add_usage(globals.arq_redis, user.id, size - (replaced_size or 0), int(replaced_size is None))
+
+
+@router.post("/workspace/uploads", response_model=UploadSchema, status_code=status.HTTP_201_CREATED)
+async def create_upload(*, upload_in: UploadInCreateSchema, user: User = Depends(security.check_user)):
+    """Start a resumable upload, send the data with `PATCH` in as many requests as needed"""
+    destination = await bots.build_upload_destination(user.id, upload_in.name, upload_in.path)
+    if upload_in.size > settings.MAX_WORKSPACE_FILE_SIZE:
+        raise bots.build_file_too_large_exception()
+    replaced_size = await globals.filesystem.run(usage.get_file_size, destination)
+    # Checked once upfront, concurrent uploads can overshoot the quota by what they declared
+    await bots.check_workspace_quota(user.id, upload_in.size - (replaced_size or 0))
+    upload = await globals.filesystem.run(build_resumable_uploads(user.id).create, destination, upload_in.size)
+    return UploadSchema(id=upload.id, offset=upload.offset, size=upload.size)
+
+
+@router.head("/workspace/uploads/{upload_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def get_upload_offset(*, upload_id: str, user: User = Depends(security.check_user)):
+    """Where to resume an upload from, in the `Upload-Offset` header"""
+    try:
+        upload = await globals.filesystem.run(build_resumable_uploads(user.id).get, upload_id)
+    except UploadNotFound:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Upload does not exist")
+    return Response(
+        status_code=status.HTTP_204_NO_CONTENT,
+        headers={"Upload-Offset": str(upload.offset), "Upload-Length": str(upload.size), "Cache-Control": "no-store"},
+    )
+
+
+@router.patch("/workspace/uploads/{upload_id}", response_model=UploadSchema)
+async def append_to_upload(
+    *,
+    upload_id: str,
+    upload_offset: int = Header(..., ge=0),
+    request: Request,
+    response: Response,
+    user: User = Depends(security.check_user),
+):
+    """Append the raw request body to an upload at `Upload-Offset`, it has to match the current offset
+
+    The file appears in the workspace once all of its bytes are uploaded. If a request breaks off, ask for the offset
+    with `HEAD` and continue from there.
+    """
+    try:
+        upload = await build_resumable_uploads(user.id).append(upload_id, upload_offset, request.stream())
+    except UploadNotFound:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Upload does not exist")
+    except UploadConflict as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    except UploadError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if upload.is_complete:
+        await usage.add_usage(
+            globals.arq_redis, user.id, upload.size - (upload.replaced_size or 0), int(upload.replaced_size is None)
+        )
+    response.headers["Upload-Offset"] = str(upload.offset)
+    return UploadSchema(id=upload.id, offset=upload.offset, size=upload.size)
+
+
+@router.delete("/workspace/uploads/{upload_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def cancel_upload(*, upload_id: str, user: User = Depends(security.check_user)):
+    try:
+        await globals.filesystem.run(build_resumable_uploads(user.id).remove, upload_id)
+    except UploadNotFound:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Upload does not exist")
 
 
 @router.get("/workspace", response_class=ORJSONResponse, response_model=list[WorkspaceFileSchema])
-async def list_workspace_files(*, path: str | None = None, user: User = Depends(security.check_user)):
+async def list_workspace_files(
+    *,
+    path: str | None = None,
+    sort: WorkspaceSort = WorkspaceSort.name,
+    order: SortOrder = SortOrder.asc,
+    limit: int | None = Query(None, ge=1, le=10000),
+    cursor: str | None = None,
+    recursive: bool = False,
+    depth: int = Query(8, ge=1, le=32),
+    request: Request,
+    response: Response,
+    user: User = Depends(security.check_user),
+):
+    """List a workspace directory, a page of `limit` entries at a time if it's set
+
+    The cursor of the next page comes in the `X-Next-Cursor` header, it's absent on the last page. With `recursive`
+    subdirectories are listed too, down to `depth` levels.
+    """
     workspace_path = bots.build_workspace_path(user_id=user.id)
-    if path:
-        sub_path = workspace_path / path
-        if not sub_path.is_relative_to(workspace_path) or not sub_path.exists() or not sub_path.is_dir():
-            raise HTTPException(status_code=400, detail="Invalid path")
-    else:
-        sub_path = workspace_path
+    sub_path = await bots.get_workspace_dir_path(user.id, path)
+    try:
+        page = await globals.filesystem.run(
+            partial(
+                list_workspace,
+                workspace_path,
+                sub_path,
+                exclude={GPT_CACHE},
+                sort=sort.value,
+                order=order.value,
+                limit=limit,
+                cursor=cursor,
+                depth=depth if recursive else 1,
+            ),
+            name="list_workspace",
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid cursor: {e}")
+    etag = responses.build_etag(page.fingerprint, page.next_cursor)
+    if responses.is_not_modified(request, etag):
+        return responses.build_not_modified_response(etag)
+    response.headers.update({"ETag": etag, "Cache-Control": "no-cache"})
+    if page.next_cursor:
+        response.headers["X-Next-Cursor"] = page.next_cursor
+    mime_cache = await globals.filesystem.run(MimeCache.load, bots.build_mime_cache_path(user.id))
+    mime_types = await mime_cache.get_mime_types([(workspace_path / entry.path, entry.st) for entry in page.entries])
+    await globals.filesystem.run(mime_cache.save)
     files = []
-    for f in sub_path.glob("*"):
-        if GPT_CACHE in f.parts:
-            continue
-        is_dir = f.is_dir()
-        st_size = f.stat().st_size
-        if st_size:
-            size = filesize.naturalsize(st_size)
+    for entry, mime_type in zip(page.entries, mime_types):
+        if entry.st.st_size:
+            size = filesize.naturalsize(entry.st.st_size)
         else:
             size = None
         files.append(
             WorkspaceFileSchema(
-                name=str(f.name),
-                path=str(f.relative_to(workspace_path)),
-                is_dir=is_dir,
-                mime_type=magic.from_file(f, mime=True) if not is_dir else None,
+                name=entry.name,
+                path=entry.path,
+                is_dir=entry.is_dir,
+                mime_type=mime_type,
                 size=size,
+                size_bytes=entry.st.st_size,
+                modified_at=datetime.fromtimestamp(entry.st.st_mtime, tz=timezone.utc),
             )
         )
     return files
@@ -175,37 +346,105 @@ async def list_workspace_files(*, path: str | None = None, user: User = Depends(
 async def delete_workspace_file(*, name: str, user: User = Depends(security.check_user)):
     workspace_path = bots.build_workspace_path(user_id=user.id)
     file_path = workspace_path / name
-    if not file_path.is_relative_to(workspace_path) or not file_path.exists():
+    if not file_path.is_relative_to(workspace_path) or not await globals.filesystem.run(file_path.exists):
         raise HTTPException(status_code=400, detail="Invalid file")
-    if file_path.is_dir():
-        shutil.rmtree(str(file_path), ignore_errors=True)
-    else:
-        file_path.unlink(missing_ok=True)
+    size, files = await globals.filesystem.run(usage.measure, file_path)
+    await globals.filesystem.run(remove_path, file_path)
+    await usage.add_usage(globals.arq_redis, user.id, -size, -files)
+
+
+@router.get("/workspace/usage", response_class=ORJSONResponse, response_model=WorkspaceUsageSchema)
+async def get_workspace_usage(*, user: User = Depends(security.check_user)):
+    """Total size and count of files in the workspace, as of the last upload, delete or measurement"""
+    workspace_usage = await bots.get_workspace_usage(user.id)
+    return WorkspaceUsageSchema(
+        size=filesize.naturalsize(workspace_usage.size),
+        size_bytes=workspace_usage.size,
+        files=workspace_usage.files,
+        quota_bytes=settings.WORKSPACE_QUOTA or None,
+        reconciled_at=datetime.fromtimestamp(workspace_usage.reconciled_at, tz=timezone.utc),
+    )
 
 
 @router.get("/workspace/get", response_class=FileResponse)
-async def get_workspace_file(
-    *, name: str | None = None, user: User = Depends(security.check_user), background_tasks: BackgroundTasks
-):
+async def get_workspace_file(*, name: str | None = None, request: Request, user: User = Depends(security.check_user)):
+    """Download a workspace file, a single byte `Range` of it is answered with 206, or a zip of a directory"""
     workspace_path = bots.build_workspace_path(user_id=user.id)
+    root = workspace_path
     if name:
-        if GPT_CACHE in name:
-            raise HTTPException(status_code=400, detail=f"Can't list a file from `{GPT_CACHE} directory`")
-        path = workspace_path / name
-        if not path.exists() or not path.is_relative_to(workspace_path):
-            raise HTTPException(status_code=400, detail="File does not exist in Workspace")
-        if path.is_dir():
-            workspace_path = path
+        path = await bots.get_workspace_file_path(user.id, name)
+        if await globals.filesystem.run(path.is_dir):
+            root = path
         else:
-            return FileResponse(path, filename=path.name)
-    zip_path = Path(mktemp(".zip"))
-    background_tasks.add_task(remove_by_path, zip_path)
-    with ZipFile(zip_path, "w", compression=ZIP_DEFLATED) as zip_file:
-        for path in filter(lambda f: not os.path.isdir(f) and GPT_CACHE not in f.parts, workspace_path.rglob("*")):
-            zip_file.write(path, str(path.relative_to(workspace_path)))
-    return FileResponse(zip_path, filename="workspace.zip")
+            return await responses.build_file_response(request, path)
+    headers = {"Content-Disposition": 'attachment; filename="workspace.zip"'}
+    if not settings.WORKSPACE_ARCHIVE_CACHE_SIZE:
+        return StreamingResponse(iter_zip(root, exclude={GPT_CACHE}), media_type="application/zip", headers=headers)
+    archive_cache = ArchiveCache(bots.build_archive_cache_path(), settings.WORKSPACE_ARCHIVE_CACHE_SIZE)
+    key = f"user_{user.id}"
+    scope = str(root.relative_to(workspace_path))
+    entries = await globals.filesystem.run(scan_files, root, {GPT_CACHE})
+    cached = await globals.filesystem.run(archive_cache.lookup, key, scope, entries)
+    if cached:
+        f, st = cached
+        return StreamingResponse(
+            responses.iter_open_file(f),
+            media_type="application/zip",
+            headers={**headers, "Content-Length": str(st.st_size), "ETag": responses.build_stat_etag(st)},
+        )
+    return StreamingResponse(
+        iter_zip(root, entries=entries, cache=archive_cache, key=key, scope=scope),
+        media_type="application/zip",
+        headers=headers,
+    )
+
+
+@router.get("/workspace/preview")
+async def preview_workspace_file(
+    *,
+    name: str,
+    lines: int = Query(100, ge=1, le=10000),
+    max_bytes: int = Query(64 * 1024, ge=1, le=1024 * 1024),
+    size: int = Query(256, ge=16, le=1024),
+    request: Request,
+    user: User = Depends(security.check_user),
+):
+    """First `lines` lines (and `max_bytes` at most) of a text file, or a thumbnail of an image fitting a `size` square
+
+    Text comes as JSON, thumbnails as JPEG or PNG. Thumbnails are cached on disk, both are cacheable by ETag.
+    """
+    path = await bots.get_workspace_file_path(user.id, name)
+    try:
+        st = await globals.filesystem.run(path.stat)
+    except FileNotFoundError:
+        raise HTTPException(status_code=400, detail="File does not exist in Workspace")
+    if stat.S_ISDIR(st.st_mode):
+        raise HTTPException(status_code=400, detail="Can't preview a directory")
+    mime_cache = await globals.filesystem.run(MimeCache.load, bots.build_mime_cache_path(user.id))
+    (mime_type,) = await mime_cache.get_mime_types([(path, st)])
+    await globals.filesystem.run(mime_cache.save)
+    if previews.is_image(mime_type):
+        etag = responses.build_stat_etag(st, "thumbnail", size)
+    elif previews.is_text(mime_type):
+        etag = responses.build_stat_etag(st, "text", lines, max_bytes)
+    else:
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail=f"Can't preview {mime_type}")
+    if responses.is_not_modified(request, etag):
+        return responses.build_not_modified_response(etag)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if previews.is_text(mime_type):
+        text, is_truncated = await globals.filesystem.run(previews.read_text_preview, path, lines, max_bytes)
+        return ORJSONResponse({"mime_type": mime_type, "text": text, "truncated": is_truncated}, headers=headers)
+    try:
+        data, media_type = await globals.filesystem.run(preview_cache.get_thumbnail, path, st, size)
+    except RuntimeError:
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail="Thumbnails are not available")
+    except OSError:
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail=f"Can't preview {mime_type}")
+    return Response(data, media_type=media_type, headers=headers)
 
 
 @router.get("/workspace/clear", status_code=status.HTTP_204_NO_CONTENT)
 async def clear_workspace(*, user: User = Depends(security.check_user)):
-    bots.clear_workspace(user.id)
+    await bots.clear_workspace(user.id)
+    await usage.delete_usage(globals.arq_redis, user.id)
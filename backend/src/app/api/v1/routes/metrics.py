@@ -0,0 +1,14 @@
+from fastapi import APIRouter, Depends
+from fastapi.responses import ORJSONResponse
+
+from app.api.helpers import security
+from app.core import globals
+
+
+router = APIRouter(dependencies=[Depends(security.check_user)])
+
+
+@router.get("/filesystem", response_class=ORJSONResponse)
+async def get_filesystem_metrics():
+    """Filesystem pool of this API process: busy threads, calls waiting for one and latency per operation"""
+    return globals.filesystem.statistics()
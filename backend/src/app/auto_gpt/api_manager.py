@@ -7,14 +7,24 @@ import orjson
 from autogpt.config import Config
 from autogpt.llm.api_manager import ApiManager
 
+from app.helpers.persistence import WriteBehind
+from app.helpers.state_store import StateStore
+
 
 SAVE_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_SERIALIZE_DATACLASS | orjson.OPT_NON_STR_KEYS
 GPT_CACHE = ".gpt_cache"
 
 
 class CachedApiManager(ApiManager):
-    def load_config(self, config: Config):
+    def load_config(self, config: Config, store: StateStore | None = None):
+        """`store` keeps the budget instead of a JSON file if given"""
         self.config = config
+        self.store = store
+        self.embedding_cache_hits = 0
+        self.embedding_cache_misses = 0
+        self.writer = WriteBehind(
+            Path(config.workspace_path) / GPT_CACHE / f"{config.memory_index}-budget.json", self.dump
+        )
 
     @classmethod
     def cast(cls, some_a: ApiManager):
@@ -30,25 +40,37 @@ class CachedApiManager(ApiManager):
             total_completion_tokens=self.total_completion_tokens,
             total_cost=self.total_cost,
             total_budget=self.total_budget,
+            embedding_cache_hits=self.embedding_cache_hits,
+            embedding_cache_misses=self.embedding_cache_misses,
         )
 
     def restore(self):
-        workspace_path = Path(self.config.workspace_path)
-        filename = workspace_path / GPT_CACHE / f"{self.config.memory_index}-budget.json"
-        if filename.exists():
+        filename = self.writer.path
+        d = None
+        if self.store:
+            d = self.store.get_budget()
+        elif filename.exists():
             with filename.open("rb") as f:
                 d = orjson.loads(f.read())
+        if d is not None:
             self.total_prompt_tokens = d.get("total_prompt_tokens", 0)
             self.total_completion_tokens = d.get("total_completion_tokens", 0)
             self.total_cost = d.get("total_cost", 0)
             self.total_budget = d.get("total_budget", 0)
+            self.embedding_cache_hits = d.get("embedding_cache_hits", 0)
+            self.embedding_cache_misses = d.get("embedding_cache_misses", 0)
         else:
             filename.parent.mkdir(exist_ok=True, parents=True)
             self.flush()
 
+    def dump(self) -> bytes:
+        return orjson.dumps(self.build_dict(), option=SAVE_OPTIONS)
+
     def flush(self):
-        with open(Path(self.config.workspace_path) / GPT_CACHE / f"{self.config.memory_index}-budget.json", "wb") as f:
-            f.write(orjson.dumps(self.build_dict(), option=SAVE_OPTIONS))
+        if self.store:
+            self.store.set_budget(self.build_dict())
+        else:
+            self.writer.flush(force=True)
 
     def update_cost(self, prompt_tokens, completion_tokens, model):
         """
@@ -60,4 +82,16 @@ class CachedApiManager(ApiManager):
         model (str): The model used for the API call.
         """
         super().update_cost(prompt_tokens, completion_tokens, model)
-        self.flush()
+        self.mark_dirty()
+
+    def update_embedding_cache(self, hits: int, misses: int) -> None:
+        self.embedding_cache_hits += hits
+        self.embedding_cache_misses += misses
+        self.mark_dirty()
+
+    def mark_dirty(self) -> None:
+        if self.store:
+            # A single row update, cheap enough to do right away
+            self.store.set_budget(self.build_dict())
+        else:
+            self.writer.mark_dirty()
@@ -3,6 +3,9 @@ from typing import Optional
 
 import click
 
+CYCLE_DONE_MARKER = "<<auto-gpt-ui:cycle-done>>"
+CONTINUE_COMMAND = "continue"
+
 
 @click.group(invoke_without_command=True)
 @click.option("-c", "--continuous", is_flag=True, help="Enable Continuous Mode")
@@ -88,6 +91,30 @@ import click
     type=int,
     help="Max size for cache objects.",
 )
+@click.option(
+    "--state-store",
+    "state_store_type",
+    type=click.Choice(["json", "sqlite"]),
+    default="json",
+    help="Keep the message history, sub-agents and budget in JSON files or in a single SQLite database.",
+)
+@click.option(
+    "--embedding-cache",
+    type=click.Path(),
+    help="Directory of the embedding cache shared with other agents, no caching without it.",
+)
+@click.option(
+    "--embedding-cache-size",
+    type=int,
+    default=1024 * 1024 * 1024,
+    help="Disk budget of the embedding cache, bytes.",
+)
+@click.option(
+    "--cycles",
+    type=int,
+    default=1,
+    help=f"Run this many cycles in one process, waiting for a `{CONTINUE_COMMAND}` line on stdin between them.",
+)
 @click.pass_context
 def main(
     ctx: click.Context,
@@ -110,6 +137,10 @@ def main(
     ai_role: Optional[str],
     ai_goal: tuple[str],
     max_cache_size: int,
+    cycles: int,
+    state_store_type: str,
+    embedding_cache: Optional[str],
+    embedding_cache_size: int,
 ) -> None:
     """
     Welcome to AutoGPT an experimental open-source application showcasing the capabilities of the GPT-4 pushing the boundaries of AI.
@@ -118,29 +149,38 @@ def main(
     """
     # Put imports inside function to avoid importing everything when starting the CLI
     from app.auto_gpt.main import run_auto_gpt
+    from app.helpers.persistence import flush_all
 
     if ctx.invoked_subcommand is None:
-        run_auto_gpt(
-            continuous,
-            continuous_limit,
-            ai_settings,
-            prompt_settings,
-            skip_reprompt,
-            speak,
-            debug,
-            gpt3only,
-            gpt4only,
-            memory_type,
-            browser_name,
-            allow_downloads,
-            skip_news,
-            workspace_directory,
-            install_plugin_deps,
-            max_cache_size,
-            ai_name,
-            ai_role,
-            ai_goal,
-        )
+        try:
+            run_auto_gpt(
+                continuous,
+                continuous_limit,
+                ai_settings,
+                prompt_settings,
+                skip_reprompt,
+                speak,
+                debug,
+                gpt3only,
+                gpt4only,
+                memory_type,
+                browser_name,
+                allow_downloads,
+                skip_news,
+                workspace_directory,
+                install_plugin_deps,
+                max_cache_size,
+                ai_name,
+                ai_role,
+                ai_goal,
+                cycles,
+                state_store_type,
+                embedding_cache,
+                embedding_cache_size,
+            )
+        finally:
+            # Forked children leave with `os._exit`, skipping the `atexit` flush
+            flush_all()
 
 
 if __name__ == "__main__":
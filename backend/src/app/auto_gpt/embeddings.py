@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+import functools
+from typing import Any, Callable
+
+from autogpt.config import Config
+from autogpt.llm.api_manager import ApiManager
+from autogpt.memory.vector import memory_item, utils
+from autogpt.memory.vector.providers import base
+
+from app.auto_gpt import memory
+from app.auto_gpt.api_manager import CachedApiManager
+from app.helpers.embedding_cache import EmbeddingCache
+
+
+def build_cached_get_embedding(cache: EmbeddingCache, get_embedding: Callable) -> Callable:
+    @functools.wraps(get_embedding)
+    def cached_get_embedding(input: Any, config: Config) -> Any:
+        if isinstance(input, str):
+            texts = [input]
+        elif isinstance(input, list) and input and all(isinstance(i, str) for i in input):
+            texts = input
+        else:
+            # Tokens, not worth caching
+            return get_embedding(input, config)
+
+        def compute(missing: list[str]) -> list:
+            if len(missing) == 1:
+                return [get_embedding(missing[0], config)]
+            return get_embedding(missing, config)
+
+        hits, misses = cache.hits, cache.misses
+        vectors = cache.get_or_compute(config.embedding_model, texts, compute)
+        api_manager = ApiManager()
+        if isinstance(api_manager, CachedApiManager):
+            api_manager.update_embedding_cache(cache.hits - hits, cache.misses - misses)
+        return vectors[0] if isinstance(input, str) else vectors
+
+    return cached_get_embedding
+
+
+def install_embedding_cache(cache: EmbeddingCache) -> None:
+    """Make every Auto-GPT embedding go through `cache`
+
+    Modules that imported `get_embedding` by name keep their own reference, each of them gets the cached one.
+    """
+    cached_get_embedding = build_cached_get_embedding(cache, utils.get_embedding)
+    for module in (utils, memory_item, base, memory):
+        if hasattr(module, "get_embedding"):
+            module.get_embedding = cached_get_embedding
@@ -9,6 +9,7 @@ from colorama import Fore, Style
 from autogpt.agent import AgentManager
 from autogpt.config.ai_config import AIConfig
 from autogpt.llm.api_manager import ApiManager
+from autogpt.llm.base import Message
 from autogpt.setup import prompt_user
 from autogpt.utils import clean_input
 from autogpt.config.config import Config, ConfigBuilder, check_openai_api_key
@@ -27,9 +28,21 @@ from autogpt.workspace import Workspace
 
 from app.auto_gpt.api_manager import CachedApiManager
 from app.auto_gpt.agent import AgentStandalone
+from app.auto_gpt.cli import CONTINUE_COMMAND, CYCLE_DONE_MARKER
+from app.auto_gpt.embeddings import install_embedding_cache
 from app.auto_gpt.install_plugin_deps import install_plugin_dependencies
-from app.auto_gpt.memory import CachedAgents, CachedMessageHistory
+from app.auto_gpt.memory import (
+    GPT_CACHE,
+    CachedAgents,
+    CachedMessageHistory,
+    MemmapMemory,
+    StoredAgents,
+    StoredMessageHistory,
+    install_memory,
+)
 from app.auto_gpt.plugins import scan_plugins
+from app.helpers.embedding_cache import EmbeddingCache
+from app.helpers.state_store import StateStore, build_state_store_path, migrate_from_json
 
 
 COMMAND_CATEGORIES = [
@@ -42,12 +55,20 @@ COMMAND_CATEGORIES = [
 ]
 
 
+def find_last_assistant_reply(message_history: CachedMessageHistory | StoredMessageHistory) -> Message | None:
+    try:
+        return next(filter(lambda x: x.role == "assistant", reversed(message_history.messages)))
+    except StopIteration:
+        return None
+
+
 def construct_main_ai_config(
     config: Config,
     name: Optional[str] = None,
     role: Optional[str] = None,
     goals: tuple[str] = tuple(),
     skip_print: bool = False,
+    state_store: StateStore | None = None,
 ) -> AIConfig:
     """Construct the prompt for the AI to respond to
 
@@ -111,7 +132,7 @@ def construct_main_ai_config(
     api_manager = ApiManager()
     CachedApiManager.cast(api_manager)
     api_manager.set_total_budget(ai_config.api_budget)
-    api_manager.load_config(config)
+    api_manager.load_config(config, state_store)
     api_manager.restore()
 
     if not skip_print:
@@ -156,6 +177,10 @@ def run_auto_gpt(
     ai_name: Optional[str] = None,
     ai_role: Optional[str] = None,
     ai_goals: tuple[str] = tuple(),
+    cycles: int = 1,
+    state_store_type: str = "json",
+    embedding_cache: str | Path | None = None,
+    embedding_cache_size: int = 0,
 ):
     # Configure logging before we do anything else.
     logger.set_level(logging.DEBUG if debug else logging.INFO)
@@ -168,6 +193,11 @@ def run_auto_gpt(
     # TODO: fill in llm values here
     check_openai_api_key(config)
 
+    # Not an Auto-GPT backend, it would refuse it
+    use_memmap_memory = memory_type == MemmapMemory.NAME
+    if use_memmap_memory:
+        memory_type = None
+
     create_config(
         config,
         continuous,
@@ -235,6 +265,9 @@ def run_auto_gpt(
     # HACK: doing this here to collect some globals that depend on the workspace.
     Workspace.build_file_logger_path(config, workspace_directory)
 
+    if embedding_cache and embedding_cache_size:
+        install_embedding_cache(EmbeddingCache(embedding_cache, embedding_cache_size))
+
     config.plugins = scan_plugins(config, config.debug_mode)
     # Create a CommandRegistry instance and scan default folder
     command_registry = CommandRegistry()
@@ -261,20 +294,29 @@ def run_auto_gpt(
             f"reason - {command.disabled_reason or 'Disabled by current config.'}"
         )
 
-    message_history = CachedMessageHistory.load_from_file(None, config)
-    while message_history.filename.stat().st_size >= max_cache_size:
-        logger.typewriter_log("Truncating cache...")
-        message_history.messages[:] = message_history.messages[(len(message_history.messages) // 4) or 1 :]
-        message_history.flush()
-    AgentManager(config).agents = CachedAgents(config)
+    state_store = None
+    if state_store_type == "sqlite":
+        cache_path = Path(config.workspace_path) / GPT_CACHE
+        state_store = StateStore(build_state_store_path(cache_path, config.memory_index))
+        if migrate_from_json(state_store, cache_path, config.memory_index):
+            logger.typewriter_log("Migrated cache to", Fore.GREEN, str(state_store.path))
+        message_history = StoredMessageHistory.load_from_store(None, state_store)
+        AgentManager(config).agents = StoredAgents(state_store)
+    else:
+        message_history = CachedMessageHistory.load_from_file(None, config)
+        AgentManager(config).agents = CachedAgents(config)
+    if message_history.truncate_to_size(max_cache_size):
+        logger.typewriter_log("Truncated cache")
 
-    try:
-        last_assistant_reply = next(filter(lambda x: x.role == "assistant", reversed(message_history.messages)))
-    except StopIteration:
-        last_assistant_reply = None
+    last_assistant_reply = find_last_assistant_reply(message_history)
 
     ai_config = construct_main_ai_config(
-        config, name=ai_name, role=ai_role, goals=ai_goals, skip_print=bool(last_assistant_reply)
+        config,
+        name=ai_name,
+        role=ai_role,
+        goals=ai_goals,
+        skip_print=bool(last_assistant_reply),
+        state_store=state_store,
     )
     ai_config.command_registry = command_registry
     ai_name = ai_config.ai_name
@@ -286,10 +328,19 @@ def run_auto_gpt(
                 logger.info(f"Loaded plugin into logger: {plugin.__class__.__name__}")
                 logger.chat_plugins.append(plugin)
 
-    # Initialize memory and make sure it is empty.
-    # this is particularly important for indexing and referencing pinecone memory
-    memory = get_memory(config)
-    memory.clear()
+    if use_memmap_memory:
+        # Kept across runs, so it isn't cleared, only kept under the cache size like the message history
+        config.memory_backend = MemmapMemory.NAME
+        memory = MemmapMemory(config)
+        if memory.index.truncate_to_size(max_cache_size):
+            logger.typewriter_log("Truncated memory")
+        # Auto-GPT commands get it by `get_memory` too
+        install_memory(memory)
+    else:
+        # Initialize memory and make sure it is empty.
+        # this is particularly important for indexing and referencing pinecone memory
+        memory = get_memory(config)
+        memory.clear()
     if not last_assistant_reply:
         logger.typewriter_log("Using memory of type:", Fore.GREEN, f"{memory.__class__.__name__}")
         logger.typewriter_log("Using Browser:", Fore.GREEN, config.selenium_web_browser)
@@ -310,4 +361,11 @@ def run_auto_gpt(
     )
     message_history.agent = agent
     agent.history = message_history
-    agent.process_next_interaction(last_assistant_reply)
+    for cycle in range(cycles):
+        if cycle:
+            # Let the worker account for the finished cycle and decide whether we should go on
+            print(CYCLE_DONE_MARKER, flush=True)
+            if sys.stdin.readline().strip() != CONTINUE_COMMAND:
+                break
+            last_assistant_reply = find_last_assistant_reply(message_history)
+        agent.process_next_interaction(last_assistant_reply)
@@ -1,15 +1,27 @@
 from __future__ import annotations
 
 import dataclasses
+import hashlib
 from pathlib import Path
-from typing import Any
+from typing import Any, Iterator, Sequence
 
+import numpy as np
 import orjson
 
 from autogpt.agent import Agent
+from autogpt.commands import file_operations, web_selenium
 from autogpt.config import Config
 from autogpt.llm.base import Message
+from autogpt.memory import vector
 from autogpt.memory.message_history import MessageHistory
+from autogpt.memory.vector import MemoryItem, MemoryItemRelevance
+from autogpt.memory.vector.providers.base import VectorMemoryProvider
+from autogpt.memory.vector.utils import get_embedding
+
+from app.helpers.journal import HistoryJournal
+from app.helpers.persistence import WriteBehind
+from app.helpers.state_store import StateStore
+from app.helpers.vectors import VectorIndex
 
 
 EMBED_DIM = 1536
@@ -19,43 +31,125 @@ GPT_CACHE = ".gpt_cache"
 
 @dataclasses.dataclass
 class CachedMessageHistory(MessageHistory):
+    """Message history persisted in an append-only journal, see `HistoryJournal`"""
+
     filename: Path = Path("")
+    journal: HistoryJournal | None = dataclasses.field(default=None, repr=False, compare=False)
 
     @classmethod
     def load_from_file(cls, agent: Agent | None, config: Config) -> "CachedMessageHistory":
-        workspace_path = Path(config.workspace_path)
-        self = cls(agent, filename=workspace_path / GPT_CACHE / f"{config.memory_index}-history.json")
+        cache_path = Path(config.workspace_path) / GPT_CACHE
+        self = cls(agent, filename=cache_path / f"{config.memory_index}-history.jsonl")
+        self.journal = HistoryJournal(self.filename)
+        # Written by older versions as a single JSON document, migrated to the journal on first load
+        legacy_filename = cache_path / f"{config.memory_index}-history.json"
 
         if self.filename.exists():
-            with self.filename.open("rb") as f:
-                data = orjson.loads(f.read())
-                self.messages = [Message(**mes) for mes in data.get("messages", [])]
-                self.summary = data.get("summary", self.summary)
-                self.last_trimmed_index = data.get("last_trimmed_index", self.last_trimmed_index)
+            messages, state = self.journal.load()
+        elif legacy_filename.exists():
+            with legacy_filename.open("rb") as f:
+                state = orjson.loads(f.read())
+            messages = state.pop("messages", [])
         else:
-            self.filename.parent.mkdir(exist_ok=True, parents=True)
-            with self.filename.open("w+b") as f:
-                f.write(b"{}")
+            messages, state = [], None
+        self.messages = [Message(**mes) for mes in messages]
+        if state:
+            self.summary = state.get("summary", self.summary)
+            self.last_trimmed_index = state.get("last_trimmed_index", self.last_trimmed_index)
+        if not self.filename.exists():
+            self.flush()
+            legacy_filename.unlink(missing_ok=True)
         return self
 
-    def build_dict(self):
+    def build_state(self) -> dict[str, Any]:
         return {
-            "messages": self.messages,
             "summary": self.summary,
             "last_trimmed_index": self.last_trimmed_index,
         }
 
     def flush(self) -> None:
-        with open(self.filename, "wb") as f:
-            f.write(orjson.dumps(self.build_dict(), option=SAVE_OPTIONS))
+        """Rewrite the whole journal, needed after messages were removed or changed in place"""
+        self.journal.rewrite(self.messages, self.build_state())
+
+    def truncate_to_size(self, max_size: int, target_size: int | None = None) -> int:
+        """Once the history takes `max_size` bytes on disk, drop the oldest messages to get it under `target_size`
+
+        `target_size` is three quarters of `max_size` by default, so the next messages don't push it over the limit
+        again right away. The cut point is planned from the known size of every record and the history is rewritten
+        once. Returns how many messages were dropped, a journal that's only too large because of dead records is
+        compacted without dropping anything.
+        """
+        if self.journal.size < max_size:
+            return 0
+        count = self.journal.plan_truncation(max_size * 3 // 4 if target_size is None else target_size)
+        del self.messages[:count]
+        # It's an index into `messages`, which just lost its head
+        self.last_trimmed_index = max(self.last_trimmed_index - count, 0)
+        self.flush()
+        return count
 
     def append(self, message: Message) -> None:
         super().append(message)
-        self.flush()
+        self.journal.append_message(message)
+
+    def trim_messages(self, *args, **kwargs) -> tuple[Message, list[Message]]:
+        # The only place the summary and the trimmed index change
+        result = super().trim_messages(*args, **kwargs)
+        self.journal.write_state(self.build_state())
+        if self.journal.needs_compaction:
+            self.flush()
+        return result
+
+
+@dataclasses.dataclass
+class StoredMessageHistory(MessageHistory):
+    """Message history persisted in a `StateStore`, a row per message"""
+
+    store: StateStore | None = dataclasses.field(default=None, repr=False, compare=False)
+
+    @classmethod
+    def load_from_store(cls, agent: Agent | None, store: StateStore) -> "StoredMessageHistory":
+        self = cls(agent, store=store)
+        self.messages = [Message(**mes) for mes in store.load_messages()]
+        state = store.get_history_state()
+        if state:
+            self.summary = state.get("summary", self.summary)
+            self.last_trimmed_index = state.get("last_trimmed_index", self.last_trimmed_index)
+        return self
+
+    def build_state(self) -> dict[str, Any]:
+        return {
+            "summary": self.summary,
+            "last_trimmed_index": self.last_trimmed_index,
+        }
+
+    def flush(self) -> None:
+        self.store.replace_messages(self.messages, self.build_state())
+
+    def truncate_to_size(self, max_size: int, target_size: int | None = None) -> int:
+        """Same as `CachedMessageHistory.truncate_to_size`, but the oldest rows are deleted instead of a rewrite"""
+        if self.store.get_messages_size() < max_size:
+            return 0
+        count = self.store.plan_truncation(max_size * 3 // 4 if target_size is None else target_size)
+        del self.messages[:count]
+        self.last_trimmed_index = max(self.last_trimmed_index - count, 0)
+        with self.store.transaction():
+            self.store.delete_messages(count)
+            self.store.write_history_state(self.build_state())
+        return count
+
+    def append(self, message: Message) -> None:
+        super().append(message)
+        self.store.append_message(message)
+
+    def trim_messages(self, *args, **kwargs) -> tuple[Message, list[Message]]:
+        result = super().trim_messages(*args, **kwargs)
+        self.store.write_history_state(self.build_state())
+        return result
 
 
 class CachedAgents:
-    """A class that stores the memory in a local file"""
+    """A class that stores the memory in a local file, written behind the changes, see `WriteBehind`"""
 
     def __init__(self, cfg) -> None:
         """Initialize a class instance
@@ -70,14 +164,14 @@ class CachedAgents:
         self.filename = workspace_path / GPT_CACHE / f"{cfg.memory_index}-agents.json"
 
         self.data = {}
+        self.writer = WriteBehind(self.filename, self.dump)
 
         if self.filename.exists():
             with self.filename.open("rb") as f:
                 self.data = {int(k): v for k, v in orjson.loads(f.read()).items()}
         else:
             self.filename.parent.mkdir(exist_ok=True, parents=True)
-            with self.filename.open("w+b") as f:
-                f.write(b"{}")
+            self.flush()
 
     def __setitem__(self, key, value):
         self.add(key, value)
@@ -85,19 +179,134 @@ class CachedAgents:
     def __getitem__(self, key):
         return self.data[key]
 
+    def dump(self) -> bytes:
+        return orjson.dumps(self.data, option=SAVE_OPTIONS)
+
     def flush(self) -> None:
-        with open(self.filename, "wb") as f:
-            f.write(orjson.dumps(self.data, option=SAVE_OPTIONS))
+        self.writer.flush(force=True)
 
     def add(self, key: int, agent: tuple) -> None:
         self.data[key] = agent
-        self.flush()
+        self.writer.mark_dirty()
 
     def get(self, key: int, default: Any = None) -> tuple | None:
         return self.data.get(key, default)
 
     def delete(self, key: int) -> None:
         del self.data[key]
+        self.writer.mark_dirty()
 
     def items(self):
         return self.data.items()
+
+
+class StoredAgents:
+    """Sub-agents persisted in a `StateStore`, a row per agent"""
+
+    def __init__(self, store: StateStore) -> None:
+        self.store = store
+        self.data = store.load_agents()
+
+    def __setitem__(self, key, value):
+        self.add(key, value)
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def add(self, key: int, agent: tuple) -> None:
+        self.data[key] = agent
+        self.store.set_agent(key, agent)
+
+    def get(self, key: int, default: Any = None) -> tuple | None:
+        return self.data.get(key, default)
+
+    def delete(self, key: int) -> None:
+        del self.data[key]
+        self.store.delete_agent(key)
+
+    def items(self):
+        return self.data.items()
+
+
+class MemmapMemory(VectorMemoryProvider):
+    """Vector memory kept in the workspace across runs and searched in one go, see `VectorIndex`"""
+
+    NAME = "memmap"
+
+    def __init__(self, config: Config) -> None:
+        self.index = VectorIndex(Path(config.workspace_path) / GPT_CACHE / f"{config.memory_index}-vectors", EMBED_DIM)
+        self.index.load()
+
+    @staticmethod
+    def build_key(item: MemoryItem) -> str:
+        data = orjson.dumps([item.raw_content, item.metadata], option=SAVE_OPTIONS)
+        return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+    def build_item(self, item_id: int, data: dict) -> MemoryItem:
+        vectors = self.index.get_vectors(item_id)
+        return MemoryItem(
+            raw_content=data["raw_content"],
+            summary=data["summary"],
+            chunks=data["chunks"],
+            chunk_summaries=data["chunk_summaries"],
+            e_summary=vectors[0],
+            e_chunks=list(vectors[1:]),
+            metadata=data["metadata"],
+        )
+
+    def __iter__(self) -> Iterator[MemoryItem]:
+        return (self.build_item(item_id, data) for item_id, data in self.index.iter_items())
+
+    def __contains__(self, x: MemoryItem) -> bool:
+        return self.build_key(x) in self.index
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def add(self, item: MemoryItem) -> int:
+        data = {
+            "raw_content": item.raw_content,
+            "summary": item.summary,
+            "chunks": item.chunks,
+            "chunk_summaries": item.chunk_summaries,
+            "metadata": item.metadata,
+        }
+        # The summary is the first row, the chunks follow in order
+        vectors = np.vstack([item.e_summary, *item.e_chunks])
+        self.index.add(self.build_key(item), vectors, data)
+        return len(self.index)
+
+    def discard(self, item: MemoryItem) -> None:
+        self.index.discard(self.build_key(item))
+
+    def clear(self) -> None:
+        self.index.clear()
+
+    def get_relevant(self, query: str, k: int, config: Config) -> Sequence[MemoryItemRelevance]:
+        """The `k` most relevant memories, scored all at once instead of one by one"""
+        if not len(self):
+            return []
+        e_query = get_embedding(query, config)
+        return [
+            MemoryItemRelevance(
+                for_query=query,
+                memory_item=self.build_item(item_id, self.index.items[item_id]),
+                summary_relevance_score=float(scores[0]),
+                chunk_relevance_scores=scores[1:].tolist(),
+            )
+            for item_id, _, scores in self.index.search(np.asarray(e_query), k)
+        ]
+
+
+def install_memory(memory: VectorMemoryProvider) -> None:
+    """Make every Auto-GPT `get_memory` call return `memory`, whatever backend it would pick
+
+    Modules that imported `get_memory` by name keep their own reference, each of them gets the replacement.
+    """
+
+    def get_memory(config: Config) -> VectorMemoryProvider:
+        return memory
+
+    for module in (vector, file_operations, web_selenium):
+        if hasattr(module, "get_memory"):
+            module.get_memory = get_memory
@@ -0,0 +1,180 @@
+"""Fork server for Auto-GPT agents.
+
+Imports the heavy Auto-GPT modules once and then forks a child for every job, so the per-run cost is a ``fork()``
+instead of a cold interpreter start. Jobs are sent over a unix socket as a single JSON line together with the
+child's stdin and stdout descriptors (``SCM_RIGHTS``). The server replies with ``{"pid": ...}`` once the child is
+started and ``{"returncode": ...}`` once it has exited.
+"""
+import argparse
+import importlib
+import os
+import selectors
+import signal
+import socket
+import sys
+from typing import Any
+
+import orjson
+
+MAX_REQUEST_SIZE = 1024 * 1024
+MAX_FDS = 2
+# Seconds a client may take to send its request, the server serves nobody else meanwhile
+REQUEST_TIMEOUT = 5
+
+
+def preload() -> None:
+    from app.auto_gpt import cli  # noqa: F401
+    from app.auto_gpt.main import COMMAND_CATEGORIES
+
+    for command_category in COMMAND_CATEGORIES:
+        try:
+            importlib.import_module(command_category)
+        except Exception as e:
+            print(f"Failed to preload {command_category}: {e}", file=sys.stderr)
+
+
+def run_child(request: dict[str, Any], fds: list[int]) -> int:
+    from app.auto_gpt import cli
+
+    os.setsid()
+    stdin_fd, stdout_fd = fds
+    os.dup2(stdin_fd, 0)
+    os.dup2(stdout_fd, 1)
+    os.dup2(stdout_fd, 2)
+    os.close(stdin_fd)
+    os.close(stdout_fd)
+    sys.stdin = open(0, "r", closefd=False)
+    sys.stdout = open(1, "w", buffering=1, closefd=False)
+    sys.stderr = open(2, "w", buffering=1, closefd=False)
+    os.environ.clear()
+    os.environ.update({k: v for k, v in request["env"].items() if v is not None})
+    if request.get("cwd"):
+        os.chdir(request["cwd"])
+    try:
+        cli.main(args=request["args"], prog_name="cli")
+        return 0
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            return e.code or 0
+        print(e.code, file=sys.stderr)
+        return 1
+    except BaseException as e:
+        import traceback
+
+        traceback.print_exception(e)
+        return 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+
+def _exit_code(status: int) -> int:
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+class ZygoteServer:
+    def __init__(self, socket_path: str):
+        self.socket_path = socket_path
+        self.selector = selectors.DefaultSelector()
+        self.children: dict[int, socket.socket] = {}
+        self.running = True
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+    def serve(self) -> None:
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self.listener.bind(self.socket_path)
+        self.listener.listen()
+        self.selector.register(self.listener, selectors.EVENT_READ)
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        # Tell the parent we are ready to accept jobs
+        print("ready", flush=True)
+        while self.running:
+            for key, _ in self.selector.select(timeout=0.2):
+                if key.fileobj is self.listener:
+                    conn, _ = self.listener.accept()
+                    self.handle(conn)
+            self.reap()
+        for pid in self.children:
+            try:
+                os.killpg(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        self.listener.close()
+        os.unlink(self.socket_path)
+
+    def stop(self, *_: Any) -> None:
+        self.running = False
+
+    def handle(self, conn: socket.socket) -> None:
+        # Also bounds the replies, a client that stopped reading can't block the server either
+        conn.settimeout(REQUEST_TIMEOUT)
+        fds: list[int] = []
+        try:
+            msg, fds, _, _ = socket.recv_fds(conn, MAX_REQUEST_SIZE, MAX_FDS)
+            if len(fds) != MAX_FDS:
+                raise ValueError(f"Expected {MAX_FDS} file descriptors, got {len(fds)}")
+            request = orjson.loads(msg)
+        except Exception as e:
+            for fd in fds:
+                os.close(fd)
+            try:
+                conn.sendall(orjson.dumps({"error": str(e)}) + b"\n")
+            except OSError:
+                pass
+            conn.close()
+            return
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                self.selector.close()
+                self.listener.close()
+                conn.close()
+                for child_conn in self.children.values():
+                    child_conn.close()
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                signal.signal(signal.SIGINT, signal.SIG_DFL)
+                code = run_child(request, fds)
+            finally:
+                os._exit(code)
+        for fd in fds:
+            os.close(fd)
+        self.children[pid] = conn
+        try:
+            conn.sendall(orjson.dumps({"pid": pid}) + b"\n")
+        except OSError:
+            # The client went away, the child still gets reaped
+            pass
+
+    def reap(self) -> None:
+        while self.children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            conn = self.children.pop(pid, None)
+            if conn is None:
+                continue
+            try:
+                conn.sendall(orjson.dumps({"returncode": _exit_code(status)}) + b"\n")
+            except OSError:
+                pass
+            conn.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--socket", required=True, help="Path to the unix socket to listen on")
+    args = parser.parse_args()
+    preload()
+    ZygoteServer(args.socket).serve()
+
+
+if __name__ == "__main__":
+    main()
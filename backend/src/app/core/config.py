@@ -1,6 +1,6 @@
 import sys
 from pathlib import Path
-from typing import Any, Type
+from typing import Any, Literal, Type
 
 from pydantic import AnyUrl, AnyHttpUrl, BaseSettings, Field, validator, RedisDsn
 
@@ -47,14 +47,75 @@ class Settings(BaseSettings):
         return v.resolve()
 
     PYTHON_BINARY: str = Field("python", description="Path to python binary if run outside Docker")
+    AGENT_FORK_SERVER: bool = Field(
+        False,
+        description="Fork Auto-GPT agents from a preloaded process instead of starting a fresh interpreter for every run",
+    )
+    SINGLE_PROCESS_RUNS: bool = Field(
+        False, description="Run all cycles requested with `continue` in one Auto-GPT process instead of one per cycle"
+    )
 
     TAIL_LOG_COUNT: int = Field(5000, description="Tail logs for this much rows for the UI")
+    LOG_STREAM_TTL: int = Field(
+        24 * 60 * 60, description="Keep live log streams in Redis for this long after the last line, seconds"
+    )
+    LOG_FLUSH_SIZE: int = Field(
+        64 * 1024, description="Write agent output to the log once this much bytes are buffered"
+    )
+    LOG_FLUSH_INTERVAL: float = Field(
+        0.5, description="Write buffered agent output to the log at least this often, seconds"
+    )
+    LOG_ROTATE_SIZE: int = Field(
+        64 * 1024 * 1024, description="Rotate a bot log once it grows past this much bytes, 0 disables it"
+    )
+    LOG_ROTATE_AGE: int = Field(
+        7 * 24 * 60 * 60, description="Rotate a bot log on the next run if it wasn't written to for this long, seconds"
+    )
+    LOG_ROTATE_KEEP: int = Field(5, description="Keep this much compressed rotated segments of a bot log")
     MAX_WORKSPACE_FILE_SIZE: int = Field(
         5 * 1024 * 1024, description="Max size for a workspace file to upload, 5MiB by default"
     )
+    RESUMABLE_UPLOAD_TTL: int = Field(
+        24 * 60 * 60, description="Remove unfinished resumable uploads not appended to for this long, seconds"
+    )
+    WORKSPACE_ARCHIVE_CACHE_SIZE: int = Field(
+        1024 * 1024 * 1024, description="Disk budget for cached workspace zip downloads, 1GiB by default, 0 disables it"
+    )
+    WORKSPACE_PREVIEW_CACHE_SIZE: int = Field(
+        256 * 1024 * 1024, description="Disk budget for cached workspace image thumbnails, 256MiB by default"
+    )
+    FILESYSTEM_THREADS: int = Field(
+        16, description="Threads for blocking workspace filesystem calls of API requests, the rest wait in line"
+    )
+    WORKSPACE_QUOTA: int = Field(
+        0, description="Max total size of files in a workspace, uploads and new runs are refused past it, 0 disables it"
+    )
+    WORKSPACE_USAGE_RECONCILE_MINUTES: int = Field(
+        5,
+        ge=0,
+        description="Measure workspaces of running bots every this many minutes, stopping those over the quota. "
+        "Has to divide 60, 0 disables it",
+    )
+
+    @validator("WORKSPACE_USAGE_RECONCILE_MINUTES")
+    def validate_reconcile_minutes(cls, v: int) -> int:
+        if v and 60 % v:
+            raise ValueError("should divide 60 for the runs to be evenly spaced")
+        return v
+
     MAX_CACHE_SIZE: int = Field(
         5 * 1024 * 1024, description="Max size for a cache file before it gets truncates, 5MiB by default"
     )
+    AGENT_STATE_STORE: Literal["json", "sqlite"] = Field(
+        "json", description="Where agents keep message history, sub-agents and budget, JSON files or a SQLite database"
+    )
+    MEMORY_INDEX: str = Field("auto-gpt", description="Name agent cache files are prefixed with", auto_gpt=True)
+    EMBEDDING_CACHE_SIZE: int = Field(
+        1024 * 1024 * 1024, description="Disk budget for embeddings cached for all bots, 1GiB by default, 0 disables it"
+    )
+    AGENT_MEMORY_BACKEND: str = Field(
+        "", description="Vector memory of agents, `memmap` keeps it in the workspace across runs, the default clears it"
+    )
 
     OPENAI_LOCAL_KEY: str = Field("", description="Used only if Auth is disabled")
 
@@ -1,9 +1,12 @@
 from arq.connections import ArqRedis
 
 from app.core import settings
+from app.helpers.filesystem import FilesystemPool
 
 __all__ = [
     "arq_redis",
+    "filesystem",
 ]
 
 arq_redis = ArqRedis.from_url(settings.REDIS_URL)
+filesystem = FilesystemPool(settings.FILESYSTEM_THREADS)
@@ -0,0 +1,322 @@
+import contextlib
+import io
+import os
+import queue
+import shutil
+import stat
+import struct
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import IO, AsyncIterator, Container, Optional, Union
+from zipfile import ZIP_DEFLATED, ZIP_STORED, BadZipFile, ZipFile, ZipInfo, sizeFileHeader, stringFileHeader
+
+import anyio
+import orjson
+
+from app.helpers.system import evict_least_recently_used
+from app.helpers.workspace import WorkspaceEntry, scan_directory
+
+CHUNK_SIZE = 64 * 1024
+QUEUE_SIZE = 16
+MAX_DEPTH = 256
+MIN_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+# Deflating these again only burns CPU
+STORED_SUFFIXES = frozenset(
+    {
+        ".7z",
+        ".avi",
+        ".bz2",
+        ".docx",
+        ".gif",
+        ".gz",
+        ".jpeg",
+        ".jpg",
+        ".mkv",
+        ".mov",
+        ".mp3",
+        ".mp4",
+        ".ogg",
+        ".png",
+        ".pptx",
+        ".rar",
+        ".tgz",
+        ".webm",
+        ".webp",
+        ".woff2",
+        ".xlsx",
+        ".xz",
+        ".zip",
+        ".zst",
+    }
+)
+
+
+class ArchiveAborted(Exception):
+    pass
+
+
+class QueueSink(io.RawIOBase):
+    """Unseekable file that hands what's written to it to a bounded queue in `chunk_size` pieces
+
+    Writes block while the queue is full, so the producer never runs ahead of the consumer by more than the queue
+    size. Once `stop` is set writes raise `ArchiveAborted`. Everything written is also copied to `copy_to` if it's set.
+    """
+
+    def __init__(
+        self,
+        chunks: queue.Queue,
+        stop: threading.Event,
+        chunk_size: int = CHUNK_SIZE,
+        copy_to: Optional[IO[bytes]] = None,
+    ):
+        super().__init__()
+        self.chunks = chunks
+        self.stop = stop
+        self.chunk_size = chunk_size
+        self.copy_to = copy_to
+        self._buffer = bytearray()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        if self.copy_to:
+            self.copy_to.write(b)
+        self._buffer += b
+        while len(self._buffer) >= self.chunk_size:
+            self.put(bytes(self._buffer[: self.chunk_size]))
+            del self._buffer[: self.chunk_size]
+        return len(b)
+
+    def put(self, item) -> None:
+        while True:
+            if self.stop.is_set():
+                raise ArchiveAborted()
+            try:
+                self.chunks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def finish(self) -> None:
+        if self._buffer:
+            self.put(bytes(self._buffer))
+            self._buffer.clear()
+
+
+def build_zip_info(path: Union[str, Path], arcname: str, st: os.stat_result) -> ZipInfo:
+    zip_info = ZipInfo(arcname, date_time=max(time.localtime(st.st_mtime)[:6], MIN_DATE_TIME))
+    zip_info.file_size = st.st_size
+    zip_info.external_attr = (st.st_mode & 0xFFFF) << 16
+    zip_info.compress_type = ZIP_STORED if Path(path).suffix.lower() in STORED_SUFFIXES else ZIP_DEFLATED
+    return zip_info
+
+
+def scan_files(root: Union[str, Path], exclude: Container[str] = ()) -> list[WorkspaceEntry]:
+    """Every regular file under `root`"""
+    return [entry for entry in scan_directory(root, root, exclude, depth=MAX_DEPTH) if stat.S_ISREG(entry.st.st_mode)]
+
+
+def build_manifest(entries: list[WorkspaceEntry]) -> dict[str, list[int]]:
+    return {entry.path: [entry.st.st_size, entry.st.st_mtime_ns] for entry in entries}
+
+
+def copy_member(zip_file: ZipFile, source: ZipFile, info: ZipInfo) -> None:
+    """Append a member of another archive to `zip_file` as is, without decompressing and compressing it again
+
+    The local header is written anew with the sizes and CRC from the central directory of `source`, so the copy
+    doesn't need the data descriptor the member might have had. `ZipFile` has no public API for adding already
+    compressed data, so its member list is updated by hand, the same way `ZipFile.open` does it.
+    """
+    source.fp.seek(info.header_offset)
+    header = source.fp.read(sizeFileHeader)
+    if len(header) != sizeFileHeader or header[:4] != stringFileHeader:
+        raise BadZipFile(f"Bad local header of {info.filename}")
+    name_length, extra_length = struct.unpack("<HH", header[26:30])
+    source.fp.seek(info.header_offset + sizeFileHeader + name_length + extra_length)
+    copy = ZipInfo(info.filename, info.date_time)
+    copy.compress_type = info.compress_type
+    copy.CRC = info.CRC
+    copy.compress_size = info.compress_size
+    copy.file_size = info.file_size
+    copy.external_attr = info.external_attr
+    copy.create_system = info.create_system
+    copy.flag_bits = info.flag_bits & ~0x08
+    copy.header_offset = zip_file.fp.tell()
+    zip_file.fp.write(copy.FileHeader())
+    remaining = info.compress_size
+    while remaining:
+        data = source.fp.read(min(remaining, CHUNK_SIZE))
+        if not data:
+            raise BadZipFile(f"Truncated data of {info.filename}")
+        zip_file.fp.write(data)
+        remaining -= len(data)
+    zip_file.filelist.append(copy)
+    zip_file.NameToInfo[copy.filename] = copy
+    zip_file.start_dir = zip_file.fp.tell()
+    zip_file._didModify = True
+
+
+def write_zip(
+    root: Union[str, Path],
+    entries: list[WorkspaceEntry],
+    sink: io.RawIOBase,
+    previous: Optional[tuple[ZipFile, dict[str, list[int]]]] = None,
+) -> None:
+    """Zip `entries` of `root` into `sink`, files that vanish meanwhile are skipped
+
+    Members of the `previous` archive whose size and mtime in its manifest match the file are copied from it as is.
+    """
+    with ZipFile(sink, "w", compression=ZIP_DEFLATED, allowZip64=True) as zip_file:
+        for entry in entries:
+            if previous:
+                source, manifest = previous
+                info = source.NameToInfo.get(entry.path)
+                if info and manifest.get(entry.path) == [entry.st.st_size, entry.st.st_mtime_ns]:
+                    copy_member(zip_file, source, info)
+                    continue
+            path = os.path.join(root, entry.path)
+            try:
+                src = open(path, "rb")
+            except OSError:
+                continue
+            with src, zip_file.open(build_zip_info(path, entry.path, entry.st), "w") as dest:
+                shutil.copyfileobj(src, dest, CHUNK_SIZE)
+
+
+class ArchiveCache:
+    """The last archive built for every key, e.g. per user, evicted least recently used first past `max_size` bytes
+
+    Every archive gets a unique name and the manifest of a key (`<key>.json`) points at it together with the scope
+    (which directory was archived) and the size and mtime of every member. Replacing the manifest switches to a new
+    archive atomically, so concurrent builds in several processes never pair a manifest with a wrong archive.
+    """
+
+    def __init__(self, path: Union[str, Path], max_size: int):
+        self.path = Path(path)
+        self.max_size = max_size
+
+    def build_manifest_path(self, key: str) -> Path:
+        return self.path / f"{key}.json"
+
+    def read_manifest(self, key: str) -> Optional[dict]:
+        try:
+            return orjson.loads(self.build_manifest_path(key).read_bytes())
+        except (FileNotFoundError, orjson.JSONDecodeError):
+            return None
+
+    def load(self, key: str, scope: str) -> Optional[tuple[Path, dict[str, list[int]]]]:
+        """Archive of a key and its members, None if there is no archive of this scope"""
+        manifest = self.read_manifest(key)
+        if not manifest or manifest.get("scope") != scope:
+            return None
+        archive_path = self.path / manifest["archive"]
+        if not archive_path.is_file():
+            return None
+        return archive_path, manifest["files"]
+
+    def lookup(self, key: str, scope: str, entries: list[WorkspaceEntry]) -> Optional[tuple[IO[bytes], os.stat_result]]:
+        """Archive of a key, open, and its stat if it holds exactly `entries` as they are now
+
+        It's open already so that another build replacing it or an eviction can't take it away while it's sent, the
+        caller closes it.
+        """
+        cached = self.load(key, scope)
+        if cached is None or cached[1] != build_manifest(entries):
+            return None
+        try:
+            f = cached[0].open("rb")
+        except FileNotFoundError:
+            return None
+        # Its mtime is the last use for eviction
+        os.utime(f.fileno())
+        return f, os.fstat(f.fileno())
+
+    def open_previous(self, key: str, scope: str) -> Optional[tuple[ZipFile, dict[str, list[int]]]]:
+        cached = self.load(key, scope)
+        if cached is None:
+            return None
+        try:
+            return ZipFile(cached[0]), cached[1]
+        except (OSError, BadZipFile):
+            return None
+
+    def create_temp(self, key: str) -> Path:
+        self.path.mkdir(parents=True, exist_ok=True)
+        return self.path / f".{key}.{uuid.uuid4().hex}.zip"
+
+    def commit(self, key: str, scope: str, temp_path: Path, entries: list[WorkspaceEntry]) -> Path:
+        archive_path = self.path / f"{key}.{uuid.uuid4().hex}.zip"
+        os.replace(temp_path, archive_path)
+        previous = self.read_manifest(key)
+        manifest_path = self.build_manifest_path(key)
+        temp_manifest_path = self.path / f".{manifest_path.name}.{uuid.uuid4().hex}"
+        temp_manifest_path.write_bytes(
+            orjson.dumps({"archive": archive_path.name, "scope": scope, "files": build_manifest(entries)})
+        )
+        os.replace(temp_manifest_path, manifest_path)
+        if previous:
+            (self.path / previous["archive"]).unlink(missing_ok=True)
+        self.evict()
+        return archive_path
+
+    def evict(self) -> None:
+        evict_least_recently_used(self.path, "*.zip", self.max_size)
+
+
+async def iter_zip(
+    root: Union[str, Path],
+    exclude: Container[str] = (),
+    entries: Optional[list[WorkspaceEntry]] = None,
+    cache: Optional[ArchiveCache] = None,
+    key: str = "",
+    scope: str = "",
+) -> AsyncIterator[bytes]:
+    """Stream a zip of `root` as it's being built in a separate thread, in bounded memory
+
+    With a `cache` the archive is also written there under `key` while it's streamed, reusing members of the previous
+    archive of `key` that didn't change. Nothing else touches the disk besides reading the files. If the consumer goes
+    away, the thread stops at its next write and the half-built archive is dropped.
+    """
+    chunks: queue.Queue = queue.Queue(maxsize=QUEUE_SIZE)
+    stop = threading.Event()
+
+    def produce() -> None:
+        temp_path = cache.create_temp(key) if cache else None
+        previous = cache.open_previous(key, scope) if cache else None
+        try:
+            with open(temp_path, "wb") if temp_path else contextlib.nullcontext() as copy_to:
+                sink = QueueSink(chunks, stop, copy_to=copy_to)
+                files = scan_files(root, exclude) if entries is None else entries
+                write_zip(root, files, sink, previous)
+            if cache:
+                cache.commit(key, scope, temp_path, files)
+            sink.finish()
+            sink.put(None)
+        except ArchiveAborted:
+            pass
+        except Exception as e:
+            try:
+                QueueSink(chunks, stop).put(e)
+            except ArchiveAborted:
+                pass
+        finally:
+            if previous:
+                previous[0].close()
+            if temp_path:
+                temp_path.unlink(missing_ok=True)
+
+    thread = threading.Thread(target=produce, name="zip-producer", daemon=True)
+    thread.start()
+    try:
+        while True:
+            chunk = await anyio.to_thread.run_sync(chunks.get)
+            if chunk is None:
+                break
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield chunk
+    finally:
+        stop.set()
@@ -0,0 +1,83 @@
+import gzip
+import os
+import zlib
+from array import array
+from pathlib import Path
+from typing import IO, Optional, Union
+
+CHECKPOINTS_VERSION = 1
+HEADER_ITEMS = 3
+CHECKPOINT_INTERVAL = 1024 * 1024
+READ_SIZE = 64 * 1024
+
+
+def build_checkpoints_path(path: Union[str, Path]) -> Path:
+    path = Path(path)
+    return path.with_name(f"{path.name}.ckpt")
+
+
+def compress_log(
+    src: Union[str, Path],
+    dst: Union[str, Path],
+    interval: int = CHECKPOINT_INTERVAL,
+    compresslevel: int = 9,
+) -> None:
+    """Gzip `src` into `dst` with a full flush every `interval` uncompressed bytes and record where they are
+
+    After a full flush the deflate stream doesn't refer to anything before it, so decompression can start right there
+    without reading the file from the beginning. The flush points go to a `<dst>.ckpt` sidecar: format version,
+    compressed size, uncompressed size, followed by uncompressed and compressed offset pairs. The result is a regular
+    gzip file, the sidecar is only a shortcut for `tail`. Both files are replaced atomically.
+    """
+    dst = Path(dst)
+    temp_path = dst.with_name(f".{dst.name}.{os.getpid()}")
+    points = array("Q")
+    with open(src, "rb") as r, temp_path.open("wb") as raw:
+        with gzip.GzipFile(filename="", mode="wb", fileobj=raw, compresslevel=compresslevel) as w:
+            position = 0
+            while chunk := r.read(interval):
+                # The header is written on open and every chunk ends with a full flush, so this is a flush point
+                points.extend((position, raw.tell()))
+                w.write(chunk)
+                w.flush(zlib.Z_FULL_FLUSH)
+                position += len(chunk)
+        header = array("Q", [CHECKPOINTS_VERSION, raw.tell(), position])
+    checkpoints_path = build_checkpoints_path(dst)
+    temp_checkpoints_path = checkpoints_path.with_name(f".{checkpoints_path.name}.{os.getpid()}")
+    with temp_checkpoints_path.open("wb") as f:
+        header.tofile(f)
+        points.tofile(f)
+    # The sidecar goes first, a fresh gzip file never pairs with checkpoints of the old one, see `read_checkpoints`
+    os.replace(temp_checkpoints_path, checkpoints_path)
+    os.replace(temp_path, dst)
+
+
+def read_checkpoints(path: Union[str, Path]) -> Optional[tuple[int, list[tuple[int, int]]]]:
+    """Uncompressed size and flush points of a gzip file written by `compress_log`, None if they are missing or stale"""
+    try:
+        with build_checkpoints_path(path).open("rb") as f:
+            data = array("Q")
+            data.frombytes(f.read())
+        size = os.stat(path).st_size
+    except (FileNotFoundError, ValueError):
+        return None
+    if len(data) < HEADER_ITEMS + 2 or len(data) % 2 != 1 or data[0] != CHECKPOINTS_VERSION or data[1] != size:
+        return None
+    points = data[HEADER_ITEMS:]
+    return data[2], list(zip(points[::2], points[1::2]))
+
+
+def inflate(f: IO[bytes], offset: int, size: int) -> bytes:
+    """Decompress up to `size` bytes of the deflate stream of a gzip file starting from a flush point at `offset`"""
+    f.seek(offset)
+    decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+    chunks = []
+    remaining = size
+    while remaining > 0 and not decompressor.eof:
+        chunk = decompressor.unconsumed_tail or f.read(READ_SIZE)
+        if not chunk:
+            break
+        data = decompressor.decompress(chunk, remaining)
+        chunks.append(data)
+        remaining -= len(data)
+    return b"".join(chunks)
@@ -0,0 +1,177 @@
+import hashlib
+import os
+import sqlite3
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, Optional, Sequence, Union
+
+import numpy as np
+
+DTYPE = np.dtype("<f4")
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS segments (id INTEGER PRIMARY KEY AUTOINCREMENT, size INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS entries (
+    key BLOB PRIMARY KEY,
+    segment INTEGER NOT NULL,
+    offset INTEGER NOT NULL,
+    dim INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_segment ON entries (segment);
+"""
+
+
+def build_key(model: str, text: str) -> bytes:
+    return hashlib.blake2b(f"{model}\0{text}".encode(), digest_size=16).digest()
+
+
+class EmbeddingCache:
+    """Embeddings by a hash of the model and the text, shared by every process on the host that opens `path`
+
+    Vectors are packed little-endian float32 appended to segment files, an SQLite index in WAL mode maps a key to
+    its segment and offset. Writers take turns on the index, readers never wait. Once the segments take more than
+    `max_size` bytes the oldest ones are removed whole. Hits in the older half of the segments are appended again,
+    to the newest one, so whatever is still in use survives and the eviction is least recently used, roughly.
+
+    `hits` and `misses` count the lookups made through this instance.
+    """
+
+    def __init__(
+        self, path: Union[str, Path], max_size: int, segment_size: Optional[int] = None, timeout: float = 30.0
+    ):
+        self.path = Path(path)
+        self.max_size = max_size
+        # Removing a segment frees at most this much, small enough for the cache to stay close to the budget
+        self.segment_size = segment_size or max(max_size // 16, 1024 * 1024)
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self._connection: Optional[sqlite3.Connection] = None
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        if self._connection is None:
+            self.path.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(
+                self.path / "index.sqlite3", timeout=self.timeout, isolation_level=None, check_same_thread=False
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(SCHEMA)
+            self._connection = connection
+        return self._connection
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        connection = self.connection
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    def build_segment_path(self, segment: int) -> Path:
+        return self.path / f"{segment:08d}.seg"
+
+    def _read(self, segment: int, offset: int, dim: int) -> Optional[np.ndarray]:
+        try:
+            fd = os.open(self.build_segment_path(segment), os.O_RDONLY)
+        except FileNotFoundError:
+            # Evicted between the lookup and the read
+            return None
+        try:
+            data = os.pread(fd, dim * DTYPE.itemsize, offset)
+        finally:
+            os.close(fd)
+        if len(data) != dim * DTYPE.itemsize:
+            return None
+        return np.frombuffer(data, dtype=DTYPE).astype(np.float32)
+
+    def get_many(self, keys: Sequence[bytes]) -> list[Optional[np.ndarray]]:
+        """Cached vectors of `keys` in order, None for a miss"""
+        results: list[Optional[np.ndarray]] = [None] * len(keys)
+        positions = {}
+        # Under the limit of SQLite variables of old versions
+        for i in range(0, len(keys), 500):
+            batch = keys[i : i + 500]
+            query = f"SELECT key, segment, offset, dim FROM entries WHERE key IN ({', '.join('?' * len(batch))})"
+            for key, segment, offset, dim in self.connection.execute(query, batch):
+                positions[key] = (segment, offset, dim)
+        segments = [row[0] for row in self.connection.execute("SELECT id FROM segments ORDER BY id")]
+        # Segments ids grow, the older half ends with this one
+        old_segment = segments[(len(segments) - 1) // 2] if len(segments) > 1 else None
+        promoted = []
+        for i, key in enumerate(keys):
+            position = positions.get(key)
+            if position is not None:
+                results[i] = self._read(*position)
+            if results[i] is None:
+                self.misses += 1
+                continue
+            self.hits += 1
+            if old_segment is not None and position[0] <= old_segment:
+                promoted.append((key, results[i]))
+        if promoted:
+            self.put_many(promoted)
+        return results
+
+    def put_many(self, items: Iterable[tuple[bytes, np.ndarray]]) -> None:
+        records = [(key, np.ascontiguousarray(vector, dtype=DTYPE).tobytes(), len(vector)) for key, vector in items]
+        if not records:
+            return
+        with self.transaction() as connection:
+            row = connection.execute("SELECT id, size FROM segments ORDER BY id DESC LIMIT 1").fetchone()
+            if row is None or row[1] >= self.segment_size:
+                # Ids are never reused, a file left behind by a crash can't get mixed up with a new segment
+                segment = connection.execute("INSERT INTO segments (size) VALUES (0)").lastrowid
+            else:
+                segment = row[0]
+            with self.build_segment_path(segment).open("ab") as f:
+                # The end of the file, not the recorded size, a crashed writer may have left bytes past it
+                offset = f.seek(0, os.SEEK_END)
+                entries = []
+                for key, data, dim in records:
+                    f.write(data)
+                    entries.append((key, segment, offset, dim))
+                    offset += len(data)
+            connection.executemany(
+                "INSERT OR REPLACE INTO entries (key, segment, offset, dim) VALUES (?, ?, ?, ?)", entries
+            )
+            connection.execute("UPDATE segments SET size = ? WHERE id = ?", (offset, segment))
+        self.evict()
+
+    def get_or_compute(
+        self, model: str, texts: Sequence[str], compute: Callable[[list[str]], Sequence[np.ndarray]]
+    ) -> list[np.ndarray]:
+        """Embeddings of `texts` by `model`, the missing ones computed by a single `compute` call and cached"""
+        keys = [build_key(model, text) for text in texts]
+        vectors = self.get_many(keys)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            computed = compute([texts[i] for i in missing])
+            for i, vector in zip(missing, computed):
+                vectors[i] = np.asarray(vector, dtype=np.float32)
+            self.put_many((keys[i], vectors[i]) for i in missing)
+        return vectors
+
+    def get_size(self) -> int:
+        return self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM segments").fetchone()[0]
+
+    def evict(self) -> None:
+        """Remove the oldest segments while the cache is over `max_size`, the newest one stays whatever its size"""
+        while True:
+            with self.transaction() as connection:
+                segments = connection.execute("SELECT id, size FROM segments ORDER BY id").fetchall()
+                if len(segments) < 2 or sum(size for _, size in segments) <= self.max_size:
+                    return
+                segment = segments[0][0]
+                connection.execute("DELETE FROM entries WHERE segment = ?", (segment,))
+                connection.execute("DELETE FROM segments WHERE id = ?", (segment,))
+            # Nothing refers to it anymore, readers that looked it up before get a miss
+            self.build_segment_path(segment).unlink(missing_ok=True)
+
+    def close(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
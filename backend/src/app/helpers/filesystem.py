@@ -0,0 +1,101 @@
+import shutil
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Optional, TypeVar, Union
+
+import anyio
+
+T = TypeVar("T")
+
+
+def remove_path(path: Union[str, Path]) -> None:
+    """Remove a file or a whole directory tree, whatever is there, if anything"""
+    path = Path(path)
+    if path.is_dir() and not path.is_symlink():
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        path.unlink(missing_ok=True)
+
+
+@dataclass
+class OperationStats:
+    count: int = 0
+    errors: int = 0
+    wait_seconds: float = 0.0
+    max_wait_seconds: float = 0.0
+    run_seconds: float = 0.0
+    max_run_seconds: float = 0.0
+
+    def add(self, wait_seconds: float, run_seconds: float, is_failed: bool) -> None:
+        self.count += 1
+        self.errors += is_failed
+        self.wait_seconds += wait_seconds
+        self.max_wait_seconds = max(self.max_wait_seconds, wait_seconds)
+        self.run_seconds += run_seconds
+        self.max_run_seconds = max(self.max_run_seconds, run_seconds)
+
+    def to_dict(self) -> dict[str, Any]:
+        count = self.count or 1
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "avg_wait_ms": self.wait_seconds / count * 1000,
+            "max_wait_ms": self.max_wait_seconds * 1000,
+            "avg_run_ms": self.run_seconds / count * 1000,
+            "max_run_ms": self.max_run_seconds * 1000,
+        }
+
+
+class FilesystemPool:
+    """Runs blocking filesystem calls on at most `threads` threads, so the event loop never waits on the disk
+
+    A slow call, like removing a huge tree, holds a single thread while the rest keep serving other requests. Calls
+    over the limit wait in line. How many are waiting and how long calls wait and run, per operation, is in
+    `statistics`.
+    """
+
+    def __init__(self, threads: int):
+        self.threads = threads
+        self.operations: dict[str, OperationStats] = defaultdict(OperationStats)
+        self._limiter: Optional[anyio.CapacityLimiter] = None
+
+    @property
+    def limiter(self) -> anyio.CapacityLimiter:
+        # Created on first use, it has to belong to the running event loop
+        if self._limiter is None:
+            self._limiter = anyio.CapacityLimiter(self.threads)
+        return self._limiter
+
+    async def run(self, func: Callable[..., T], *args: Any, name: Optional[str] = None) -> T:
+        """`func(*args)` on a pool thread, accounted as `name` or the qualified name of `func`"""
+        stats = self.operations[name or getattr(func, "__qualname__", type(func).__name__)]
+        queued_at = time.perf_counter()
+        started_at: Optional[float] = None
+
+        def call() -> T:
+            nonlocal started_at
+            started_at = time.perf_counter()
+            return func(*args)
+
+        is_failed = True
+        try:
+            result = await anyio.to_thread.run_sync(call, limiter=self.limiter)
+            is_failed = False
+            return result
+        finally:
+            finished_at = time.perf_counter()
+            if started_at is None:
+                stats.add(finished_at - queued_at, 0.0, is_failed)
+            else:
+                stats.add(started_at - queued_at, finished_at - started_at, is_failed)
+
+    def statistics(self) -> dict[str, Any]:
+        limiter = self.limiter.statistics()
+        return {
+            "threads": self.threads,
+            "running": limiter.borrowed_tokens,
+            "waiting": limiter.tasks_waiting,
+            "operations": {name: stats.to_dict() for name, stats in sorted(self.operations.items())},
+        }
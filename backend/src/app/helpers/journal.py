@@ -0,0 +1,146 @@
+import os
+import uuid
+from pathlib import Path
+from typing import IO, Any, Iterable, Optional, Union
+
+import orjson
+
+DUMP_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_SERIALIZE_DATACLASS | orjson.OPT_NON_STR_KEYS
+# Below this much dead weight compaction isn't worth a rewrite whatever the ratio
+COMPACT_MIN_BYTES = 256 * 1024
+
+
+def dump_record(record: Any) -> bytes:
+    return orjson.dumps(record, option=DUMP_OPTIONS) + b"\n"
+
+
+class HistoryJournal:
+    """Message history as an append-only JSONL file, so adding a message costs a single small write
+
+    Every line is either `{"message": ...}` or `{"state": ...}`, the latest state record supersedes earlier ones.
+    Superseded state records are dead weight, the file is rewritten without them (compacted) once they take up as
+    much as everything else and `COMPACT_MIN_BYTES` at least. A line torn by a crash is cut off on load.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self.live_bytes = 0
+        self.dead_bytes = 0
+        self.state: Optional[dict] = None
+        # Size of the record of every message, in order
+        self.message_sizes: list[int] = []
+        self._state_bytes = 0
+        self._file: Optional[IO[bytes]] = None
+
+    @property
+    def size(self) -> int:
+        return self.live_bytes + self.dead_bytes
+
+    @property
+    def needs_compaction(self) -> bool:
+        return self.dead_bytes >= COMPACT_MIN_BYTES and self.dead_bytes >= self.live_bytes
+
+    def load(self, repair: bool = True) -> tuple[list[dict], Optional[dict]]:
+        """Messages and the latest state in the journal, empty if there's no journal yet
+
+        Only the writer may `repair` it, to anyone else a torn tail is just a record still being written.
+        """
+        messages = []
+        self.live_bytes = self.dead_bytes = self._state_bytes = 0
+        self.state = None
+        self.message_sizes = []
+        try:
+            f = self.path.open("rb")
+        except FileNotFoundError:
+            return messages, None
+        with f:
+            offset = 0
+            for line in f:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("Torn record")
+                    record = orjson.loads(line)
+                except ValueError:
+                    break
+                offset += len(line)
+                if not isinstance(record, dict):
+                    self.dead_bytes += len(line)
+                elif "message" in record:
+                    messages.append(record["message"])
+                    self.message_sizes.append(len(line))
+                    self.live_bytes += len(line)
+                elif "state" in record:
+                    self._supersede_state(record["state"], len(line))
+                else:
+                    self.dead_bytes += len(line)
+        if repair and offset < self.path.stat().st_size:
+            # Whatever follows the last complete record was being written when the process died
+            os.truncate(self.path, offset)
+        return messages, self.state
+
+    def _supersede_state(self, state: dict, size: int) -> None:
+        self.live_bytes += size - self._state_bytes
+        self.dead_bytes += self._state_bytes
+        self.state = state
+        self._state_bytes = size
+
+    def _write(self, data: bytes) -> None:
+        if self._file is None:
+            self._file = self.path.open("ab")
+        self._file.write(data)
+        self._file.flush()
+
+    def append_message(self, message: Any) -> None:
+        data = dump_record({"message": message})
+        self._write(data)
+        self.message_sizes.append(len(data))
+        self.live_bytes += len(data)
+
+    def write_state(self, state: dict) -> None:
+        """Append `state` unless it's the latest state already"""
+        if state == self.state:
+            return
+        data = dump_record({"state": state})
+        self._write(data)
+        self._supersede_state(state, len(data))
+
+    def plan_truncation(self, max_size: int) -> int:
+        """How many of the oldest messages to drop for the compacted journal to take less than `max_size` bytes
+
+        The sizes of the records are known, so the cut point is found in one pass without serializing anything.
+        """
+        size = self.live_bytes
+        count = 0
+        for message_size in self.message_sizes:
+            if size < max_size:
+                break
+            size -= message_size
+            count += 1
+        return count
+
+    def rewrite(self, messages: Iterable[Any], state: dict) -> None:
+        """Replace the journal with `messages` and `state` only, atomically"""
+        self.close()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = self.path.with_name(f".{self.path.name}.{uuid.uuid4().hex}")
+        self.live_bytes = self.dead_bytes = self._state_bytes = 0
+        self.state = None
+        self.message_sizes = []
+        try:
+            with temp_path.open("wb") as f:
+                for message in messages:
+                    data = dump_record({"message": message})
+                    f.write(data)
+                    self.message_sizes.append(len(data))
+                    self.live_bytes += len(data)
+                data = dump_record({"state": state})
+                f.write(data)
+                self._supersede_state(state, len(data))
+            os.replace(temp_path, self.path)
+        finally:
+            temp_path.unlink(missing_ok=True)
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
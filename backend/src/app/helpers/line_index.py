@@ -0,0 +1,176 @@
+import os
+import time
+import uuid
+from array import array
+from contextlib import nullcontext
+from pathlib import Path
+from typing import IO, Optional, Union
+
+INDEX_VERSION = 1
+HEADER_ITEMS = 4
+ITEM_SIZE = array("Q").itemsize
+HEADER_SIZE = HEADER_ITEMS * ITEM_SIZE
+SCAN_CHUNK_SIZE = 1024 * 1024
+
+
+def build_index_path(path: Union[str, Path]) -> Path:
+    path = Path(path)
+    return path.with_name(f"{path.name}.idx")
+
+
+def scan_line_ends(f: IO[bytes], start: int, stop: int) -> array:
+    """Offsets right after every newline between `start` and `stop`"""
+    ends = array("Q")
+    f.seek(start)
+    position = start
+    while position < stop:
+        chunk = f.read(min(SCAN_CHUNK_SIZE, stop - position))
+        if not chunk:
+            break
+        end = position
+        for piece in chunk.split(b"\n")[:-1]:
+            end += len(piece) + 1
+            ends.append(end)
+        position += len(chunk)
+    return ends
+
+
+class LineIndex:
+    """Sidecar index of line offsets of a log file, for reading any page of lines with a couple of seeks
+
+    The sidecar (`<log>.idx`) is an array of unsigned 64-bit integers: format version, inode of the log, size of the
+    indexed part of the log and the number of indexed lines, followed by the end offset of every complete line.
+    Lines are separated by `\\n` only. Lines appended after the last flush are kept in memory in `pending`.
+    """
+
+    def __init__(self, log_path: Union[str, Path]):
+        self.log_path = Path(log_path)
+        self.path = build_index_path(self.log_path)
+        self.inode = 0
+        self.size = 0
+        self.count = 0
+        self.pending = array("Q")
+        self.flushed_at = 0.0
+
+    @classmethod
+    def open(cls, log_path: Union[str, Path], read_only: bool = False) -> "LineIndex":
+        """Load the index and bring it up to date with the log, rebuilding it if it's missing or stale
+
+        A `read_only` index never writes the sidecar, a missing or stale one is replaced by a scan of the log in memory.
+        Only the writer of the log should write its index.
+        """
+        index = cls(log_path)
+        st = os.stat(index.log_path)
+        header = index.read_header()
+        if header is None or header[1] != st.st_ino or header[2] > st.st_size:
+            if read_only:
+                index.scan()
+            else:
+                index.rebuild()
+        else:
+            _, index.inode, index.size, index.count = header
+            index.catch_up()
+        return index
+
+    def read_header(self) -> Optional[tuple[int, ...]]:
+        try:
+            with self.path.open("rb") as f:
+                header = array("Q")
+                header.frombytes(f.read(HEADER_SIZE))
+        except (FileNotFoundError, ValueError):
+            return None
+        if len(header) != HEADER_ITEMS or header[0] != INDEX_VERSION:
+            return None
+        return tuple(header)
+
+    def build_header(self) -> bytes:
+        return array("Q", [INDEX_VERSION, self.inode, self.size, self.count]).tobytes()
+
+    def scan(self) -> None:
+        """Index the whole log in memory, nothing in the sidecar is used"""
+        with self.log_path.open("rb") as f:
+            st = os.fstat(f.fileno())
+            self.pending = scan_line_ends(f, 0, st.st_size)
+        self.inode, self.size, self.count = st.st_ino, st.st_size, 0
+
+    def rebuild(self) -> None:
+        with self.log_path.open("rb") as f:
+            st = os.fstat(f.fileno())
+            ends = scan_line_ends(f, 0, st.st_size)
+        self.inode, self.size, self.count = st.st_ino, st.st_size, len(ends)
+        self.pending = array("Q")
+        temp_path = self.path.with_name(f".{self.path.name}.{uuid.uuid4().hex}")
+        try:
+            with temp_path.open("wb") as f:
+                f.write(self.build_header())
+                ends.tofile(f)
+            os.replace(temp_path, self.path)
+        finally:
+            temp_path.unlink(missing_ok=True)
+        self.flushed_at = time.monotonic()
+
+    def catch_up(self) -> None:
+        """Index lines appended to the log since the index was last updated"""
+        with self.log_path.open("rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size > self.size:
+                self.pending.extend(scan_line_ends(f, self.size, size))
+                self.size = size
+
+    def append(self, start: int, data: bytes) -> None:
+        """Index `data` just written to the log at `start` offset"""
+        if start != self.size:
+            self.catch_up()
+            return
+        end = start
+        for piece in data.split(b"\n")[:-1]:
+            end += len(piece) + 1
+            self.pending.append(end)
+        self.size = start + len(data)
+
+    def flush(self) -> None:
+        header = self.read_header()
+        if header is None or header[1] != self.inode or header[3] != self.count:
+            # Someone removed or rebuilt the sidecar under us, start over from the log itself
+            self.rebuild()
+            return
+        with self.path.open("r+b") as f:
+            f.seek(HEADER_SIZE + self.count * ITEM_SIZE)
+            self.pending.tofile(f)
+            self.count += len(self.pending)
+            self.pending = array("Q")
+            # Header goes last, so readers never see offsets that aren't written yet
+            f.seek(0)
+            f.write(self.build_header())
+        self.flushed_at = time.monotonic()
+
+    @property
+    def total_lines(self) -> int:
+        lines = self.count + len(self.pending)
+        if self.size > self.line_start(lines):
+            # Trailing line without a newline yet
+            lines += 1
+        return lines
+
+    def line_start(self, line: int, f: Optional[IO[bytes]] = None) -> int:
+        if line <= 0:
+            return 0
+        if line > self.count:
+            return self.pending[line - self.count - 1]
+        if f is None:
+            with self.path.open("rb") as f:
+                return self.line_start(line, f)
+        f.seek(HEADER_SIZE + (line - 1) * ITEM_SIZE)
+        return array("Q", f.read(ITEM_SIZE))[0]
+
+    def read_lines(self, from_line: int, limit: int) -> str:
+        """Text of `limit` lines starting from `from_line`, zero based"""
+        indexed_lines = self.count + len(self.pending)
+        from_line = min(from_line, indexed_lines)
+        # Nothing to read from the sidecar when it's all in memory
+        with self.path.open("rb") if self.count else nullcontext() as f:
+            start = self.line_start(from_line, f)
+            stop = self.line_start(from_line + limit, f) if from_line + limit <= indexed_lines else self.size
+        with self.log_path.open("rb") as f:
+            f.seek(start)
+            return f.read(stop - start).decode(errors="replace")
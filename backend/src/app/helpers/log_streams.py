@@ -0,0 +1,59 @@
+from typing import AsyncGenerator
+
+import orjson
+from loguru import logger
+from redis.asyncio import Redis
+
+
+LOG_STREAM_FIELD = b"line"
+KEEP_ALIVE_MS = 15 * 1000
+
+
+def build_log_stream_key(bot_id: int) -> str:
+    return f"bot:{bot_id}:log"
+
+
+async def publish_log_lines(redis: Redis, bot_id: int, lines: list[bytes], maxlen: int, ttl: int) -> None:
+    """Append lines to the bot log stream, keeping roughly the last `maxlen` of them"""
+    key = build_log_stream_key(bot_id)
+    try:
+        async with redis.pipeline(transaction=False) as pipe:
+            for line in lines:
+                pipe.xadd(key, {LOG_STREAM_FIELD: line}, maxlen=maxlen, approximate=True)
+            pipe.expire(key, ttl)
+            await pipe.execute()
+    except Exception as e:
+        # The log file is the source of truth, streaming is best effort
+        logger.warning(f"An error occurred while publishing log of bot {bot_id}: {e}")
+
+
+async def read_log_stream(
+    redis: Redis, bot_id: int, last_id: str = "0-0", block: int | None = None, count: int | None = None
+) -> list[tuple[str, str]]:
+    """Read log lines after `last_id`, waiting up to `block` milliseconds for new ones"""
+    response = await redis.xread({build_log_stream_key(bot_id): last_id}, count=count, block=block)
+    if not response:
+        return []
+    _, entries = response[0]
+    return [(_decode(entry_id), _decode(fields[LOG_STREAM_FIELD])) for entry_id, fields in entries]
+
+
+async def iter_log_events(
+    redis: Redis, bot_id: int, last_id: str = "0-0", block: int = KEEP_ALIVE_MS
+) -> AsyncGenerator[str, None]:
+    """Server-sent events with log lines, a comment is sent when nothing happened for `block` milliseconds"""
+    while True:
+        entries = await read_log_stream(redis, bot_id, last_id, block=block)
+        if not entries:
+            yield ": keep-alive\n\n"
+            continue
+        for last_id, line in entries:
+            yield f"id: {last_id}\ndata: {orjson.dumps(line).decode()}\n\n"
+
+
+async def delete_log_stream(redis: Redis, bot_id: int) -> None:
+    await redis.delete(build_log_stream_key(bot_id))
+
+
+def _decode(value: bytes | str) -> str:
+    return value.decode(errors="replace") if isinstance(value, bytes) else value
@@ -0,0 +1,120 @@
+import os
+import stat
+import threading
+from pathlib import Path
+from typing import Optional, Sequence, Union
+
+import anyio
+import magic
+import orjson
+
+MAX_ENTRIES = 100_000
+SNIFF_THREADS = 8
+SNIFF_BATCH_SIZE = 64
+
+_local = threading.local()
+_limiter: Optional[anyio.CapacityLimiter] = None
+
+
+def build_key(st: os.stat_result) -> str:
+    return f"{st.st_ino}:{st.st_mtime_ns}:{st.st_size}"
+
+
+def sniff(path: Union[str, Path]) -> Optional[str]:
+    """MIME type of a file by its contents, None if it can't be read
+
+    The module level `magic.from_file` serializes every call on a single libmagic handle, so each thread gets its own.
+    """
+    mime = getattr(_local, "magic", None)
+    if mime is None:
+        mime = _local.magic = magic.Magic(mime=True)
+    try:
+        return mime.from_file(str(path))
+    except (OSError, magic.MagicException):
+        return None
+
+
+def get_sniff_limiter() -> anyio.CapacityLimiter:
+    global _limiter
+    if _limiter is None:
+        _limiter = anyio.CapacityLimiter(SNIFF_THREADS)
+    return _limiter
+
+
+async def sniff_many(paths: Sequence[Union[str, Path]]) -> list[Optional[str]]:
+    """Sniff files in batches on up to `SNIFF_THREADS` threads"""
+    results: list[Optional[str]] = [None] * len(paths)
+    limiter = get_sniff_limiter()
+
+    def sniff_batch(start: int) -> None:
+        for i in range(start, min(start + SNIFF_BATCH_SIZE, len(paths))):
+            results[i] = sniff(paths[i])
+
+    async with anyio.create_task_group() as tg:
+        for start in range(0, len(paths), SNIFF_BATCH_SIZE):
+            tg.start_soon(lambda start=start: anyio.to_thread.run_sync(sniff_batch, start, limiter=limiter))
+    return results
+
+
+class MimeCache:
+    """Persistent MIME types of workspace files keyed by inode, mtime and size, so unchanged files are sniffed once
+
+    Renamed files keep their inode and stay cached, rewritten files change mtime or size and get sniffed again.
+    Stored as a JSON object in insertion order, the least recently used entries are dropped past `max_entries`.
+    """
+
+    def __init__(self, path: Union[str, Path], max_entries: int = MAX_ENTRIES):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.entries: dict[str, str] = {}
+        self.is_dirty = False
+
+    @classmethod
+    def load(cls, path: Union[str, Path], max_entries: int = MAX_ENTRIES) -> "MimeCache":
+        cache = cls(path, max_entries)
+        try:
+            entries = orjson.loads(cache.path.read_bytes())
+        except (FileNotFoundError, orjson.JSONDecodeError):
+            return cache
+        if isinstance(entries, dict):
+            cache.entries = entries
+        return cache
+
+    def get(self, st: os.stat_result) -> Optional[str]:
+        key = build_key(st)
+        mime_type = self.entries.pop(key, None)
+        if mime_type is not None:
+            # Only reordered in memory, a listing of cached files alone doesn't rewrite the cache
+            self.entries[key] = mime_type
+        return mime_type
+
+    def set(self, st: os.stat_result, mime_type: str) -> None:
+        self.entries[build_key(st)] = mime_type
+        self.is_dirty = True
+
+    def save(self) -> None:
+        if not self.is_dirty:
+            return
+        for key in list(self.entries)[: max(len(self.entries) - self.max_entries, 0)]:
+            del self.entries[key]
+        temp_path = self.path.with_name(f".{self.path.name}.{os.getpid()}.{threading.get_ident()}")
+        temp_path.write_bytes(orjson.dumps(self.entries))
+        os.replace(temp_path, self.path)
+        self.is_dirty = False
+
+    async def get_mime_types(self, files: Sequence[tuple[Path, os.stat_result]]) -> list[Optional[str]]:
+        """MIME types of files with their stat results, sniffing only those not in the cache, None for directories"""
+        mime_types: list[Optional[str]] = [None] * len(files)
+        missing = []
+        for i, (_, st) in enumerate(files):
+            if stat.S_ISDIR(st.st_mode):
+                continue
+            mime_types[i] = self.get(st)
+            if mime_types[i] is None:
+                missing.append(i)
+        if missing:
+            for i, mime_type in zip(missing, await sniff_many([files[i][0] for i in missing])):
+                mime_types[i] = mime_type
+                if mime_type is not None:
+                    self.set(files[i][1], mime_type)
+        return mime_types
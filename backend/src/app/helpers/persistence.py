@@ -0,0 +1,90 @@
+import atexit
+import os
+import threading
+import uuid
+import weakref
+from pathlib import Path
+from typing import Callable, Optional, Union
+
+# Writers with changes not yet on disk, flushed by `flush_all`
+_writers: "weakref.WeakSet[WriteBehind]" = weakref.WeakSet()
+
+
+def write_atomic(path: Union[str, Path], data: bytes) -> None:
+    """Replace the file with `data` through a temporary file, so a crash leaves either the old or the new content"""
+    path = Path(path)
+    temp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}")
+    try:
+        temp_path.write_bytes(data)
+        os.replace(temp_path, path)
+    finally:
+        temp_path.unlink(missing_ok=True)
+
+
+class WriteBehind:
+    """Coalesces changes to some state and writes it to `path` later, as a whole, in one atomic write
+
+    Changes are reported with `mark_dirty`, `dump` serializes the state at write time. The state is written
+    `interval` seconds after the first change since the last write, once `max_changes` changes pile up, or on
+    `flush_all`, which runs at interpreter exit. Whatever changed within the last `interval` seconds is lost if the
+    process is killed.
+    """
+
+    def __init__(
+        self, path: Union[str, Path], dump: Callable[[], bytes], interval: float = 5.0, max_changes: int = 100
+    ):
+        self.path = Path(path)
+        self.dump = dump
+        self.interval = interval
+        self.max_changes = max_changes
+        self.changes = 0
+        self.writes = 0
+        self._lock = threading.RLock()
+        self._timer: Optional[threading.Timer] = None
+
+    @property
+    def is_dirty(self) -> bool:
+        return self.changes > 0
+
+    def mark_dirty(self) -> None:
+        with self._lock:
+            self.changes += 1
+            if self.changes >= self.max_changes:
+                self.flush()
+                return
+            _writers.add(self)
+            if self._timer is None:
+                self._timer = threading.Timer(self.interval, self.flush)
+                # Must not keep the process alive, the exit flush takes care of the rest
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self, force: bool = False) -> None:
+        """Write the state if it changed since the last write, or anyway if `force`"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self.changes and not force:
+                return
+            # Stays dirty if the write fails, for the next flush to retry
+            write_atomic(self.path, self.dump())
+            self.changes = 0
+            self.writes += 1
+            _writers.discard(self)
+
+
+def flush_all() -> None:
+    """Write every pending change, a process that exits without running `atexit` handlers has to call it itself"""
+    error: Optional[Exception] = None
+    for writer in list(_writers):
+        # One failing write mustn't cost the others their changes
+        try:
+            writer.flush()
+        except Exception as e:
+            error = error or e
+    if error is not None:
+        raise error
+
+
+atexit.register(flush_all)
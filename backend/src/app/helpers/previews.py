@@ -0,0 +1,143 @@
+import codecs
+import hashlib
+import io
+import os
+import threading
+import uuid
+from pathlib import Path
+from typing import Optional, Union
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+from app.helpers.system import evict_least_recently_used
+
+TEXT_MIME_TYPES = frozenset(
+    {
+        "application/csv",
+        "application/javascript",
+        "application/json",
+        "application/sql",
+        "application/x-ndjson",
+        "application/x-sh",
+        "application/x-yaml",
+        "application/xml",
+        "inode/x-empty",
+    }
+)
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+def is_text(mime_type: Optional[str]) -> bool:
+    if not mime_type:
+        return False
+    return mime_type.startswith("text/") or mime_type in TEXT_MIME_TYPES or mime_type.endswith(("+json", "+xml"))
+
+
+def is_image(mime_type: Optional[str]) -> bool:
+    return bool(mime_type) and mime_type.startswith("image/") and mime_type != "image/svg+xml"
+
+
+def read_text_preview(path: Union[str, Path], lines: int, max_bytes: int) -> tuple[str, bool]:
+    """The first `lines` lines of a text file but no more than `max_bytes`, and whether there's more after them
+
+    Only what's returned is read, plus a byte to tell if the file goes on. A character cut in half by `max_bytes` is
+    dropped rather than shown as garbage.
+    """
+    with open(path, "rb") as f:
+        data = f.read(max_bytes + 1)
+    is_truncated = len(data) > max_bytes
+    data = data[:max_bytes]
+    end = -1
+    for _ in range(lines):
+        end = data.find(b"\n", end + 1)
+        if end == -1:
+            break
+    else:
+        is_truncated = is_truncated or end + 1 < len(data)
+        data = data[: end + 1]
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    return decoder.decode(data, final=not is_truncated), is_truncated
+
+
+def build_thumbnail(path: Union[str, Path], size: int) -> tuple[bytes, str]:
+    """Image downscaled to fit a `size` square, PNG if it has transparency and JPEG otherwise, with its MIME type
+
+    Raises `RuntimeError` if Pillow isn't installed and `OSError` if the file isn't an image Pillow can read, or has
+    more than `Image.MAX_IMAGE_PIXELS` pixels.
+    """
+    if Image is None:
+        raise RuntimeError("Pillow is not installed")
+    try:
+        image = Image.open(path)
+    except Image.DecompressionBombError as e:
+        raise OSError(str(e)) from e
+    with image:
+        # Pillow only warns below twice its limit, it would still be decoded in full
+        if Image.MAX_IMAGE_PIXELS and image.width * image.height > Image.MAX_IMAGE_PIXELS:
+            raise OSError(f"Image of {image.width}x{image.height} pixels is too large to preview")
+        # Lets JPEG decode straight at a fraction of the size instead of decoding everything and scaling it down
+        image.draft("RGB", (size, size))
+        image.thumbnail((size, size))
+        output = io.BytesIO()
+        if image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info:
+            image.convert("RGBA").save(output, "PNG", optimize=True)
+            return output.getvalue(), "image/png"
+        image.convert("RGB").save(output, "JPEG", quality=85)
+        return output.getvalue(), "image/jpeg"
+
+
+class PreviewCache:
+    """Thumbnails on disk, keyed by the file they were made from and their size, least recently used evicted first
+
+    The key includes the inode, size and mtime of the file, so a rewritten file never gets a stale thumbnail and the
+    outdated one just ages out.
+
+    The directory is only scanned for eviction once the size it had at the last scan, plus what was written through
+    this instance since, is over `max_size`. Keep one instance around for that to save anything.
+    """
+
+    def __init__(self, path: Union[str, Path], max_size: int):
+        self.path = Path(path)
+        self.max_size = max_size
+        # None until the first scan
+        self.size: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def build_path(self, st: os.stat_result, size: int) -> Path:
+        key = f"{st.st_dev}:{st.st_ino}:{st.st_size}:{st.st_mtime_ns}:{size}"
+        return self.path / f"{hashlib.blake2b(key.encode(), digest_size=16).hexdigest()}.thumb"
+
+    def get(self, st: os.stat_result, size: int) -> Optional[tuple[bytes, str]]:
+        path = self.build_path(st, size)
+        try:
+            data = path.read_bytes()
+            # Its mtime is the last use for eviction
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return data, "image/png" if data.startswith(PNG_SIGNATURE) else "image/jpeg"
+
+    def set(self, st: os.stat_result, size: int, data: bytes) -> None:
+        self.path.mkdir(parents=True, exist_ok=True)
+        path = self.build_path(st, size)
+        temp_path = self.path / f".{path.name}.{uuid.uuid4().hex}"
+        temp_path.write_bytes(data)
+        os.replace(temp_path, path)
+        with self._lock:
+            if self.size is not None:
+                # Over the actual size if it replaced a thumbnail, which only makes the next scan come sooner
+                self.size += len(data)
+            if self.size is None or self.size > self.max_size:
+                self.size = evict_least_recently_used(self.path, "*.thumb", self.max_size)
+
+    def get_thumbnail(self, path: Union[str, Path], st: os.stat_result, size: int) -> tuple[bytes, str]:
+        """Cached thumbnail of `path` as of `st`, built and cached on a miss"""
+        cached = self.get(st, size)
+        if cached:
+            return cached
+        data, mime_type = build_thumbnail(path, size)
+        self.set(st, size, data)
+        return data, mime_type
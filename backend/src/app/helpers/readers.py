@@ -1,7 +1,12 @@
+import bisect
 import gzip
+import mmap
 import os
+from collections import deque
 from pathlib import Path
-from typing import IO, Generator, List, Optional, Union
+from typing import IO, Generator, List, Optional, Sequence, Tuple, Union
+
+from app.helpers.compression import inflate, read_checkpoints
 
 
 def is_gz(path: Union[str, Path]) -> bool:
@@ -17,36 +22,147 @@ def any_open(path: Union[str, Path], mode: Optional[str] = None) -> Union[gzip.G
         return open(path, mode or "r")
 
 
-def tail(f: Union[str, Path, IO, gzip.GzipFile], lines: int = 1, _buffer: int = 4098) -> Generator[str, None, None]:
-    """Tail a file and get X lines from the end"""
+def _find_tail_start(data: mmap.mmap, lines: int, end: int) -> int:
+    """Scan backwards from `end` for the start of the last `lines` lines, a trailing newline doesn't start a line"""
+    position = end - 1 if data[end - 1 : end] == b"\n" else end
+    for _ in range(lines):
+        position = data.rfind(b"\n", 0, position)
+        if position == -1:
+            return 0
+    return position + 1
+
+
+def _tail_gzip(path: Union[str, Path], lines: int, end: Optional[int] = None) -> Optional[bytes]:
+    """Tail a gzip file written by `compress_log`, decompressing only from the last flush points, None without them
+
+    Starts at the last flush point before `end` and steps back over twice as many points every time the decompressed
+    part turns out to hold fewer than X lines, every part is decompressed only once.
+    """
+    checkpoints = read_checkpoints(path)
+    if checkpoints is None:
+        return None
+    size, points = checkpoints
+    end = size if end is None else min(end, size)
+    i = max(bisect.bisect_left(points, (end, 0)) - 1, 0)
+    stop = end
+    step = 1
+    data = b""
+    with open(path, "rb") as f:
+        while True:
+            start, offset = points[i]
+            data = inflate(f, offset, stop - start) + data
+            position = _find_tail_start(data, lines, len(data)) if data else 0
+            if position or not i:
+                return data[position:]
+            stop = start
+            i = max(i - step, 0)
+            step *= 2
+
+
+def tail_bytes(f: Union[str, Path, IO, gzip.GzipFile], lines: int = 1, end: Optional[int] = None) -> bytes:
+    """Get X lines from the end of a file, or from `end` offset if it's set, as a single slice
+
+    Regular files are memory mapped and scanned backwards for newlines, so only the tail itself gets copied. Anything
+    that can't be mapped is read through, keeping only the last X lines. Gzip files written by `compress_log` are
+    decompressed from the flush points closest to the end, other gzip files are read through as well.
+    """
     if isinstance(f, (str, Path)):
+        if is_gz(f) and lines > 0:
+            data = _tail_gzip(f, lines, end)
+            if data is not None:
+                return data
         with any_open(f, "rb") as r:
-            yield from tail(r, lines, _buffer)
-    else:
-        f.seek(0, os.SEEK_END)
-        block_end_byte = f.tell()
-        lines_to_go = lines
-        block_number = -1
-        blocks = []
-        while lines_to_go > 0 and block_end_byte > 0:
-            if block_end_byte - _buffer > 0:
-                f.seek(block_number * _buffer, os.SEEK_END)
-                blocks.append(f.read(_buffer))
-            else:
-                f.seek(0, 0)
-                blocks.append(f.read(block_end_byte))
-            lines_found = blocks[-1].count(b"\n")
-            lines_to_go -= lines_found
-            block_end_byte -= _buffer
-            block_number -= 1
-        all_read_text = b"".join(reversed(blocks))
-        for row in all_read_text.splitlines()[-lines:]:
-            yield row.decode()
-
-
-def tail_as_text(f: Union[str, Path, IO, gzip.GzipFile], lines: int = 1, _buffer: int = 4098) -> str:
-    return "\n".join(tail(f, lines, _buffer))
-
-
-def tail_as_list(f: Union[str, Path, IO, gzip.GzipFile], lines: int = 1, _buffer: int = 4098) -> List[str]:
-    return list(tail(f, lines, _buffer))
+            return tail_bytes(r, lines, end)
+    if lines <= 0:
+        return b""
+    if not isinstance(f, gzip.GzipFile):
+        try:
+            fileno = f.fileno()
+        except (AttributeError, OSError):
+            fileno = None
+        if fileno is not None:
+            size = os.fstat(fileno).st_size
+            if end is not None:
+                # The file might have been truncated or rotated since `end` was taken
+                size = min(size, end)
+            if not size:
+                return b""
+            with mmap.mmap(fileno, size, access=mmap.ACCESS_READ) as data:
+                return data[_find_tail_start(data, lines, size) : size]
+    rows: deque[bytes] = deque(maxlen=lines)
+    position = 0
+    for row in f:
+        if end is not None and position + len(row) >= end:
+            rows.append(row[: end - position])
+            break
+        rows.append(row)
+        position += len(row)
+    return b"".join(rows)
+
+
+def tail(
+    f: Union[str, Path, IO, gzip.GzipFile], lines: int = 1, end: Optional[int] = None
+) -> Generator[str, None, None]:
+    """Tail a file and get X lines from the end, or from `end` offset if it's set"""
+    for row in tail_bytes(f, lines, end).splitlines()[-lines:]:
+        yield row.decode(errors="replace")
+
+
+def _decode_tail(data: bytes) -> str:
+    text = data.decode(errors="replace")
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return text.removesuffix("\n")
+
+
+def tail_as_text(f: Union[str, Path, IO, gzip.GzipFile], lines: int = 1, end: Optional[int] = None) -> str:
+    return _decode_tail(tail_bytes(f, lines, end))
+
+
+def tail_segments_bytes(paths: Sequence[Union[str, Path]], lines: int = 1, end: Optional[int] = None) -> bytes:
+    """Tail a log split into segments, newest first, reading older segments only while lines are still missing
+
+    `end` applies to the newest segment. Missing segments are skipped, they might have been rotated away meanwhile.
+    """
+    parts: list[bytes] = []
+    for i, path in enumerate(paths):
+        if lines <= 0:
+            break
+        try:
+            data = tail_bytes(path, lines, end if i == 0 else None)
+        except FileNotFoundError:
+            continue
+        if not data:
+            continue
+        if parts and not data.endswith(b"\n"):
+            data += b"\n"
+        parts.append(data)
+        lines -= data.count(b"\n") + (not data.endswith(b"\n"))
+    return b"".join(reversed(parts))
+
+
+def tail_segments_as_text(paths: Sequence[Union[str, Path]], lines: int = 1, end: Optional[int] = None) -> str:
+    return _decode_tail(tail_segments_bytes(paths, lines, end))
+
+
+def tail_as_list(f: Union[str, Path, IO, gzip.GzipFile], lines: int = 1, end: Optional[int] = None) -> List[str]:
+    return list(tail(f, lines, end))
+
+
+def read_since(f: Union[str, Path, IO], offset: int, max_bytes: int, end: Optional[int] = None) -> Tuple[str, int]:
+    """Read complete lines between `offset` and `end` (end of file by default), at most `max_bytes` of them
+
+    Returns the text and the offset to continue reading from. A trailing incomplete line is left for the next read,
+    unless it alone is longer than `max_bytes`.
+    """
+    if isinstance(f, (str, Path)):
+        with open(f, "rb") as r:
+            return read_since(r, offset, max_bytes, end)
+    if end is None:
+        end = os.fstat(f.fileno()).st_size
+    f.seek(offset)
+    data = f.read(max(min(end - offset, max_bytes), 0))
+    cut = max(data.rfind(b"\n"), data.rfind(b"\r")) + 1
+    if not cut and len(data) == max_bytes:
+        cut = len(data)
+    return data[:cut].decode(errors="replace"), offset + cut
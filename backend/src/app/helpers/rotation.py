@@ -0,0 +1,90 @@
+import os
+import time
+from pathlib import Path
+from typing import Optional, Union
+
+from app.helpers.compression import build_checkpoints_path, compress_log
+from app.helpers.line_index import build_index_path
+
+
+def build_segment_path(path: Union[str, Path], number: int, compressed: bool = True) -> Path:
+    """Path of a rotated segment of a log, `1` is the newest one"""
+    path = Path(path)
+    name = f"{path.name}.{number}"
+    return path.with_name(f"{name}.gz" if compressed else name)
+
+
+def find_segment(path: Union[str, Path], number: int) -> Optional[Path]:
+    """A rotated segment is left uncompressed until its compression finishes"""
+    for segment_path in (build_segment_path(path, number), build_segment_path(path, number, compressed=False)):
+        if segment_path.exists():
+            return segment_path
+    return None
+
+
+def list_segments(path: Union[str, Path]) -> list[Path]:
+    """Rotated segments of a log, newest first"""
+    segments = []
+    while segment_path := find_segment(path, len(segments) + 1):
+        segments.append(segment_path)
+    return segments
+
+
+def remove_segment(segment_path: Path) -> None:
+    segment_path.unlink(missing_ok=True)
+    build_checkpoints_path(segment_path).unlink(missing_ok=True)
+
+
+def should_rotate(path: Union[str, Path], max_size: int = 0, max_age: float = 0) -> bool:
+    """Whether a log is at least `max_size` bytes or wasn't written to for `max_age` seconds, zero disables either"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return False
+    if not st.st_size:
+        return False
+    return bool(max_size and st.st_size >= max_size or max_age and time.time() - st.st_mtime >= max_age)
+
+
+def rotate_log(path: Union[str, Path], keep: int) -> Optional[Path]:
+    """Move a log out of the way as segment `1`, shifting older segments and dropping those beyond `keep`
+
+    Returns the new, still uncompressed, segment for `compress_segment`, or None when nothing is kept. The line index
+    of the log is removed, it's rebuilt for the new log on open.
+    """
+    path = Path(path)
+    segments = list_segments(path)
+    for number in range(len(segments), 0, -1):
+        segment_path = segments[number - 1]
+        if number >= keep:
+            remove_segment(segment_path)
+            continue
+        compressed = segment_path.suffix == ".gz"
+        new_path = build_segment_path(path, number + 1, compressed=compressed)
+        if compressed:
+            os.replace(build_checkpoints_path(segment_path), build_checkpoints_path(new_path))
+        os.replace(segment_path, new_path)
+    build_index_path(path).unlink(missing_ok=True)
+    if keep <= 0:
+        path.unlink(missing_ok=True)
+        return None
+    segment_path = build_segment_path(path, 1, compressed=False)
+    os.replace(path, segment_path)
+    return segment_path
+
+
+def compress_segment(segment_path: Path) -> Path:
+    """Compress a segment left by `rotate_log` into its seekable `.gz` form"""
+    compressed_path = segment_path.with_name(f"{segment_path.name}.gz")
+    compress_log(segment_path, compressed_path)
+    segment_path.unlink()
+    return compressed_path
+
+
+def remove_log(path: Union[str, Path]) -> None:
+    """Remove a log with its line index and every rotated segment"""
+    path = Path(path)
+    for segment_path in list_segments(path):
+        remove_segment(segment_path)
+    build_index_path(path).unlink(missing_ok=True)
+    path.unlink(missing_ok=True)
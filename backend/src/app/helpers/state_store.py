@@ -0,0 +1,248 @@
+import sqlite3
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Iterable, Iterator, Optional, Union
+
+import orjson
+
+from app.helpers.journal import DUMP_OPTIONS, HistoryJournal
+
+BUDGET_FIELDS = (
+    "total_prompt_tokens",
+    "total_completion_tokens",
+    "total_cost",
+    "total_budget",
+    "embedding_cache_hits",
+    "embedding_cache_misses",
+)
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (id INTEGER PRIMARY KEY AUTOINCREMENT, data BLOB NOT NULL);
+CREATE TABLE IF NOT EXISTS history (id INTEGER PRIMARY KEY CHECK (id = 0), state BLOB NOT NULL);
+CREATE TABLE IF NOT EXISTS agents (key INTEGER PRIMARY KEY, data BLOB NOT NULL);
+CREATE TABLE IF NOT EXISTS budget (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    total_prompt_tokens INTEGER NOT NULL,
+    total_completion_tokens INTEGER NOT NULL,
+    total_cost REAL NOT NULL,
+    total_budget REAL NOT NULL,
+    embedding_cache_hits INTEGER NOT NULL DEFAULT 0,
+    embedding_cache_misses INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+
+def build_state_store_path(cache_path: Union[str, Path], memory_index: str) -> Path:
+    return Path(cache_path) / f"{memory_index}-state.sqlite3"
+
+
+def dump(value: Any) -> bytes:
+    return orjson.dumps(value, option=DUMP_OPTIONS)
+
+
+class StateStore:
+    """Message history, sub-agents and budget of an agent in one SQLite database in WAL mode
+
+    Every change is a row written in a small transaction instead of a rewritten file. Readers, like the API, don't
+    block the agent writing and see the last committed state, and read only the rows they ask for. Messages get
+    consecutive ids, they're only appended or dropped from the head, so a range of them is a range of ids.
+
+    A `read_only` store opens an existing database as it is, it never creates, configures or migrates it.
+    """
+
+    def __init__(self, path: Union[str, Path], timeout: float = 5.0, read_only: bool = False):
+        self.path = Path(path)
+        self.timeout = timeout
+        self.read_only = read_only
+        self._connection: Optional[sqlite3.Connection] = None
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        if self._connection is None and self.read_only:
+            self._connection = sqlite3.connect(
+                f"{self.path.absolute().as_uri()}?mode=ro",
+                uri=True,
+                timeout=self.timeout,
+                isolation_level=None,
+                check_same_thread=False,
+            )
+        if self._connection is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            # Transactions are explicit, see `transaction`
+            connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            # In WAL mode it's still safe against corruption, a power loss may only lose the last transactions
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(SCHEMA)
+            # Columns added since the table was created
+            columns = {row[1] for row in connection.execute("PRAGMA table_info(budget)")}
+            for field in BUDGET_FIELDS:
+                if field not in columns:
+                    connection.execute(f"ALTER TABLE budget ADD COLUMN {field} INTEGER NOT NULL DEFAULT 0")
+            self._connection = connection
+        return self._connection
+
+    @contextmanager
+    def transaction(self, write: bool = True) -> Iterator[sqlite3.Connection]:
+        """A write transaction takes the lock right away, a read one sees a single snapshot and never waits"""
+        connection = self.connection
+        connection.execute("BEGIN IMMEDIATE" if write else "BEGIN DEFERRED")
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    def count_messages(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+
+    def load_messages(self, start: int = 0, stop: Optional[int] = None) -> list[Any]:
+        """Messages from the `start` to the `stop` position, the same as `messages[start:stop]` for non-negatives"""
+        first_id = self.connection.execute("SELECT MIN(id) FROM messages").fetchone()[0]
+        if first_id is None:
+            return []
+        query = "SELECT data FROM messages WHERE id >= ?"
+        params = [first_id + start]
+        if stop is not None:
+            query += " AND id < ?"
+            params.append(first_id + stop)
+        return [orjson.loads(data) for data, in self.connection.execute(f"{query} ORDER BY id", params)]
+
+    def append_message(self, message: Any) -> None:
+        self.connection.execute("INSERT INTO messages (data) VALUES (?)", (dump(message),))
+
+    def get_messages_size(self) -> int:
+        return self.connection.execute("SELECT COALESCE(SUM(LENGTH(data)), 0) FROM messages").fetchone()[0]
+
+    def plan_truncation(self, max_size: int) -> int:
+        """How many of the oldest messages to drop for the rest to take less than `max_size` bytes"""
+        size = self.get_messages_size()
+        count = 0
+        for (message_size,) in self.connection.execute("SELECT LENGTH(data) FROM messages ORDER BY id"):
+            if size < max_size:
+                break
+            size -= message_size
+            count += 1
+        return count
+
+    def delete_messages(self, count: int) -> None:
+        """Drop the oldest `count` messages"""
+        self.connection.execute("DELETE FROM messages WHERE id < (SELECT MIN(id) FROM messages) + ?", (count,))
+
+    def replace_messages(self, messages: Iterable[Any], state: dict) -> None:
+        """Replace all the messages and the history state at once"""
+        with self.transaction() as connection:
+            connection.execute("DELETE FROM messages")
+            connection.executemany("INSERT INTO messages (data) VALUES (?)", ((dump(m),) for m in messages))
+            connection.execute("INSERT OR REPLACE INTO history (id, state) VALUES (0, ?)", (dump(state),))
+
+    def get_history_state(self) -> Optional[dict]:
+        row = self.connection.execute("SELECT state FROM history WHERE id = 0").fetchone()
+        return orjson.loads(row[0]) if row else None
+
+    def write_history_state(self, state: dict) -> None:
+        self.connection.execute("INSERT OR REPLACE INTO history (id, state) VALUES (0, ?)", (dump(state),))
+
+    def load_agents(self) -> dict[int, Any]:
+        return {key: orjson.loads(data) for key, data in self.connection.execute("SELECT key, data FROM agents")}
+
+    def set_agent(self, key: int, agent: Any) -> None:
+        self.connection.execute("INSERT OR REPLACE INTO agents (key, data) VALUES (?, ?)", (key, dump(agent)))
+
+    def delete_agent(self, key: int) -> None:
+        self.connection.execute("DELETE FROM agents WHERE key = ?", (key,))
+
+    def get_budget(self) -> Optional[dict[str, float]]:
+        cursor = self.connection.execute("SELECT * FROM budget WHERE id = 0")
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        # A read-only store may see a table from before some of the columns were added
+        columns = dict(zip((column[0] for column in cursor.description), row))
+        return {field: columns.get(field, 0) for field in BUDGET_FIELDS}
+
+    def set_budget(self, budget: dict[str, float]) -> None:
+        fields, params = ", ".join(BUDGET_FIELDS), ", ".join("?" * len(BUDGET_FIELDS))
+        self.connection.execute(
+            f"INSERT OR REPLACE INTO budget (id, {fields}) VALUES (0, {params})",
+            [budget.get(field, 0) for field in BUDGET_FIELDS],
+        )
+
+    def close(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+def migrate_from_json(store: StateStore, cache_path: Union[str, Path], memory_index: str) -> bool:
+    """Move the state kept in JSON files by `memory_index` into `store`, whether there was anything to move
+
+    Those files only exist if they were written after the last migration, so what they hold replaces what's in the
+    store. They're removed once it's committed.
+    """
+    cache_path = Path(cache_path)
+    history_path = cache_path / f"{memory_index}-history.jsonl"
+    legacy_history_path = cache_path / f"{memory_index}-history.json"
+    agents_path = cache_path / f"{memory_index}-agents.json"
+    budget_path = cache_path / f"{memory_index}-budget.json"
+    paths = [path for path in (history_path, legacy_history_path, agents_path, budget_path) if path.exists()]
+    if not paths:
+        return False
+
+    history: Optional[tuple[list, Optional[dict]]] = None
+    if history_path.exists():
+        history = HistoryJournal(history_path).load()
+    elif legacy_history_path.exists():
+        state = orjson.loads(legacy_history_path.read_bytes())
+        history = state.pop("messages", []), state
+    with store.transaction() as connection:
+        if history is not None:
+            messages, state = history
+            connection.execute("DELETE FROM messages")
+            connection.executemany("INSERT INTO messages (data) VALUES (?)", ((dump(m),) for m in messages))
+            if state is not None:
+                store.write_history_state(state)
+        if agents_path.exists():
+            connection.execute("DELETE FROM agents")
+            for key, agent in orjson.loads(agents_path.read_bytes()).items():
+                store.set_agent(int(key), agent)
+        if budget_path.exists():
+            store.set_budget(orjson.loads(budget_path.read_bytes()))
+    for path in paths:
+        path.unlink(missing_ok=True)
+    return True
+
+
+def read_budget(cache_path: Union[str, Path], memory_index: str) -> Optional[dict[str, float]]:
+    """Budget of the agent, from its database if it has one and from its JSON file otherwise"""
+    store_path = build_state_store_path(cache_path, memory_index)
+    if store_path.exists():
+        store = StateStore(store_path, read_only=True)
+        try:
+            return store.get_budget()
+        finally:
+            store.close()
+    try:
+        return orjson.loads((Path(cache_path) / f"{memory_index}-budget.json").read_bytes())
+    except FileNotFoundError:
+        return None
+
+
+def read_history(
+    cache_path: Union[str, Path], memory_index: str, start: int = 0, stop: Optional[int] = None
+) -> tuple[list[Any], int]:
+    """Messages of the agent from the `start` to the `stop` position and how many there are in total
+
+    Only the asked range is read from a database, the JSON journal has to be read whole.
+    """
+    store_path = build_state_store_path(cache_path, memory_index)
+    if store_path.exists():
+        store = StateStore(store_path, read_only=True)
+        try:
+            # Both in one read transaction, so they agree with each other whatever the agent writes meanwhile
+            with store.transaction(write=False):
+                return store.load_messages(start, stop), store.count_messages()
+        finally:
+            store.close()
+    messages, _ = HistoryJournal(Path(cache_path) / f"{memory_index}-history.jsonl").load(repair=False)
+    return messages[start:stop], len(messages)
@@ -0,0 +1,54 @@
+import asyncio
+import re
+
+SEPARATORS = re.compile(rb"[\r\n]")
+
+
+class LineSplitter:
+    """Read lines ending with either `\\n` or `\\r` from a stream
+
+    The nearest separator is found in a single scan and bytes already known to contain no separator are not scanned
+    again after more data arrives. A line longer than `limit` is not an error, it is returned in `limit` sized chunks.
+    """
+
+    def __init__(self, reader: asyncio.StreamReader, limit: int = 2**16, chunk_size: int = 2**16):
+        self.reader = reader
+        self.limit = limit
+        self.chunk_size = chunk_size
+        self._buffer = bytearray()
+        self._scanned = 0
+        self._eof = False
+
+    def __aiter__(self) -> "LineSplitter":
+        return self
+
+    async def __anext__(self) -> bytes:
+        line = await self.readline()
+        if not line:
+            raise StopAsyncIteration
+        return line
+
+    def _pop(self, size: int) -> bytes:
+        chunk = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return chunk
+
+    async def readline(self) -> bytes:
+        """Return the next line including its separator, or an empty bytes object at EOF"""
+        while True:
+            match = SEPARATORS.search(self._buffer, self._scanned)
+            if match:
+                self._scanned = 0
+                return self._pop(match.end())
+            if len(self._buffer) >= self.limit:
+                line = self._pop(self.limit)
+                self._scanned = len(self._buffer)
+                return line
+            self._scanned = len(self._buffer)
+            if self._eof:
+                self._scanned = 0
+                return self._pop(len(self._buffer))
+            data = await self.reader.read(self.chunk_size)
+            if not data:
+                self._eof = True
+            self._buffer += data
@@ -11,3 +11,26 @@ async def run_command(cmd: str) -> Tuple[Optional[int], str, str]:
 
 async def remove_by_path(path: Path) -> None:
     path.unlink(missing_ok=True)
+
+
+def evict_least_recently_used(path: Path, pattern: str, max_size: int) -> int:
+    """Remove files matching `pattern` in `path`, oldest mtime first, until they take up `max_size` bytes at most
+
+    Files starting with a dot are still being written and are left alone. Returns how many bytes the rest take.
+    """
+    files = []
+    for file_path in path.glob(pattern):
+        if file_path.name.startswith("."):
+            continue
+        try:
+            st = file_path.stat()
+        except FileNotFoundError:
+            continue
+        files.append((st.st_mtime, st.st_size, file_path))
+    total = sum(size for _, size, _ in files)
+    for _, size, file_path in sorted(files):
+        if total <= max_size:
+            break
+        file_path.unlink(missing_ok=True)
+        total -= size
+    return total
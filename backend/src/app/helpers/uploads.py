@@ -0,0 +1,165 @@
+import fcntl
+import os
+import re
+import time
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import AsyncIterable, Optional, Union
+
+import anyio
+import orjson
+
+from app.helpers.usage import get_file_size
+
+UPLOAD_ID = re.compile(r"[0-9a-f]{32}")
+
+
+class UploadError(Exception):
+    pass
+
+
+class UploadTooLarge(UploadError):
+    pass
+
+
+class UploadConflict(UploadError):
+    pass
+
+
+class UploadNotFound(UploadError):
+    pass
+
+
+async def save_stream(destination: Path, chunks: AsyncIterable[bytes], max_size: int) -> int:
+    """Stream `chunks` into a temp file next to `destination` and rename it into place once complete
+
+    Nothing is buffered beyond a single chunk and readers never see a half-written file. Raises `UploadTooLarge` past
+    `max_size` bytes, the temp file is removed on any error.
+    """
+    temp_path = destination.with_name(f".{destination.name}.{uuid.uuid4().hex}.part")
+    size = 0
+    try:
+        async with await anyio.open_file(temp_path, "wb") as w:
+            async for chunk in chunks:
+                size += len(chunk)
+                if size > max_size:
+                    raise UploadTooLarge(f"Upload is larger than {max_size} bytes")
+                await w.write(chunk)
+        await anyio.to_thread.run_sync(os.replace, temp_path, destination)
+    except BaseException:
+        await anyio.to_thread.run_sync(lambda: temp_path.unlink(missing_ok=True))
+        raise
+    return size
+
+
+@dataclass
+class Upload:
+    id: str
+    destination: Path
+    size: int
+    offset: int = 0
+    # Size of the file the upload replaced once it's complete, None if there was none
+    replaced_size: Optional[int] = None
+
+    @property
+    def is_complete(self) -> bool:
+        return self.offset >= self.size
+
+
+class ResumableUploads:
+    """Uploads sent in any number of requests, each one appending at the offset the previous one stopped at
+
+    Every upload has a state file (`<id>.json`) with its destination and declared size, and the data received so far
+    (`<id>.part`), whose size is the offset to continue from. Both live in `path`, outside the workspace, so agents
+    never see partial files. Once all bytes are there, the data is renamed to its destination. Uploads not appended to
+    for `ttl` seconds are removed by `purge_expired`.
+    """
+
+    def __init__(self, path: Union[str, Path], ttl: float):
+        self.path = Path(path)
+        self.ttl = ttl
+
+    def build_state_path(self, upload_id: str) -> Path:
+        if not UPLOAD_ID.fullmatch(upload_id):
+            raise UploadNotFound(upload_id)
+        return self.path / f"{upload_id}.json"
+
+    def build_data_path(self, upload_id: str) -> Path:
+        return self.build_state_path(upload_id).with_suffix(".part")
+
+    def create(self, destination: Path, size: int) -> Upload:
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.purge_expired()
+        upload = Upload(uuid.uuid4().hex, destination, size)
+        self.build_data_path(upload.id).touch()
+        self.build_state_path(upload.id).write_bytes(
+            orjson.dumps({"destination": str(destination), "size": size, "created_at": time.time()})
+        )
+        return upload
+
+    def get(self, upload_id: str) -> Upload:
+        try:
+            state = orjson.loads(self.build_state_path(upload_id).read_bytes())
+            offset = self.build_data_path(upload_id).stat().st_size
+        except (FileNotFoundError, orjson.JSONDecodeError):
+            raise UploadNotFound(upload_id)
+        return Upload(upload_id, Path(state["destination"]), state["size"], offset)
+
+    def remove(self, upload_id: str) -> None:
+        self.build_data_path(upload_id).unlink(missing_ok=True)
+        self.build_state_path(upload_id).unlink(missing_ok=True)
+
+    def purge_expired(self) -> None:
+        deadline = time.time() - self.ttl
+        for state_path in self.path.glob("*.json"):
+            upload_id = state_path.stem
+            if not UPLOAD_ID.fullmatch(upload_id):
+                continue
+            try:
+                # Every append touches the data, so this is the last time the client was heard of
+                last_active = self.build_data_path(upload_id).stat().st_mtime
+            except FileNotFoundError:
+                last_active = 0
+            if last_active < deadline:
+                self.remove(upload_id)
+
+    async def append(self, upload_id: str, offset: int, chunks: AsyncIterable[bytes]) -> Upload:
+        """Append `chunks` at `offset`, which has to be where the upload currently ends
+
+        Whatever arrives before the client goes away is kept, so the next request can carry on from there. Raises
+        `UploadConflict` if the offset doesn't match or another request is appending to the same upload.
+        """
+        upload = await anyio.to_thread.run_sync(self.get, upload_id)
+        if offset != upload.offset:
+            raise UploadConflict(f"Upload is at offset {upload.offset}, not {offset}")
+        f = await anyio.to_thread.run_sync(open, self.build_data_path(upload_id), "ab")
+        try:
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise UploadConflict("Upload is being appended to by another request")
+            # It could have grown between `get` and the lock
+            if f.tell() != offset:
+                raise UploadConflict(f"Upload is at offset {f.tell()}, not {offset}")
+            try:
+                async for chunk in chunks:
+                    if upload.offset + len(chunk) > upload.size:
+                        raise UploadTooLarge(f"Upload is larger than the declared {upload.size} bytes")
+                    await anyio.to_thread.run_sync(f.write, chunk)
+                    upload.offset += len(chunk)
+            finally:
+                await anyio.to_thread.run_sync(f.flush)
+        finally:
+            await anyio.to_thread.run_sync(f.close)
+        if upload.is_complete:
+            await anyio.to_thread.run_sync(self.complete, upload)
+        return upload
+
+    def complete(self, upload: Upload) -> None:
+        upload.replaced_size = get_file_size(upload.destination)
+        try:
+            os.replace(self.build_data_path(upload.id), upload.destination)
+        except FileNotFoundError:
+            raise UploadError(f"Directory of {upload.destination.name} doesn't exist anymore")
+        self.build_state_path(upload.id).unlink(missing_ok=True)
@@ -0,0 +1,90 @@
+import os
+import stat
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional, Union
+
+import anyio
+from redis.asyncio import Redis
+
+from app.helpers.archives import MAX_DEPTH
+from app.helpers.workspace import scan_directory
+
+
+@dataclass
+class WorkspaceUsage:
+    size: int
+    files: int
+    reconciled_at: float
+
+
+def build_usage_key(user_id: int) -> str:
+    return f"workspace:{user_id}:usage"
+
+
+def get_file_size(path: Union[str, Path]) -> Optional[int]:
+    """Size of a regular file, None if there's no such file"""
+    try:
+        st = os.lstat(path)
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    return st.st_size if stat.S_ISREG(st.st_mode) else None
+
+
+def measure(path: Union[str, Path]) -> tuple[int, int]:
+    """Total size and count of regular files under `path`, or of `path` itself if it's a file
+
+    Symlinks aren't counted, whatever they point at is either counted on its own or isn't in the workspace.
+    """
+    try:
+        st = os.lstat(path)
+    except (FileNotFoundError, NotADirectoryError):
+        return 0, 0
+    if stat.S_ISREG(st.st_mode):
+        return st.st_size, 1
+    if not stat.S_ISDIR(st.st_mode):
+        return 0, 0
+    size = files = 0
+    for entry in scan_directory(path, path, depth=MAX_DEPTH, follow_symlinks=False):
+        if stat.S_ISREG(entry.st.st_mode):
+            size += entry.st.st_size
+            files += 1
+    return size, files
+
+
+async def reconcile_usage(redis: Redis, user_id: int, path: Union[str, Path]) -> WorkspaceUsage:
+    """Measure the workspace and replace the counters with the result"""
+    size, files = await anyio.to_thread.run_sync(measure, path)
+    usage = WorkspaceUsage(size, files, time.time())
+    await redis.hset(
+        build_usage_key(user_id),
+        mapping={"size": usage.size, "files": usage.files, "reconciled_at": usage.reconciled_at},
+    )
+    return usage
+
+
+async def get_usage(redis: Redis, user_id: int, path: Union[str, Path]) -> WorkspaceUsage:
+    """Usage of the workspace by its counters, measured once if they don't exist yet
+
+    Counters incremented before the first measurement lack `reconciled_at` and are replaced by it.
+    """
+    data = await redis.hgetall(build_usage_key(user_id))
+    if b"reconciled_at" not in data:
+        return await reconcile_usage(redis, user_id, path)
+    # Deltas racing a reconciliation can push them slightly off until the next one
+    return WorkspaceUsage(
+        max(int(data.get(b"size", 0)), 0), max(int(data.get(b"files", 0)), 0), float(data[b"reconciled_at"])
+    )
+
+
+async def add_usage(redis: Redis, user_id: int, size: int, files: int) -> None:
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.hincrby(build_usage_key(user_id), "size", size)
+        pipe.hincrby(build_usage_key(user_id), "files", files)
+        await pipe.execute()
+
+
+async def delete_usage(redis: Redis, user_id: int) -> None:
+    """Forget the counters, the next `get_usage` measures the workspace again"""
+    await redis.delete(build_usage_key(user_id))
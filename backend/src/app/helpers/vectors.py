@@ -0,0 +1,282 @@
+import hashlib
+import os
+import re
+import uuid
+from pathlib import Path
+from typing import Any, Iterator, Optional, Union
+
+import numpy as np
+import orjson
+
+from app.helpers.journal import COMPACT_MIN_BYTES, dump_record
+from app.helpers.persistence import write_atomic
+
+DTYPE = np.float32
+# Rows the matrix grows by at least, it at least doubles past that
+MIN_CAPACITY = 256
+WORD = re.compile(r"\w+")
+
+
+def hash_embedding(text: str, dim: int) -> np.ndarray:
+    """Bag of words embedding that needs no model, texts sharing words point in similar directions
+
+    Every word is hashed to a dimension and a sign. Good enough to test search offline, meaningless otherwise.
+    """
+    vector = np.zeros(dim, dtype=DTYPE)
+    for word in WORD.findall(text.lower()):
+        digest = int.from_bytes(hashlib.blake2b(word.encode(), digest_size=8).digest(), "little")
+        vector[digest % dim] += 1.0 if digest >> 63 else -1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    # A zero vector stays zero and scores 0 against anything
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+
+class VectorIndex:
+    """Items with one or more float32 vectors each, kept in a directory across runs and searched by cosine similarity
+
+    Vectors are rows of a memory-mapped matrix in `vectors.f32`, normalized on the way in, so a search is a single
+    matrix product over the rows in use. Items are records of an append-only `items.jsonl` next to it: an item with
+    its metadata and rows, or the removal of one. Rows are written and flushed before the record naming them, so the
+    record is the commit, and a record torn by a crash is cut off on load.
+
+    Rows and records of removed or replaced items are dead weight, both files are rewritten without them (compacted)
+    once the dead rows are as many as the live ones and take `COMPACT_MIN_BYTES` at least. The rewritten rows go to
+    a new file, named by the first record of the rewritten items, so the rename of the items file commits both.
+    Compaction renumbers the items.
+    """
+
+    def __init__(self, path: Union[str, Path], dim: int):
+        self.path = Path(path)
+        self.dim = dim
+        self.vectors_path = self.path / "vectors.f32"
+        self.items_path = self.path / "items.jsonl"
+        self.row_size = dim * np.dtype(DTYPE).itemsize
+        # Key, metadata, first row and count of rows of every item ever added, the metadata is None once removed
+        self.item_keys: list[str] = []
+        self.items: list[Optional[dict]] = []
+        self.starts: list[int] = []
+        self.counts: list[int] = []
+        # Id of the live item by its key
+        self.keys: dict[str, int] = {}
+        self.rows = 0
+        self.live_rows = 0
+        self._matrix: Optional[np.memmap] = None
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.keys
+
+    @property
+    def capacity(self) -> int:
+        return 0 if self._matrix is None else self._matrix.shape[0]
+
+    @property
+    def needs_compaction(self) -> bool:
+        dead_rows = self.rows - self.live_rows
+        return dead_rows * self.row_size >= COMPACT_MIN_BYTES and dead_rows >= self.live_rows
+
+    def _get_capacity(self) -> int:
+        try:
+            return self.vectors_path.stat().st_size // self.row_size
+        except FileNotFoundError:
+            return 0
+
+    def _map(self, capacity: int) -> None:
+        self._matrix = None
+        if not capacity:
+            return
+        with self.vectors_path.open("ab") as f:
+            if f.tell() < capacity * self.row_size:
+                f.truncate(capacity * self.row_size)
+        self._matrix = np.memmap(self.vectors_path, dtype=DTYPE, mode="r+", shape=(capacity, self.dim))
+
+    def load(self) -> None:
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._reset()
+        capacity = self._get_capacity()
+        offset = 0
+        try:
+            f = self.items_path.open("rb")
+        except FileNotFoundError:
+            f = None
+        if f is not None:
+            with f:
+                for line in f:
+                    try:
+                        if not line.endswith(b"\n"):
+                            raise ValueError("Torn record")
+                        record = orjson.loads(line)
+                    except ValueError:
+                        break
+                    if "vectors" in record:
+                        self.vectors_path = self.path / record["vectors"]
+                        capacity = self._get_capacity()
+                    elif "delete" in record:
+                        self._forget(record["delete"])
+                    elif record["start"] + record["count"] <= capacity:
+                        self._remember(record["key"], record["item"], record["start"], record["count"])
+                    else:
+                        break
+                    offset += len(line)
+            if offset < self.items_path.stat().st_size:
+                os.truncate(self.items_path, offset)
+        self._map(capacity)
+        # Left by a compaction a crash interrupted, or by the one before the last
+        for path in self.path.glob("*.f32"):
+            if path != self.vectors_path:
+                path.unlink(missing_ok=True)
+
+    def _reset(self) -> None:
+        self.item_keys, self.items, self.starts, self.counts, self.keys = [], [], [], [], {}
+        self.rows = self.live_rows = 0
+        self.vectors_path = self.path / "vectors.f32"
+
+    def _remember(self, key: str, item: dict, start: int, count: int) -> int:
+        if key in self.keys:
+            self._forget(self.keys[key])
+        self.keys[key] = len(self.items)
+        self.item_keys.append(key)
+        self.items.append(item)
+        self.starts.append(start)
+        self.counts.append(count)
+        self.rows = start + count
+        self.live_rows += count
+        return self.keys[key]
+
+    def _forget(self, item_id: int) -> None:
+        if self.items[item_id] is not None:
+            self.live_rows -= self.counts[item_id]
+        self.items[item_id] = None
+        if self.keys.get(self.item_keys[item_id]) == item_id:
+            del self.keys[self.item_keys[item_id]]
+
+    def _append_record(self, record: dict[str, Any]) -> None:
+        with self.items_path.open("ab") as f:
+            f.write(dump_record(record))
+
+    def add(self, key: str, vectors: np.ndarray, item: dict) -> int:
+        """Add `item` with `vectors`, one per row, replacing an item added with the same `key`"""
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=DTYPE))
+        if vectors.shape[1] != self.dim:
+            raise ValueError(f"Vectors should have {self.dim} dimensions, not {vectors.shape[1]}")
+        if not vectors.shape[0]:
+            raise ValueError("An item needs a vector at least")
+        start, count = self.rows, vectors.shape[0]
+        if start + count > self.capacity:
+            self._map(max(start + count, self.capacity * 2, MIN_CAPACITY))
+        self._matrix[start : start + count] = normalize(vectors)
+        self._matrix.flush()
+        self._append_record({"key": key, "start": start, "count": count, "item": item})
+        self._remember(key, item, start, count)
+        if self.needs_compaction:
+            self.compact()
+        return self.keys[key]
+
+    def discard(self, key: str) -> None:
+        item_id = self.keys.get(key)
+        if item_id is None:
+            return
+        self._append_record({"delete": item_id})
+        self._forget(item_id)
+        if self.needs_compaction:
+            self.compact()
+
+    def clear(self) -> None:
+        # Records go first, rows nothing refers to are harmless if a crash keeps them
+        write_atomic(self.items_path, b"")
+        self._matrix = None
+        self.vectors_path.unlink(missing_ok=True)
+        self._reset()
+
+    def compact(self) -> None:
+        """Rewrite both files with the live items only, in order, their rows packed at the start"""
+        live = sorted(self.keys.values())
+        vectors_path = self.path / f"vectors-{uuid.uuid4().hex}.f32"
+        temp_path = self.items_path.with_name(f".{self.items_path.name}.{uuid.uuid4().hex}")
+        records = []
+        try:
+            with vectors_path.open("wb") as f:
+                start = 0
+                for item_id in live:
+                    count = self.counts[item_id]
+                    f.write(np.ascontiguousarray(self.get_vectors(item_id)).tobytes())
+                    records.append((self.item_keys[item_id], self.items[item_id], start, count))
+                    start += count
+            with temp_path.open("wb") as f:
+                f.write(dump_record({"vectors": vectors_path.name}))
+                for key, item, start, count in records:
+                    f.write(dump_record({"key": key, "start": start, "count": count, "item": item}))
+            os.replace(temp_path, self.items_path)
+        except BaseException:
+            vectors_path.unlink(missing_ok=True)
+            raise
+        finally:
+            temp_path.unlink(missing_ok=True)
+        self._matrix = None
+        self.vectors_path.unlink(missing_ok=True)
+        self._reset()
+        self.vectors_path = vectors_path
+        for key, item, start, count in records:
+            self._remember(key, item, start, count)
+        self._map(max(self.rows, MIN_CAPACITY))
+
+    def truncate_to_size(self, max_size: int, target_size: Optional[int] = None) -> int:
+        """Once the rows take `max_size` bytes, drop the oldest items for the live ones to take less than `target_size`
+
+        `target_size` is three quarters of `max_size` by default, as for the message history. The index is compacted
+        right after, returns how many items were dropped.
+        """
+        if self.rows * self.row_size < max_size:
+            return 0
+        size = self.live_rows * self.row_size
+        target_size = max_size * 3 // 4 if target_size is None else target_size
+        count = 0
+        for item_id in sorted(self.keys.values()):
+            if size < target_size:
+                break
+            size -= self.counts[item_id] * self.row_size
+            # Not recorded, the compaction rewrites the items without it
+            self._forget(item_id)
+            count += 1
+        self.compact()
+        return count
+
+    def get_vectors(self, item_id: int) -> np.ndarray:
+        start = self.starts[item_id]
+        return np.array(self._matrix[start : start + self.counts[item_id]])
+
+    def iter_items(self) -> Iterator[tuple[int, dict]]:
+        for item_id in sorted(self.keys.values()):
+            yield item_id, self.items[item_id]
+
+    def search(self, query: np.ndarray, k: int) -> list[tuple[int, float, np.ndarray]]:
+        """The `k` items most similar to `query`, best first, with their score and the score of each of their rows
+
+        An item scores as much as its most similar row.
+        """
+        if not self.keys or k < 1:
+            return []
+        query = normalize(np.atleast_2d(np.asarray(query, dtype=DTYPE)))[0]
+        scores = np.asarray(self._matrix[: self.rows] @ query)
+        # Rows of removed items are scored along and dropped after, the segments have to cover all the rows
+        item_scores = np.maximum.reduceat(scores, np.asarray(self.starts))
+        live = np.fromiter(sorted(self.keys.values()), dtype=np.int64)
+        live_scores = item_scores[live]
+        if k < len(live):
+            top = np.argpartition(-live_scores, k - 1)[:k]
+        else:
+            top = np.arange(len(live))
+        top = top[np.argsort(-live_scores[top], kind="stable")]
+        results = []
+        for i in top:
+            item_id = int(live[i])
+            start = self.starts[item_id]
+            results.append((item_id, float(live_scores[i]), scores[start : start + self.counts[item_id]]))
+        return results
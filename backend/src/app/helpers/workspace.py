@@ -0,0 +1,140 @@
+import base64
+import hashlib
+import heapq
+import os
+import stat
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Container, Iterable, Iterator, Optional, Union
+
+import orjson
+
+SORT_KEYS: dict[str, Callable[["WorkspaceEntry"], tuple]] = {
+    "name": lambda entry: (entry.path,),
+    "size": lambda entry: (entry.st.st_size, entry.path),
+    "mtime": lambda entry: (entry.st.st_mtime_ns, entry.path),
+}
+
+
+@dataclass(frozen=True)
+class WorkspaceEntry:
+    path: str
+    name: str
+    st: os.stat_result
+
+    @property
+    def is_dir(self) -> bool:
+        return stat.S_ISDIR(self.st.st_mode)
+
+
+@dataclass
+class WorkspacePage:
+    entries: list[WorkspaceEntry]
+    next_cursor: Optional[str] = None
+    fingerprint: str = field(init=False)
+
+    def __post_init__(self) -> None:
+        self.fingerprint = fingerprint_entries(self.entries)
+
+
+def scan_directory(
+    root: Union[str, Path],
+    path: Union[str, Path],
+    exclude: Container[str] = (),
+    depth: int = 1,
+    follow_symlinks: bool = True,
+) -> Iterator[WorkspaceEntry]:
+    """Entries under `path` down to `depth` levels, with paths relative to `root`
+
+    Uses the stat results `os.scandir` already has, so it's a single `stat` per entry at most. Symlinked directories
+    are listed but not descended into. Without `follow_symlinks` symlinks are described by themselves rather than by
+    their targets. Entries that vanish while scanning are skipped.
+    """
+    stack = [(os.fspath(path), 1)]
+    while stack:
+        directory, level = stack.pop()
+        prefix = os.path.relpath(directory, root)
+        prefix = "" if prefix == "." else f"{prefix}/"
+        try:
+            entries = os.scandir(directory)
+        except (FileNotFoundError, NotADirectoryError, PermissionError):
+            continue
+        with entries:
+            for entry in entries:
+                if entry.name in exclude:
+                    continue
+                try:
+                    st = entry.stat(follow_symlinks=follow_symlinks)
+                except OSError:
+                    try:
+                        # Dangling symlink
+                        st = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+                yield WorkspaceEntry(f"{prefix}{entry.name}", entry.name, st)
+                if level < depth and entry.is_dir(follow_symlinks=False):
+                    stack.append((entry.path, level + 1))
+
+
+def encode_cursor(sort: str, order: str, key: tuple) -> str:
+    return base64.urlsafe_b64encode(orjson.dumps([sort, order, *key])).decode()
+
+
+def decode_cursor(cursor: str, sort: str, order: str) -> tuple:
+    """Sort key of the last entry of the previous page, ValueError if the cursor isn't one of this sort and order"""
+    try:
+        data: list[Any] = orjson.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, orjson.JSONDecodeError) as e:
+        raise ValueError("Malformed cursor") from e
+    if not isinstance(data, list) or data[:2] != [sort, order]:
+        raise ValueError("Cursor doesn't match the sort order")
+    return tuple(data[2:])
+
+
+def fingerprint_entries(entries: Iterable[WorkspaceEntry]) -> str:
+    """Hash of the path, type, inode, size and mtime of every entry, in order
+
+    It changes whenever a listed file is added, removed, renamed or rewritten, without reading any file contents.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for entry in entries:
+        st = entry.st
+        item = f"{entry.path}\0{st.st_mode}\0{st.st_ino}\0{st.st_size}\0{st.st_mtime_ns}\n"
+        digest.update(item.encode(errors="surrogateescape"))
+    return digest.hexdigest()
+
+
+def list_workspace(
+    root: Union[str, Path],
+    path: Union[str, Path],
+    exclude: Container[str] = (),
+    sort: str = "name",
+    order: str = "asc",
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    depth: int = 1,
+) -> WorkspacePage:
+    """A page of `limit` entries under `path` sorted by name (relative path), size or mtime, after `cursor`
+
+    Pagination is keyset based: the cursor is the sort key of the last entry of the previous page, so files added or
+    removed meanwhile don't shift pages. Only the requested page is kept sorted in memory.
+    """
+    if any(part in exclude for part in Path(path).relative_to(root).parts):
+        return WorkspacePage([])
+    key = SORT_KEYS[sort]
+    is_reverse = order == "desc"
+    entries: Iterable[WorkspaceEntry] = scan_directory(root, path, exclude, depth)
+    if cursor:
+        after = decode_cursor(cursor, sort, order)
+        if is_reverse:
+            entries = (entry for entry in entries if key(entry) < after)
+        else:
+            entries = (entry for entry in entries if key(entry) > after)
+    if limit is None:
+        return WorkspacePage(sorted(entries, key=key, reverse=is_reverse))
+    select = heapq.nlargest if is_reverse else heapq.nsmallest
+    page = select(limit + 1, entries, key=key)
+    if len(page) <= limit:
+        return WorkspacePage(page)
+    page = page[:limit]
+    return WorkspacePage(page, encode_cursor(sort, order, key(page[-1])))
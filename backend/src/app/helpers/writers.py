@@ -0,0 +1,149 @@
+import asyncio
+import time
+from pathlib import Path
+from typing import IO, Awaitable, Callable, Optional, Union
+
+import anyio
+from loguru import logger
+
+from app.helpers.line_index import LineIndex
+from app.helpers.rotation import compress_segment, rotate_log, should_rotate
+
+
+class LogWriter:
+    """Append agent output to a log file in batches
+
+    Lines are buffered and written with a single thread hop once `flush_size` bytes are pending or the oldest pending
+    line is `flush_interval` seconds old. Consecutive carriage return lines (progress bars) are collapsed into the first
+    one. Use it as an async context manager, everything pending is flushed on exit.
+
+    Every written batch of lines is also passed to `publish` if it is set. With `index` the line index sidecar of the
+    log is kept up to date as well, it's flushed every `index_flush_interval` seconds and on exit.
+
+    The log is rotated on open if it's `rotate_size` bytes or more or wasn't written to for `rotate_age` seconds, and
+    after any write that takes it past `rotate_size`. Rotated segments are compressed in the background, only
+    `rotate_keep` of them are kept, see `app.helpers.rotation`.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        flush_size: int = 64 * 1024,
+        flush_interval: float = 0.5,
+        publish: Optional[Callable[[list[bytes]], Awaitable[None]]] = None,
+        index: bool = False,
+        index_flush_interval: float = 5.0,
+        rotate_size: int = 0,
+        rotate_age: float = 0,
+        rotate_keep: int = 5,
+    ):
+        self.path = Path(path)
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.publish = publish
+        self.index = index
+        self.index_flush_interval = index_flush_interval
+        self.rotate_size = rotate_size
+        self.rotate_age = rotate_age
+        self.rotate_keep = rotate_keep
+        self._line_index: Optional[LineIndex] = None
+        self._lines: list[bytes] = []
+        self._size = 0
+        self._file: Optional[IO[bytes]] = None
+        self._lock = asyncio.Lock()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        self._compress_task: Optional[asyncio.Task] = None
+        self._is_carriage = False
+
+    async def __aenter__(self) -> "LogWriter":
+        if await anyio.to_thread.run_sync(should_rotate, self.path, self.rotate_size, self.rotate_age):
+            await self._rotate()
+        else:
+            await anyio.to_thread.run_sync(self._open)
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        try:
+            if self._flush_task:
+                await self._flush_task
+            await self.flush()
+            if self._line_index:
+                await anyio.to_thread.run_sync(self._line_index.flush)
+        finally:
+            await anyio.to_thread.run_sync(self._file.close)
+            if self._compress_task:
+                await self._compress_task
+
+    async def write(self, line: bytes) -> None:
+        if b"\r" in line:
+            if self._is_carriage:
+                return
+            self._is_carriage = True
+        else:
+            self._is_carriage = False
+        self._lines.append(line)
+        self._size += len(line)
+        if self._size >= self.flush_size:
+            await self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.flush_interval, self._flush_later)
+
+    def _flush_later(self) -> None:
+        self._timer = None
+        self._flush_task = asyncio.create_task(self.flush())
+
+    def _open(self) -> None:
+        self._file = open(self.path, "ab")
+        if self.index:
+            self._line_index = LineIndex.open(self.path)
+
+    def _reopen_rotated(self) -> Optional[Path]:
+        if self._file:
+            self._file.close()
+        segment_path = rotate_log(self.path, self.rotate_keep)
+        self._open()
+        return segment_path
+
+    async def _compress(self, segment_path: Path) -> None:
+        try:
+            await anyio.to_thread.run_sync(compress_segment, segment_path)
+        except Exception as e:
+            # The segment stays readable uncompressed
+            logger.warning(f"Failed to compress log segment {segment_path}: {e}")
+
+    async def _rotate(self) -> None:
+        if self._compress_task:
+            # The previous segment is about to be shifted, let it settle first
+            await self._compress_task
+            self._compress_task = None
+        segment_path = await anyio.to_thread.run_sync(self._reopen_rotated)
+        if segment_path:
+            self._compress_task = asyncio.create_task(self._compress(segment_path))
+
+    def _write(self, data: bytes) -> bool:
+        """Write and index `data`, returns whether the log is due for rotation"""
+        start = self._file.tell()
+        self._file.write(data)
+        self._file.flush()
+        if self._line_index:
+            self._line_index.append(start, data)
+            if time.monotonic() - self._line_index.flushed_at >= self.index_flush_interval:
+                self._line_index.flush()
+        return bool(self.rotate_size) and start + len(data) >= self.rotate_size
+
+    async def flush(self) -> None:
+        async with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._lines:
+                return
+            lines = self._lines
+            self._lines = []
+            self._size = 0
+            is_full = await anyio.to_thread.run_sync(self._write, b"".join(lines))
+            if self.publish:
+                await self.publish(lines)
+            if is_full:
+                await self._rotate()
@@ -1,3 +1,4 @@
+from datetime import datetime
 from typing import Any
 
 from pydantic import BaseModel, Field
@@ -32,3 +33,39 @@ class WorkspaceFileSchema(BaseModel):
     is_dir: bool
     mime_type: str | None = None
     size: str | None = None
+    size_bytes: int | None = None
+    modified_at: datetime | None = None
+
+
+class UploadInCreateSchema(BaseModel):
+    name: str
+    path: str | None = None
+    size: int = Field(..., ge=0)
+
+
+class UploadSchema(BaseModel):
+    id: str
+    offset: int
+    size: int
+
+
+class WorkspaceUsageSchema(BaseModel):
+    size: str
+    size_bytes: int
+    files: int
+    quota_bytes: int | None = None
+    reconciled_at: datetime
+
+
+class BudgetSchema(BaseModel):
+    total_prompt_tokens: int = 0
+    total_completion_tokens: int = 0
+    total_cost: float = 0.0
+    total_budget: float = 0.0
+    embedding_cache_hits: int = 0
+    embedding_cache_misses: int = 0
+
+
+class HistorySchema(BaseModel):
+    messages: list[dict[str, Any]]
+    total: int
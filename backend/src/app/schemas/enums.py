@@ -31,3 +31,14 @@ class YesCount(IntEnum):
     c50 = 50
     c100 = 100
     c200 = 200
+
+
+class WorkspaceSort(str, Enum):
+    name = "name"
+    size = "size"
+    mtime = "mtime"
+
+
+class SortOrder(str, Enum):
+    asc = "asc"
+    desc = "desc"
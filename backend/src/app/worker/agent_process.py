@@ -0,0 +1,190 @@
+import asyncio
+import os
+import shlex
+import signal
+import socket
+import tempfile
+from pathlib import Path
+from typing import Protocol
+
+import orjson
+from loguru import logger
+
+from app.auto_gpt import cli, zygote
+from app.core import settings
+
+
+STREAM_LIMIT = 2**16
+ZYGOTE_START_TIMEOUT = 5 * 60
+
+
+class AgentProcess(Protocol):
+    pid: int
+    stdin: asyncio.StreamWriter | None
+    stdout: asyncio.StreamReader
+    stderr: asyncio.StreamReader | None
+
+    @property
+    def returncode(self) -> int | None:
+        ...
+
+    async def wait(self) -> int:
+        ...
+
+    def kill(self) -> None:
+        ...
+
+
+class ZygoteProcess:
+    """A forked agent, mimics the part of `asyncio.subprocess.Process` used by the worker"""
+
+    stderr = None
+
+    def __init__(
+        self,
+        pid: int,
+        stdin: asyncio.StreamWriter | None,
+        stdout: asyncio.StreamReader,
+        control: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+    ):
+        self.pid = pid
+        self.stdin = stdin
+        self.stdout = stdout
+        self._control = control
+        self._writer = writer
+        self._returncode: int | None = None
+
+    @property
+    def returncode(self) -> int | None:
+        return self._returncode
+
+    async def wait(self) -> int:
+        if self._returncode is None:
+            line = await self._control.readline()
+            self._returncode = orjson.loads(line)["returncode"] if line else -signal.SIGKILL
+            self._writer.close()
+            if self.stdin:
+                self.stdin.close()
+        return self._returncode
+
+    def kill(self) -> None:
+        try:
+            # The child is a session leader, so its own subprocesses (browsers, shells) go down with it
+            os.killpg(self.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+
+class Zygote:
+    """Worker side of the fork server from `app.auto_gpt.zygote`"""
+
+    def __init__(self) -> None:
+        self.socket_path = Path(tempfile.mkdtemp(prefix="auto-gpt-zygote-")) / "zygote.sock"
+        self.proc: asyncio.subprocess.Process | None = None
+        self._lock = asyncio.Lock()
+
+    async def start(self) -> None:
+        self.proc = await asyncio.create_subprocess_exec(
+            *shlex.split(settings.PYTHON_BINARY),
+            zygote.__file__,
+            "--socket",
+            str(self.socket_path),
+            stdout=asyncio.subprocess.PIPE,
+            env=build_base_env(),
+        )
+        ready = await asyncio.wait_for(self.proc.stdout.readline(), timeout=ZYGOTE_START_TIMEOUT)
+        if ready.strip() != b"ready":
+            raise RuntimeError(f"Fork server failed to start, exit code: {await self.proc.wait()}")
+        logger.info(f"Fork server is ready at {self.socket_path}")
+
+    async def ensure_started(self) -> None:
+        """Start the fork server again if it died, killed for memory or crashed"""
+        async with self._lock:
+            if self.proc is None or self.proc.returncode is not None:
+                if self.proc is not None:
+                    logger.warning(f"Fork server exited with code {self.proc.returncode}, restarting it")
+                await self.start()
+
+    async def stop(self) -> None:
+        if self.proc and self.proc.returncode is None:
+            self.proc.terminate()
+            await self.proc.wait()
+        self.socket_path.unlink(missing_ok=True)
+        self.socket_path.parent.rmdir()
+
+    async def spawn(self, args: list[str], env: dict[str, str | None], interactive: bool = False) -> ZygoteProcess:
+        """Fork an agent, raises `OSError` or `RuntimeError` if the fork server can't"""
+        await self.ensure_started()
+        loop = asyncio.get_running_loop()
+        stdout_r, stdout_w = os.pipe()
+        if interactive:
+            stdin_fd, stdin_w = os.pipe()
+        else:
+            stdin_fd, stdin_w = os.open(os.devnull, os.O_RDONLY), None
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            # Local unix socket and a small payload, blocking here costs next to nothing
+            sock.connect(str(self.socket_path))
+            request = orjson.dumps({"args": args, "env": env, "cwd": os.getcwd()})
+            socket.send_fds(sock, [request], [stdin_fd, stdout_w])
+        except BaseException:
+            sock.close()
+            os.close(stdout_r)
+            if stdin_w is not None:
+                os.close(stdin_w)
+            raise
+        finally:
+            os.close(stdin_fd)
+            os.close(stdout_w)
+        sock.setblocking(False)
+        control, writer = await asyncio.open_unix_connection(sock=sock)
+        stdout = asyncio.StreamReader(limit=STREAM_LIMIT)
+        stdout_transport, _ = await loop.connect_read_pipe(
+            lambda: asyncio.StreamReaderProtocol(stdout), os.fdopen(stdout_r, "rb", buffering=0)
+        )
+        stdin = None
+        if stdin_w is not None:
+            transport, protocol = await loop.connect_write_pipe(
+                asyncio.streams.FlowControlMixin, os.fdopen(stdin_w, "wb", buffering=0)
+            )
+            stdin = asyncio.StreamWriter(transport, protocol, None, loop)
+        line = await control.readline()
+        # Nothing if the fork server died meanwhile
+        response = orjson.loads(line) if line else {"error": "the fork server closed the connection"}
+        if "pid" not in response:
+            writer.close()
+            stdout_transport.close()
+            if stdin:
+                stdin.close()
+            raise RuntimeError(f"Fork server failed to spawn an agent: {response.get('error')}")
+        return ZygoteProcess(response["pid"], stdin, stdout, control, writer)
+
+
+def build_base_env() -> dict[str, str]:
+    env = {"PATH": os.environ.get("PATH", "")}
+    if "PYTHONPATH" in os.environ:
+        env["PYTHONPATH"] = os.environ["PYTHONPATH"]
+    return env
+
+
+async def spawn_agent(
+    ctx: dict, args: list[str], env: dict[str, str | None], interactive: bool = False
+) -> AgentProcess:
+    """Start an Auto-GPT agent, forked from the fork server if the worker runs one
+
+    With `interactive` the agent gets a stdin pipe, used to drive multi-cycle runs. If the fork server fails, even
+    after a restart, the agent is started from scratch instead.
+    """
+    if ctx.get("zygote"):
+        try:
+            return await ctx["zygote"].spawn(args, env, interactive=interactive)
+        except (OSError, RuntimeError) as e:
+            logger.warning(f"Falling back to a new interpreter, fork server failed: {e}")
+    return await asyncio.create_subprocess_shell(
+        f"{settings.PYTHON_BINARY} {cli.__file__} {shlex.join(args)}",
+        stdin=asyncio.subprocess.PIPE if interactive else None,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.STDOUT,
+        env=env,
+    )
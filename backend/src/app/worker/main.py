@@ -1,12 +1,13 @@
 import logging
 
-from arq import func
+from arq import cron, func
 from arq.connections import RedisSettings
 from loguru import logger
 from prisma import Prisma
 
 from app.core import settings, init_logging
-from .tasks import run_auto_gpt
+from .agent_process import Zygote
+from .tasks import reconcile_workspaces, run_auto_gpt
 
 
 prisma = Prisma(auto_register=True)
@@ -15,10 +16,15 @@ prisma = Prisma(auto_register=True)
 async def startup(ctx) -> None:
     await prisma.connect()
     init_logging.init_logging(level=logging.INFO)
+    if settings.AGENT_FORK_SERVER:
+        ctx["zygote"] = Zygote()
+        await ctx["zygote"].start()
     logger.info("Worker is ready")
 
 
 async def shutdown(ctx) -> None:
+    if ctx.get("zygote"):
+        await ctx["zygote"].stop()
     await prisma.disconnect()
 
 
@@ -28,6 +34,16 @@ class WorkerSettings:
     functions = [
         func(run_auto_gpt.run, name="run_auto_gpt", timeout=60 * 60 * 24),  # type: ignore
     ]
+    cron_jobs = []
+    if settings.WORKSPACE_USAGE_RECONCILE_MINUTES:
+        cron_jobs.append(
+            cron(
+                reconcile_workspaces.run,  # type: ignore
+                name="reconcile_workspaces",
+                minute=set(range(0, 60, settings.WORKSPACE_USAGE_RECONCILE_MINUTES)),
+                unique=True,
+            )
+        )
     on_startup = startup
     on_shutdown = shutdown
     redis_settings = RedisSettings.from_dsn(settings.REDIS_URL)
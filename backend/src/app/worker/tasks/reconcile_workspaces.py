@@ -0,0 +1,32 @@
+from loguru import logger
+from prisma.models import Bot
+
+from app.api.helpers.bots import build_workspace_path, stop_bot
+from app.core import globals, settings
+from app.helpers.usage import WorkspaceUsage, reconcile_usage
+
+
+async def reconcile_bot_workspace(bot: Bot) -> WorkspaceUsage | None:
+    try:
+        return await reconcile_usage(globals.arq_redis, bot.user_id, build_workspace_path(bot.user_id))
+    except Exception as e:
+        # The counters are only a cache, the next run or reconciliation fixes them
+        logger.warning(f"An error occurred while measuring workspace of bot {bot.id}: {e}")
+        return None
+
+
+def is_over_quota(usage: WorkspaceUsage | None) -> bool:
+    return bool(usage and settings.WORKSPACE_QUOTA and usage.size > settings.WORKSPACE_QUOTA)
+
+
+async def run(ctx) -> None:
+    """Measure workspaces of running bots and stop the bots over the quota
+
+    Agents write to their workspace directly, so only the workspaces of active bots drift away from their counters,
+    everything else goes through the API which keeps them up to date.
+    """
+    for bot in await Bot.prisma().find_many(where={"is_active": True}):
+        usage = await reconcile_bot_workspace(bot)
+        if is_over_quota(usage):
+            logger.info(f"Bot {bot.id} is over the workspace quota, stopping it")
+            await stop_bot(bot)
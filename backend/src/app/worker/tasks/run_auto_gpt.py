@@ -1,16 +1,26 @@
 import asyncio
 import os
+from functools import partial
 
-import anyio
 import yaml
-from asyncio import exceptions, streams
 from loguru import logger
 from prisma.models import Bot, User
 
-from app.api.helpers.bots import build_prompt_settings_path, build_workspace_path, build_settings_path, build_log_path
-from app.auto_gpt import cli
+from app.api.helpers.bots import (
+    build_embedding_cache_path,
+    build_log_path,
+    build_prompt_settings_path,
+    build_settings_path,
+    build_workspace_path,
+)
+from app.auto_gpt.cli import CONTINUE_COMMAND, CYCLE_DONE_MARKER
 from app.clients import AuthBackendClient, RequestType
 from app.core import globals, settings
+from app.helpers.log_streams import publish_log_lines
+from app.helpers.streams import LineSplitter
+from app.helpers.writers import LogWriter
+from app.worker.agent_process import AgentProcess, spawn_agent
+from app.worker.tasks.reconcile_workspaces import is_over_quota, reconcile_bot_workspace
 
 
 PROMPT_SETTINGS = dict(
@@ -38,181 +48,39 @@ PROMPT_SETTINGS = dict(
 )
 
 
-class ExtendedStreamReader(streams.StreamReader):
-    @classmethod
-    def cast(cls, some_a: streams.StreamReader):
-        """Cast an A into a MyA."""
-        assert isinstance(some_a, streams.StreamReader)
-        some_a.__class__ = cls
-        assert isinstance(some_a, ExtendedStreamReader)
-        return some_a
-
-    async def readline(self):
-        """Read chunk of data from the stream until newline (b'\n') is found.
-
-        On success, return chunk that ends with newline. If only partial
-        line can be read due to EOF, return incomplete line without
-        terminating newline. When EOF was reached while no bytes read, empty
-        bytes object is returned.
-
-        If limit is reached, ValueError will be raised. In that case, if
-        newline was found, complete line including newline will be removed
-        from internal buffer. Else, internal buffer will be cleared. Limit is
-        compared against part of the line without newline.
-
-        If stream was paused, this function will automatically resume it if
-        needed.
-        """
-        sep = [b"\n", b"\r"]
-        seplen = len(sep)
-        try:
-            line = await self.readuntil(sep)
-        except exceptions.IncompleteReadError as e:
-            return e.partial
-        except exceptions.LimitOverrunError as e:
-            if self._buffer.startswith(sep, e.consumed):
-                del self._buffer[: e.consumed + seplen]
-            else:
-                self._buffer.clear()
-            self._maybe_resume_transport()
-            raise ValueError(e.args[0])
-        return line
-
-    async def readuntil(self, separator: bytes | list[bytes] = b"\n"):
-        """Read data from the stream until ``separator`` is found.
-        On success, the data and separator will be removed from the
-        internal buffer (consumed). Returned data will include the
-        separator at the end.
-        Configured stream limit is used to check result. Limit sets the
-        maximal length of data that can be returned, not counting the
-        separator.
-        If an EOF occurs and the complete separator is still not found,
-        an IncompleteReadError exception will be raised, and the internal
-        buffer will be reset.  The IncompleteReadError.partial attribute
-        may contain the separator partially.
-        If the data cannot be read because of over limit, a
-        LimitOverrunError exception  will be raised, and the data
-        will be left in the internal buffer, so it can be read again.
-        The ``separator`` may also be an iterable of separators. In this
-        case the return value will be the shortest possible that has any
-        separator as the suffix. For the purposes of LimitOverrunError,
-        the shortest possible separator is considered to be the one that
-        matched.
-        """
-        if isinstance(separator, bytes):
-            separator = [separator]
-        else:
-            # Makes sure shortest matches wins, and supports arbitrary iterables
-            separator = sorted(separator, key=len)
-        if not separator:
-            raise ValueError("Separator should contain at least one element")
-        min_seplen = len(separator[0])
-        max_seplen = len(separator[-1])
-        if min_seplen == 0:
-            raise ValueError("Separator should be at least one-byte string")
-
-        if self._exception is not None:
-            raise self._exception
-
-        # Consume whole buffer except last bytes, which length is
-        # one less than max_seplen. Let's check corner cases with
-        # separator[-1]='SEPARATOR':
-        # * we have received almost complete separator (without last
-        #   byte). i.e buffer='some textSEPARATO'. In this case we
-        #   can safely consume len(separator) - 1 bytes.
-        # * last byte of buffer is first byte of separator, i.e.
-        #   buffer='abcdefghijklmnopqrS'. We may safely consume
-        #   everything except that last byte, but this require to
-        #   analyze bytes of buffer that match partial separator.
-        #   This is slow and/or require FSM. For this case our
-        #   implementation is not optimal, since require rescanning
-        #   of data that is known to not belong to separator. In
-        #   real world, separator will not be so long to notice
-        #   performance problems. Even when reading MIME-encoded
-        #   messages :)
-
-        # `offset` is the number of bytes from the beginning of the buffer
-        # where there is no occurrence of any `separator`.
-        offset = 0
-
-        # Loop until we find a `separator` in the buffer, exceed the buffer size,
-        # or an EOF has happened.
-        while True:
-            buflen = len(self._buffer)
-
-            # Check if we now have enough data in the buffer for shortest
-            # separator to fit.
-            if buflen - offset >= min_seplen:
-                match_start = None
-                match_end = None
-                for sep in separator:
-                    isep = self._buffer.find(sep, offset)
-
-                    if isep != -1:
-                        # `separator` is in the buffer. `match_start` and
-                        # `match_end` will be used later to retrieve the
-                        # data.
-                        end = isep + len(sep)
-                        if match_end is None or end < match_end:
-                            match_end = end
-                            match_start = isep
-                if match_end is not None:
-                    break
-
-                # see upper comment for explanation.
-                offset = max(0, buflen + 1 - max_seplen)
-                if offset > self._limit:
-                    raise exceptions.LimitOverrunError("Separator is not found, and chunk exceed the limit", offset)
-
-            # Complete message (with full separator) may be present in buffer
-            # even when EOF flag is set. This may happen when the last chunk
-            # adds data which makes separator be found. That's why we check for
-            # EOF *after* inspecting the buffer.
-            if self._eof:
-                chunk = bytes(self._buffer)
-                self._buffer.clear()
-                raise exceptions.IncompleteReadError(chunk, None)
-
-            # _wait_for_data() will resume reading if stream was paused.
-            await self._wait_for_data("readuntil")
-
-        if match_start > self._limit:
-            raise exceptions.LimitOverrunError("Separator is found, but chunk is longer than limit", match_start)
-
-        chunk = self._buffer[:match_end]
-        del self._buffer[:match_end]
-        self._maybe_resume_transport()
-        return bytes(chunk)
-
-
-CMD = (
-    "{binary} "
-    "{cli_path} "
-    "-w {workspace_folder} "
-    "-C {settings_path} "
-    "-P {prompt_settings} "
-    "--max-cache-size={max_cache_size} "
-    "--skip-news "
-    "--skip-reprompt"
-)
-
-
-def build_command(bot: Bot):
+def build_command_args(bot: Bot) -> list[str]:
     ai_settings_path = build_settings_path(bot.user_id)
     with open(ai_settings_path, "w") as w:
         yaml.dump(bot.ai_settings, w)
     prompt_settings_path = build_prompt_settings_path(bot.user_id)
     with open(prompt_settings_path, "w") as w:
         yaml.dump(PROMPT_SETTINGS, w)
-    cmd = CMD.format(
-        binary=settings.PYTHON_BINARY,
-        cli_path=cli.__file__,
-        workspace_folder=build_workspace_path(bot.user_id),
-        settings_path=ai_settings_path,
-        prompt_settings=prompt_settings_path,
-        max_cache_size=settings.MAX_CACHE_SIZE,
-    )
-    return cmd
+    return [
+        "-w",
+        str(build_workspace_path(bot.user_id)),
+        "-C",
+        str(ai_settings_path),
+        "-P",
+        str(prompt_settings_path),
+        f"--max-cache-size={settings.MAX_CACHE_SIZE}",
+        f"--state-store={settings.AGENT_STATE_STORE}",
+        "--skip-news",
+        "--skip-reprompt",
+    ]
+
+
+async def finish_cycle(bot_id: int, proc: AgentProcess) -> bool:
+    """Account for a finished cycle of a multi-cycle run and tell the agent whether to go on"""
+    bot = await Bot.prisma().update(data={"runs_left": {"decrement": 1}}, where={"id": bot_id})
+    proceed = bool(bot and bot.is_active and bot.runs_left > 0)
+    try:
+        proc.stdin.write(f"{CONTINUE_COMMAND if proceed else 'stop'}\n".encode())
+        await proc.stdin.drain()
+    except (BrokenPipeError, ConnectionResetError):
+        # The agent is gone, its return code tells how the run ended
+        logger.warning(f"Bot {bot_id} exited before the next cycle")
+        return False
+    return proceed
 
 
 async def run(ctx, bot_id: int):
@@ -254,36 +122,63 @@ async def run(ctx, bot_id: int):
         else:
             value = str(value)
         env[k] = value
-    proc = await asyncio.create_subprocess_shell(
-        build_command(bot),
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.STDOUT,
-        env=env,
-    )
+    args = build_command_args(bot)
+    if settings.AGENT_MEMORY_BACKEND:
+        args.append(f"--use-memory={settings.AGENT_MEMORY_BACKEND}")
+    if settings.EMBEDDING_CACHE_SIZE:
+        args += [
+            f"--embedding-cache={build_embedding_cache_path()}",
+            f"--embedding-cache-size={settings.EMBEDDING_CACHE_SIZE}",
+        ]
+    single_process = settings.SINGLE_PROCESS_RUNS and bot.runs_left > 1
+    if single_process:
+        args.append(f"--cycles={bot.runs_left}")
+    try:
+        proc = await spawn_agent(ctx, args, env, interactive=single_process)
+    except OSError as e:
+        logger.error(f"Bot {bot.id} failed to start: {e}")
+        await Bot.prisma().update(
+            data={"is_failed": True, "is_active": False, "runs_left": 0, "worker_message_id": None},
+            where={"id": bot.id},
+        )
+        return None
     log_path = build_log_path(bot.user_id)
-    ExtendedStreamReader.cast(proc.stdout)
-    is_carriage = False
+    lines = LineSplitter(proc.stdout)
+    is_stopped = False
     buf: bytes | None = None
     prev_buf: bytes | None = None
     prev_prev_buf: bytes | None = None
-    async with (await anyio.open_file(log_path, "a+")) as w:
-        while proc.returncode is None:
-            prev_prev_buf = prev_buf
-            prev_buf = buf
-            buf = await proc.stdout.readline()
-            if not buf:
-                break
-            if b"\r" in buf:
-                if not is_carriage:
-                    is_carriage = True
-                    await w.write(buf.decode())
-                else:
+    try:
+        publish = partial(
+            publish_log_lines, globals.arq_redis, bot.id, maxlen=settings.TAIL_LOG_COUNT, ttl=settings.LOG_STREAM_TTL
+        )
+        log_writer = LogWriter(
+            log_path,
+            settings.LOG_FLUSH_SIZE,
+            settings.LOG_FLUSH_INTERVAL,
+            publish,
+            index=True,
+            rotate_size=settings.LOG_ROTATE_SIZE,
+            rotate_age=settings.LOG_ROTATE_AGE,
+            rotate_keep=settings.LOG_ROTATE_KEEP,
+        )
+        async with log_writer as w:
+            while proc.returncode is None:
+                line = await lines.readline()
+                if single_process and line.strip() == CYCLE_DONE_MARKER.encode():
+                    is_stopped = not await finish_cycle(bot.id, proc)
                     continue
-            else:
-                is_carriage = False
-            await w.write(buf.decode())
-            await w.flush()
-    await proc.wait()
+                prev_prev_buf = prev_buf
+                prev_buf = buf
+                buf = line
+                if not buf:
+                    break
+                await w.write(buf)
+        await proc.wait()
+    except asyncio.CancelledError:
+        proc.kill()
+        raise
+    usage = await reconcile_bot_workspace(bot)
     if proc.returncode != 0:
         logger.warning(f"Bot {bot.id} exited with non 0 return code: {proc.returncode}")
         await Bot.prisma().update(
@@ -300,8 +195,19 @@ async def run(ctx, bot_id: int):
             data={"is_active": False, "runs_left": 0, "worker_message_id": None}, where={"id": bot.id}
         )
         return None
+    if single_process:
+        # All cycles but the last one were accounted for in `finish_cycle`, and nothing is left to re-enqueue
+        data = {"worker_message_id": None}
+        if not is_stopped:
+            data["runs_left"] = {"decrement": 1}
+        await Bot.prisma().update(data=data, where={"id": bot.id})
+        return None
     await Bot.prisma().update(data={"runs_left": bot.runs_left - 1, "worker_message_id": None}, where={"id": bot.id})
     if bot.runs_left <= 1:
         return None
+    if is_over_quota(usage):
+        logger.info(f"Bot {bot.id} is over the workspace quota, not starting its next run")
+        await Bot.prisma().update(data={"is_active": False}, where={"id": bot.id})
+        return None
     job = await globals.arq_redis.enqueue_job("run_auto_gpt", bot_id=bot.id)
     await Bot.prisma().update(data={"worker_message_id": job.job_id}, where={"id": bot.id})
@@ -0,0 +1,56 @@
+"""Agent startup latency: fresh interpreter (`create_subprocess_shell`) vs the fork server.
+
+Every run starts the agent without an OpenAI key, so it exits right after Auto-GPT is imported and the config is
+built, which is exactly the part the fork server is meant to save. Run from the `src` directory inside the worker
+image:
+
+    python -m benchmarks.bench_agent_startup --runs 10
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from app.worker.agent_process import Zygote, build_base_env, spawn_agent
+
+
+ARGS = ["--skip-news", "--skip-reprompt"]
+
+
+async def measure(ctx: dict, runs: int) -> list[float]:
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        proc = await spawn_agent(ctx, ARGS, build_base_env())
+        while await proc.stdout.read(2**16):
+            pass
+        await proc.wait()
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def report(name: str, timings: list[float]) -> None:
+    print(
+        f"{name:<12} runs={len(timings):<4} "
+        f"mean={statistics.mean(timings) * 1000:9.1f}ms "
+        f"median={statistics.median(timings) * 1000:9.1f}ms "
+        f"min={min(timings) * 1000:9.1f}ms"
+    )
+
+
+async def main(runs: int) -> None:
+    report("subprocess", await measure({}, runs))
+    zygote = Zygote()
+    started = time.perf_counter()
+    await zygote.start()
+    print(f"fork server warm-up: {(time.perf_counter() - started) * 1000:.1f}ms")
+    try:
+        report("fork server", await measure({"zygote": zygote}, runs))
+    finally:
+        await zygote.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10)
+    asyncio.run(main(parser.parse_args().runs))
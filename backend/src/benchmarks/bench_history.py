@@ -0,0 +1,93 @@
+"""Message history persistence: rewriting the whole JSON document per message vs appending to the journal.
+
+Messages look like agent replies and command results, a couple of KiB each. Then the history is truncated under
+`--max-cache-size` like at agent startup: dropping a quarter of the messages per rewrite until it fits vs planning the
+cut from the record sizes and rewriting once.
+
+    python -m benchmarks.bench_history --messages 2000 --max-cache-size 1048576
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+import orjson
+
+from app.helpers.journal import HistoryJournal
+
+CONTENT = "The agent thought about the task and decided to browse a website. " * 30
+
+
+def build_message(i: int) -> dict:
+    return {"role": "assistant" if i % 2 else "system", "content": f"{i} {CONTENT}", "type": "ai_response"}
+
+
+def append_legacy(path: Path, count: int) -> None:
+    data = {"messages": [], "summary": "I was created", "last_trimmed_index": 0}
+    for i in range(count):
+        data["messages"].append(build_message(i))
+        with open(path, "wb") as f:
+            f.write(orjson.dumps(data))
+
+
+def append_journal(path: Path, count: int) -> None:
+    history = HistoryJournal(path)
+    history.rewrite([], {"summary": "I was created", "last_trimmed_index": 0})
+    for i in range(count):
+        history.append_message(build_message(i))
+        if i % 10 == 9:
+            history.write_state({"summary": f"Summary after {i} messages. {CONTENT}", "last_trimmed_index": i})
+            if history.needs_compaction:
+                history.rewrite([build_message(j) for j in range(i + 1)], history.state)
+    history.close()
+
+
+def truncate_legacy(path: Path, max_size: int) -> int:
+    history = HistoryJournal(path)
+    messages, state = history.load()
+    rewrites = 0
+    while path.stat().st_size >= max_size:
+        messages[:] = messages[(len(messages) // 4) or 1 :]
+        history.rewrite(messages, state)
+        rewrites += 1
+    return rewrites
+
+
+def truncate_planned(path: Path, max_size: int) -> int:
+    history = HistoryJournal(path)
+    messages, state = history.load()
+    if history.size < max_size:
+        return 0
+    history.rewrite(messages[history.plan_truncation(max_size * 3 // 4) :], state)
+    return 1
+
+
+def main(count: int, max_size: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, func, filename in (
+            ("rewrite", append_legacy, "history.json"),
+            ("journal", append_journal, "history.jsonl"),
+        ):
+            path = Path(tmp) / filename
+            started = time.perf_counter()
+            func(path, count)
+            elapsed = time.perf_counter() - started
+            print(f"{name:<8} {elapsed:8.3f}s {os.path.getsize(path) / 1024 / 1024:8.2f}MiB")
+        source = Path(tmp) / "history.jsonl"
+        for name, func in (("quarters", truncate_legacy), ("planned", truncate_planned)):
+            path = Path(tmp) / f"{name}.jsonl"
+            shutil.copyfile(source, path)
+            started = time.perf_counter()
+            rewrites = func(path, max_size)
+            elapsed = time.perf_counter() - started
+            print(f"{name:<8} {elapsed:8.3f}s {os.path.getsize(path) / 1024 / 1024:8.2f}MiB {rewrites} rewrites")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--max-cache-size", type=int, default=1024 * 1024)
+    args = parser.parse_args()
+    main(args.messages, args.max_cache_size)
@@ -0,0 +1,223 @@
+"""Line splitting throughput over synthetic agent output: the old `readuntil` based reader vs `LineSplitter`.
+
+    python -m benchmarks.bench_line_splitter --megabytes 50
+"""
+import argparse
+import asyncio
+import random
+import time
+from asyncio import exceptions, streams
+
+from app.helpers.streams import LineSplitter
+
+
+class LegacyStreamReader(streams.StreamReader):
+    @classmethod
+    def cast(cls, some_a: streams.StreamReader):
+        """Cast an A into a MyA."""
+        assert isinstance(some_a, streams.StreamReader)
+        some_a.__class__ = cls
+        assert isinstance(some_a, LegacyStreamReader)
+        return some_a
+
+    async def readline(self):
+        """Read chunk of data from the stream until newline (b'\n') is found.
+
+        On success, return chunk that ends with newline. If only partial
+        line can be read due to EOF, return incomplete line without
+        terminating newline. When EOF was reached while no bytes read, empty
+        bytes object is returned.
+
+        If limit is reached, ValueError will be raised. In that case, if
+        newline was found, complete line including newline will be removed
+        from internal buffer. Else, internal buffer will be cleared. Limit is
+        compared against part of the line without newline.
+
+        If stream was paused, this function will automatically resume it if
+        needed.
+        """
+        sep = [b"\n", b"\r"]
+        seplen = len(sep)
+        try:
+            line = await self.readuntil(sep)
+        except exceptions.IncompleteReadError as e:
+            return e.partial
+        except exceptions.LimitOverrunError as e:
+            if self._buffer.startswith(sep, e.consumed):
+                del self._buffer[: e.consumed + seplen]
+            else:
+                self._buffer.clear()
+            self._maybe_resume_transport()
+            raise ValueError(e.args[0])
+        return line
+
+    async def readuntil(self, separator: bytes | list[bytes] = b"\n"):
+        """Read data from the stream until ``separator`` is found.
+        On success, the data and separator will be removed from the
+        internal buffer (consumed). Returned data will include the
+        separator at the end.
+        Configured stream limit is used to check result. Limit sets the
+        maximal length of data that can be returned, not counting the
+        separator.
+        If an EOF occurs and the complete separator is still not found,
+        an IncompleteReadError exception will be raised, and the internal
+        buffer will be reset.  The IncompleteReadError.partial attribute
+        may contain the separator partially.
+        If the data cannot be read because of over limit, a
+        LimitOverrunError exception  will be raised, and the data
+        will be left in the internal buffer, so it can be read again.
+        The ``separator`` may also be an iterable of separators. In this
+        case the return value will be the shortest possible that has any
+        separator as the suffix. For the purposes of LimitOverrunError,
+        the shortest possible separator is considered to be the one that
+        matched.
+        """
+        if isinstance(separator, bytes):
+            separator = [separator]
+        else:
+            # Makes sure shortest matches wins, and supports arbitrary iterables
+            separator = sorted(separator, key=len)
+        if not separator:
+            raise ValueError("Separator should contain at least one element")
+        min_seplen = len(separator[0])
+        max_seplen = len(separator[-1])
+        if min_seplen == 0:
+            raise ValueError("Separator should be at least one-byte string")
+
+        if self._exception is not None:
+            raise self._exception
+
+        # Consume whole buffer except last bytes, which length is
+        # one less than max_seplen. Let's check corner cases with
+        # separator[-1]='SEPARATOR':
+        # * we have received almost complete separator (without last
+        #   byte). i.e buffer='some textSEPARATO'. In this case we
+        #   can safely consume len(separator) - 1 bytes.
+        # * last byte of buffer is first byte of separator, i.e.
+        #   buffer='abcdefghijklmnopqrS'. We may safely consume
+        #   everything except that last byte, but this require to
+        #   analyze bytes of buffer that match partial separator.
+        #   This is slow and/or require FSM. For this case our
+        #   implementation is not optimal, since require rescanning
+        #   of data that is known to not belong to separator. In
+        #   real world, separator will not be so long to notice
+        #   performance problems. Even when reading MIME-encoded
+        #   messages :)
+
+        # `offset` is the number of bytes from the beginning of the buffer
+        # where there is no occurrence of any `separator`.
+        offset = 0
+
+        # Loop until we find a `separator` in the buffer, exceed the buffer size,
+        # or an EOF has happened.
+        while True:
+            buflen = len(self._buffer)
+
+            # Check if we now have enough data in the buffer for shortest
+            # separator to fit.
+            if buflen - offset >= min_seplen:
+                match_start = None
+                match_end = None
+                for sep in separator:
+                    isep = self._buffer.find(sep, offset)
+
+                    if isep != -1:
+                        # `separator` is in the buffer. `match_start` and
+                        # `match_end` will be used later to retrieve the
+                        # data.
+                        end = isep + len(sep)
+                        if match_end is None or end < match_end:
+                            match_end = end
+                            match_start = isep
+                if match_end is not None:
+                    break
+
+                # see upper comment for explanation.
+                offset = max(0, buflen + 1 - max_seplen)
+                if offset > self._limit:
+                    raise exceptions.LimitOverrunError("Separator is not found, and chunk exceed the limit", offset)
+
+            # Complete message (with full separator) may be present in buffer
+            # even when EOF flag is set. This may happen when the last chunk
+            # adds data which makes separator be found. That's why we check for
+            # EOF *after* inspecting the buffer.
+            if self._eof:
+                chunk = bytes(self._buffer)
+                self._buffer.clear()
+                raise exceptions.IncompleteReadError(chunk, None)
+
+            # _wait_for_data() will resume reading if stream was paused.
+            await self._wait_for_data("readuntil")
+
+        if match_start > self._limit:
+            raise exceptions.LimitOverrunError("Separator is found, but chunk is longer than limit", match_start)
+
+        chunk = self._buffer[:match_end]
+        del self._buffer[:match_end]
+        self._maybe_resume_transport()
+        return bytes(chunk)
+
+
+def build_output(megabytes: int, long_lines: bool) -> bytes:
+    random.seed(0)
+    parts = []
+    size = 0
+    while size < megabytes * 1024 * 1024:
+        roll = random.random()
+        if roll < 0.6:
+            # tqdm/pip/webdriver-manager style progress bars
+            part = b"".join(f"Downloading: {i}%|{'#' * (i // 5)}| {i}/100\r".encode() for i in range(100)) + b"\n"
+        elif roll < 0.98 or not long_lines:
+            part = b"SYSTEM: Command browse_website returned: " + b"x" * random.randint(20, 400) + b"\n"
+        else:
+            # A long JSON reply, larger than the default 64 KiB stream limit
+            part = b'{"thoughts": "' + b"y" * random.randint(70_000, 200_000) + b'"}\n'
+        parts.append(part)
+        size += len(part)
+    return b"".join(parts)
+
+
+def feed(data: bytes, reader: asyncio.StreamReader, chunk: int = 2**16) -> None:
+    for i in range(0, len(data), chunk):
+        reader.feed_data(data[i : i + chunk])
+    reader.feed_eof()
+
+
+async def read_legacy(data: bytes) -> int:
+    reader = asyncio.StreamReader(limit=2**16)
+    LegacyStreamReader.cast(reader)
+    feed(data, reader)
+    count = 0
+    while await reader.readline():
+        count += 1
+    return count
+
+
+async def read_splitter(data: bytes) -> int:
+    reader = asyncio.StreamReader(limit=2**16)
+    feed(data, reader)
+    count = 0
+    async for _ in LineSplitter(reader):
+        count += 1
+    return count
+
+
+async def main(megabytes: int) -> None:
+    for long_lines in (False, True):
+        data = build_output(megabytes, long_lines)
+        print(f"{len(data) / 1024 / 1024:.1f} MiB of output, lines over 64 KiB: {long_lines}")
+        for name, func in (("readuntil", read_legacy), ("LineSplitter", read_splitter)):
+            started = time.perf_counter()
+            try:
+                count = await func(data)
+            except Exception as e:
+                print(f"  {name:<14} failed: {e!r}")
+                continue
+            elapsed = time.perf_counter() - started
+            print(f"  {name:<14} {len(data) / 1024 / 1024 / elapsed:8.1f} MiB/s  {count / elapsed:12,.0f} lines/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--megabytes", type=int, default=50)
+    asyncio.run(main(parser.parse_args().megabytes))
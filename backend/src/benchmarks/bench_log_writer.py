@@ -0,0 +1,63 @@
+"""Lines per second written to a bot log: per line write + flush vs `LogWriter`.
+
+    python -m benchmarks.bench_log_writer --lines 100000
+"""
+import argparse
+import asyncio
+import tempfile
+import time
+from pathlib import Path
+
+import anyio
+
+from app.helpers.writers import LogWriter
+
+
+def build_lines(count: int) -> list[bytes]:
+    # Roughly what a Selenium/pip heavy run looks like: regular lines mixed with progress bars
+    lines = []
+    for i in range(count):
+        if i % 10 < 3:
+            lines.append(f"Downloading chunk {i}: {i % 100}%\r".encode())
+        else:
+            lines.append(f"SYSTEM: Command browse_website returned: line {i} of the page content\n".encode())
+    return lines
+
+
+async def write_per_line(path: Path, lines: list[bytes]) -> None:
+    is_carriage = False
+    async with await anyio.open_file(path, "a+") as w:
+        for buf in lines:
+            if b"\r" in buf:
+                if not is_carriage:
+                    is_carriage = True
+                    await w.write(buf.decode())
+                else:
+                    continue
+            else:
+                is_carriage = False
+            await w.write(buf.decode())
+            await w.flush()
+
+
+async def write_buffered(path: Path, lines: list[bytes]) -> None:
+    async with LogWriter(path) as w:
+        for buf in lines:
+            await w.write(buf)
+
+
+async def main(count: int) -> None:
+    lines = build_lines(count)
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, func in (("per line", write_per_line), ("LogWriter", write_buffered)):
+            path = Path(tmp) / f"{name}.log"
+            started = time.perf_counter()
+            await func(path, lines)
+            elapsed = time.perf_counter() - started
+            print(f"{name:<10} {count / elapsed:12,.0f} lines/s  {elapsed:8.3f}s  {path.stat().st_size:,} bytes")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, default=100_000)
+    asyncio.run(main(parser.parse_args().lines))
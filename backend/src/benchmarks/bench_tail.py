@@ -0,0 +1,121 @@
+"""Tail latency: the old backwards block reader vs the memory mapped `tail_as_text`.
+
+With `--gzip` the files are compressed with `compress_log` and a plain read through of the gzip file is compared to
+decompressing from the closest flush points.
+
+Covers file sizes from KiB to GiB and several line length distributions. Files are generated once into a temporary
+directory, use `--max-size` to limit how big they get (1 GiB takes a while to write).
+
+    python -m benchmarks.bench_tail --lines 5000 --max-size 1G
+    python -m benchmarks.bench_tail --lines 5000 --max-size 256M --gzip
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable
+
+from app.helpers.compression import build_checkpoints_path, compress_log
+from app.helpers.readers import tail_as_text
+
+
+SIZES = {"64K": 64 * 1024, "1M": 1024**2, "16M": 16 * 1024**2, "256M": 256 * 1024**2, "1G": 1024**3}
+DISTRIBUTIONS: dict[str, Callable[[random.Random], int]] = {
+    "short": lambda rnd: rnd.randint(40, 120),
+    "mixed": lambda rnd: int(rnd.paretovariate(1.2) * 60),
+    "long": lambda rnd: rnd.randint(2_000, 20_000),
+}
+
+
+def legacy_tail_as_text(path: Path, lines: int = 1, _buffer: int = 4098) -> str:
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        block_end_byte = f.tell()
+        lines_to_go = lines
+        block_number = -1
+        blocks = []
+        while lines_to_go > 0 and block_end_byte > 0:
+            if block_end_byte - _buffer > 0:
+                f.seek(block_number * _buffer, os.SEEK_END)
+                blocks.append(f.read(_buffer))
+            else:
+                f.seek(0, 0)
+                blocks.append(f.read(block_end_byte))
+            lines_found = blocks[-1].count(b"\n")
+            lines_to_go -= lines_found
+            block_end_byte -= _buffer
+            block_number -= 1
+        all_read_text = b"".join(reversed(blocks))
+        return "\n".join(row.decode() for row in all_read_text.splitlines()[-lines:])
+
+
+def read_through_tail_as_text(path: Path, lines: int = 1) -> str:
+    checkpoints_path = build_checkpoints_path(path)
+    hidden_path = checkpoints_path.with_suffix(".hidden")
+    checkpoints_path.rename(hidden_path)
+    try:
+        return tail_as_text(path, lines)
+    finally:
+        hidden_path.rename(checkpoints_path)
+
+
+def generate(path: Path, size: int, line_length: Callable[[random.Random], int]) -> None:
+    rnd = random.Random(0)
+    pool = os.urandom(1024 * 1024).hex().encode()
+    written = 0
+    with open(path, "wb") as f:
+        while written < size:
+            length = min(line_length(rnd), len(pool) - 1)
+            start = rnd.randrange(len(pool) - length)
+            row = pool[start : start + length] + b"\n"
+            f.write(row)
+            written += len(row)
+
+
+def measure(func: Callable[[Path, int], str], path: Path, lines: int, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(path, lines)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main(lines: int, max_size: str, repeat: int, use_gzip: bool) -> None:
+    sizes = {name: size for name, size in SIZES.items() if size <= SIZES[max_size]}
+    with tempfile.TemporaryDirectory() as tmp:
+        if use_gzip:
+            print(f"{'size':>6} {'lines':>7} {'read through':>14} {'seek':>10} {'speedup':>8}")
+        else:
+            print(f"{'size':>6} {'lines':>7} {'block reader':>14} {'mmap':>10} {'speedup':>8}")
+        for size_name, size in sizes.items():
+            for dist_name, line_length in DISTRIBUTIONS.items():
+                path = Path(tmp) / f"{size_name}-{dist_name}.log"
+                generate(path, size, line_length)
+                if use_gzip:
+                    gz_path = path.with_name(f"{path.name}.gz")
+                    compress_log(path, gz_path)
+                    path.unlink()
+                    path = gz_path
+                    legacy = measure(read_through_tail_as_text, path, lines, repeat)
+                else:
+                    legacy = measure(legacy_tail_as_text, path, lines, repeat)
+                current = measure(tail_as_text, path, lines, repeat)
+                print(
+                    f"{size_name:>6} {dist_name:>7} {legacy * 1000:12.2f}ms {current * 1000:8.2f}ms "
+                    f"{legacy / current:7.1f}x"
+                )
+                path.unlink()
+                build_checkpoints_path(path).unlink(missing_ok=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, default=5000)
+    parser.add_argument("--max-size", choices=list(SIZES), default="256M")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--gzip", action="store_true", help="Tail gzip logs written by compress_log")
+    args = parser.parse_args()
+    main(args.lines, args.max_size, args.repeat, args.gzip)
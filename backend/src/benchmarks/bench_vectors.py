@@ -0,0 +1,71 @@
+"""Vector memory search: scoring memories one by one like Auto-GPT providers do vs one product over the memmap matrix.
+
+Every memory has a summary and a few chunk embeddings of `--dim` dimensions, made by `hash_embedding` so no model is
+needed. Loading the index from disk, as every agent run does, is timed too.
+
+    python -m benchmarks.bench_vectors --memories 5000 --chunks 4 --queries 20
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from app.helpers.vectors import VectorIndex, hash_embedding
+
+WORDS = "agent browse website file write read search code task result error goal plan memory summary".split()
+
+
+def build_text(rng: np.random.Generator) -> str:
+    return " ".join(rng.choice(WORDS, 12))
+
+
+def search_one_by_one(memories: list[np.ndarray], query: np.ndarray, k: int) -> list[int]:
+    scores = []
+    for vectors in memories:
+        row_scores = [float(np.dot(v, query) / (np.linalg.norm(v) * np.linalg.norm(query))) for v in vectors]
+        scores.append(max(row_scores))
+    return list(np.argsort(scores)[-k:][::-1])
+
+
+def main(count: int, chunks: int, dim: int, queries: int, k: int) -> None:
+    rng = np.random.default_rng(0)
+    memories = [
+        np.vstack([hash_embedding(build_text(rng), dim) for _ in range(chunks + 1)]).astype(np.float32)
+        for _ in range(count)
+    ]
+    query_vectors = [hash_embedding(build_text(rng), dim) for _ in range(queries)]
+    with tempfile.TemporaryDirectory() as tmp:
+        index = VectorIndex(Path(tmp), dim)
+        index.load()
+        started = time.perf_counter()
+        for i, vectors in enumerate(memories):
+            index.add(str(i), vectors, {"i": i})
+        print(f"{'add':<12} {time.perf_counter() - started:8.3f}s")
+
+        started = time.perf_counter()
+        index = VectorIndex(Path(tmp), dim)
+        index.load()
+        print(f"{'load':<12} {time.perf_counter() - started:8.3f}s")
+
+        started = time.perf_counter()
+        for query in query_vectors:
+            search_one_by_one(memories, query, k)
+        print(f"{'one by one':<12} {(time.perf_counter() - started) / queries * 1000:8.2f}ms per query")
+
+        started = time.perf_counter()
+        for query in query_vectors:
+            index.search(query, k)
+        print(f"{'matrix':<12} {(time.perf_counter() - started) / queries * 1000:8.2f}ms per query")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--memories", type=int, default=5000)
+    parser.add_argument("--chunks", type=int, default=4)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("-k", type=int, default=5)
+    args = parser.parse_args()
+    main(args.memories, args.chunks, args.dim, args.queries, args.k)
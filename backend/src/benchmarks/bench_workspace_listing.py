@@ -0,0 +1,62 @@
+"""Workspace listing MIME types: `magic.from_file` per file vs `MimeCache`, cold and warm.
+
+The workspace is a flat directory of text, JSON, HTML, PNG and binary files, like the output of a scraping run.
+
+    python -m benchmarks.bench_workspace_listing --files 10000
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import magic
+
+from app.helpers.mime import MimeCache
+
+CONTENTS = [
+    b"Plain notes about the task\n" * 20,
+    b'{"url": "https://example.com", "title": "Example"}\n',
+    b"<!DOCTYPE html><html><head><title>Page</title></head><body>scraped</body></html>\n",
+    b"\x89PNG\r\n\x1a\n" + b"\x00" * 512,
+]
+
+
+def generate(path: Path, count: int) -> None:
+    path.mkdir()
+    for i in range(count):
+        content = CONTENTS[i % len(CONTENTS)] if i % 5 else os.urandom(1024)
+        (path / f"file_{i:05}").write_bytes(content)
+
+
+def list_legacy(path: Path) -> list[str | None]:
+    return [magic.from_file(f, mime=True) if not f.is_dir() else None for f in path.glob("*")]
+
+
+async def list_cached(path: Path, cache_path: Path) -> list[str | None]:
+    cache = MimeCache.load(cache_path)
+    mime_types = await cache.get_mime_types([(f, f.stat()) for f in path.glob("*")])
+    cache.save()
+    return mime_types
+
+
+async def main(count: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        workspace = Path(tmp) / "workspace"
+        cache_path = Path(tmp) / "mime.json"
+        generate(workspace, count)
+        started = time.perf_counter()
+        expected = list_legacy(workspace)
+        print(f"{'from_file':<10} {time.perf_counter() - started:8.3f}s")
+        for name in ("cold cache", "warm cache"):
+            started = time.perf_counter()
+            mime_types = await list_cached(workspace, cache_path)
+            print(f"{name:<10} {time.perf_counter() - started:8.3f}s")
+            assert mime_types == expected
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=10_000)
+    asyncio.run(main(parser.parse_args().files))
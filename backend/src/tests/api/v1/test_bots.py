@@ -0,0 +1,75 @@
+from pathlib import Path
+
+import orjson
+import pytest
+from async_asgi_testclient import TestClient
+
+from app.core import settings
+from app.helpers.journal import HistoryJournal
+from app.helpers.state_store import StateStore, build_state_store_path
+
+
+pytestmark = pytest.mark.asyncio
+
+# The user the routes get without auth
+USER_ID = 1
+
+
+@pytest.fixture
+def cache_path(tmp_path: Path, monkeypatch) -> Path:
+    monkeypatch.setattr(settings, "WORKSPACES_DIR", tmp_path)
+    path = tmp_path / f"user_{USER_ID}" / ".gpt_cache"
+    path.mkdir(parents=True)
+    return path
+
+
+def build_message(i: int) -> dict:
+    return {"role": "user", "content": f"message {i}"}
+
+
+async def test_get_bot_budget_empty(async_client: TestClient, with_no_auth, cache_path: Path):
+    r = await async_client.get(f"{settings.API_V1_STR}/bots/budget")
+    assert 200 == r.status_code
+    assert 0 == r.json()["total_cost"]
+
+
+async def test_get_bot_budget_json(async_client: TestClient, with_no_auth, cache_path: Path):
+    budget = {"total_prompt_tokens": 10, "total_completion_tokens": 5, "total_cost": 0.5, "total_budget": 1.0}
+    (cache_path / f"{settings.MEMORY_INDEX}-budget.json").write_bytes(orjson.dumps(budget))
+    r = await async_client.get(f"{settings.API_V1_STR}/bots/budget")
+    assert 200 == r.status_code
+    assert {**budget, "embedding_cache_hits": 0, "embedding_cache_misses": 0} == r.json()
+
+
+async def test_get_bot_budget_sqlite(async_client: TestClient, with_no_auth, cache_path: Path):
+    store = StateStore(build_state_store_path(cache_path, settings.MEMORY_INDEX))
+    store.set_budget({"total_prompt_tokens": 10, "total_cost": 0.5, "embedding_cache_hits": 3})
+    r = await async_client.get(f"{settings.API_V1_STR}/bots/budget")
+    store.close()
+    assert 200 == r.status_code
+    assert 0.5 == r.json()["total_cost"]
+    assert 3 == r.json()["embedding_cache_hits"]
+
+
+async def test_get_bot_history_json(async_client: TestClient, with_no_auth, cache_path: Path):
+    journal = HistoryJournal(cache_path / f"{settings.MEMORY_INDEX}-history.jsonl")
+    journal.rewrite([build_message(i) for i in range(5)], {"summary": "", "last_trimmed_index": 0})
+    journal.close()
+    r = await async_client.get(f"{settings.API_V1_STR}/bots/history", query_string={"offset": 1, "limit": 2})
+    assert 200 == r.status_code
+    assert {"messages": [build_message(1), build_message(2)], "total": 5} == r.json()
+
+
+async def test_get_bot_history_sqlite(async_client: TestClient, with_no_auth, cache_path: Path):
+    store = StateStore(build_state_store_path(cache_path, settings.MEMORY_INDEX))
+    for i in range(5):
+        store.append_message(build_message(i))
+    r = await async_client.get(f"{settings.API_V1_STR}/bots/history", query_string={"offset": 3})
+    store.close()
+    assert 200 == r.status_code
+    assert {"messages": [build_message(3), build_message(4)], "total": 5} == r.json()
+
+
+async def test_get_bot_history_limit(async_client: TestClient, with_no_auth, cache_path: Path):
+    r = await async_client.get(f"{settings.API_V1_STR}/bots/history", query_string={"limit": 0})
+    assert 422 == r.status_code
@@ -0,0 +1,131 @@
+import io
+import os
+import threading
+import time
+from pathlib import Path
+from zipfile import ZIP_DEFLATED, ZIP_STORED, ZipFile
+
+import pytest
+
+from app.api.helpers.responses import iter_open_file
+from app.helpers import archives
+from app.helpers.archives import ArchiveCache, iter_zip, scan_files
+
+pytestmark = pytest.mark.asyncio
+
+
+async def test_iter_zip_streams_workspace(tmp_path: Path):
+    (tmp_path / "notes.txt").write_text("hello " * 1000)
+    (tmp_path / "image.png").write_bytes(b"\x89PNG" + os.urandom(1000))
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "sub" / "page.html").write_text("<html></html>")
+    (tmp_path / ".gpt_cache").mkdir()
+    (tmp_path / ".gpt_cache" / "history.json").write_text("{}")
+    os.symlink(tmp_path / "missing", tmp_path / "dangling")
+
+    data = b"".join([chunk async for chunk in iter_zip(tmp_path, exclude={".gpt_cache"})])
+
+    with ZipFile(io.BytesIO(data)) as zip_file:
+        assert sorted(zip_file.namelist()) == ["image.png", "notes.txt", "sub/page.html"]
+        assert zip_file.read("notes.txt") == b"hello " * 1000
+        assert zip_file.read("image.png") == (tmp_path / "image.png").read_bytes()
+        assert zip_file.getinfo("image.png").compress_type == ZIP_STORED
+        assert zip_file.getinfo("notes.txt").compress_type == ZIP_DEFLATED
+        assert zip_file.testzip() is None
+
+
+async def test_iter_zip_stops_producer_when_consumer_leaves(tmp_path: Path):
+    # Much more than the queue holds, so the producer is blocked on it
+    for i in range(20):
+        (tmp_path / f"{i}.bin").write_bytes(os.urandom(256 * 1024))
+    stream = iter_zip(tmp_path)
+    assert await stream.__anext__()
+    await stream.aclose()
+    deadline = time.monotonic() + 5
+    while any(thread.name == "zip-producer" for thread in threading.enumerate()):
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+
+
+def read_cached(cache: ArchiveCache, key: str, root: Path) -> bytes | None:
+    cached = cache.lookup(key, "", scan_files(root))
+    if cached is None:
+        return None
+    with cached[0] as f:
+        return f.read()
+
+
+async def build(root: Path, cache: ArchiveCache) -> bytes:
+    entries = scan_files(root)
+    return b"".join([chunk async for chunk in iter_zip(root, entries=entries, cache=cache, key="user_1")])
+
+
+async def test_archive_cache_reuses_unchanged_members(tmp_path: Path, monkeypatch):
+    root = tmp_path / "workspace"
+    root.mkdir()
+    for i in range(5):
+        (root / f"{i}.txt").write_text(f"file {i} " * 1000)
+    cache = ArchiveCache(tmp_path / "cache", max_size=1024 * 1024)
+
+    first = await build(root, cache)
+    assert read_cached(cache, "user_1", root) == first
+    [archive_path] = (tmp_path / "cache").glob("*.zip")
+
+    (root / "2.txt").write_text("changed")
+    (root / "5.txt").write_text("new")
+    assert cache.lookup("user_1", "", scan_files(root)) is None
+    assert cache.lookup("user_1", "sub", scan_files(root)) is None
+
+    copied = []
+    copy_member = archives.copy_member
+    monkeypatch.setattr(
+        archives, "copy_member", lambda z, s, info: copied.append(info.filename) or copy_member(z, s, info)
+    )
+    second = await build(root, cache)
+    assert sorted(copied) == ["0.txt", "1.txt", "3.txt", "4.txt"]
+    with ZipFile(io.BytesIO(second)) as zip_file:
+        assert zip_file.testzip() is None
+        assert zip_file.read("1.txt") == (root / "1.txt").read_bytes()
+        assert zip_file.read("2.txt") == b"changed"
+        assert zip_file.read("5.txt") == b"new"
+        assert not zip_file.getinfo("1.txt").flag_bits & 0x08
+    # The previous archive is replaced
+    assert not archive_path.exists()
+    assert read_cached(cache, "user_1", root) == second
+
+
+async def test_archive_cache_evicts_least_recently_used(tmp_path: Path):
+    cache = ArchiveCache(tmp_path / "cache", max_size=2500)
+    roots = []
+    for user_id in range(3):
+        root = tmp_path / f"workspace_{user_id}"
+        root.mkdir()
+        (root / "data.bin").write_bytes(os.urandom(1000))
+        roots.append(root)
+        entries = scan_files(root)
+        [chunk async for chunk in iter_zip(root, entries=entries, cache=cache, key=f"user_{user_id}")]
+        if user_id == 1:
+            # Used again, so it outlives user 0
+            time.sleep(0.01)
+            assert read_cached(cache, "user_0", roots[0])
+    assert read_cached(cache, "user_0", roots[0])
+    assert read_cached(cache, "user_1", roots[1]) is None
+    assert read_cached(cache, "user_2", roots[2])
+
+
+async def test_archive_cache_sends_archive_evicted_meanwhile(tmp_path: Path):
+    root = tmp_path / "workspace"
+    root.mkdir()
+    (root / "data.bin").write_bytes(os.urandom(1000))
+    cache = ArchiveCache(tmp_path / "cache", max_size=1024 * 1024)
+    data = await build(root, cache)
+
+    f, st = cache.lookup("user_1", "", scan_files(root))
+    assert st.st_size == len(data)
+    cache.max_size = 0
+    cache.evict()
+    assert not list((tmp_path / "cache").glob("*.zip"))
+    assert b"".join([chunk async for chunk in iter_open_file(f)]) == data
+    assert f.closed
+    # Gone before it could be opened, a miss
+    assert cache.lookup("user_1", "", scan_files(root)) is None
@@ -0,0 +1,58 @@
+import gzip
+from pathlib import Path
+
+from app.helpers.compression import build_checkpoints_path, compress_log, read_checkpoints
+from app.helpers.readers import tail_as_list, tail_as_text
+
+
+def write_log(path: Path, count: int) -> bytes:
+    data = b"".join(f"line {i}\n".encode() for i in range(count))
+    path.write_bytes(data)
+    return data
+
+
+def test_compress_log_is_regular_gzip_with_checkpoints(tmp_path: Path):
+    data = write_log(tmp_path / "bot.log", 10000)
+    compress_log(tmp_path / "bot.log", tmp_path / "bot.log.gz", interval=4096)
+    assert gzip.decompress((tmp_path / "bot.log.gz").read_bytes()) == data
+    size, points = read_checkpoints(tmp_path / "bot.log.gz")
+    assert size == len(data)
+    assert [start for start, _ in points] == list(range(0, len(data), 4096))
+
+
+def test_tail_gzip_only_decompresses_the_end(tmp_path: Path):
+    write_log(tmp_path / "bot.log", 10000)
+    path = tmp_path / "bot.log.gz"
+    compress_log(tmp_path / "bot.log", path, interval=4096)
+    _, points = read_checkpoints(path)
+    # Garbage at the start of the deflate stream would break reading the file from the beginning
+    with path.open("r+b") as f:
+        f.seek(points[0][1])
+        f.write(b"\xff" * (points[1][1] - points[0][1]))
+    assert tail_as_list(path, 3) == ["line 9997", "line 9998", "line 9999"]
+    # Spans a few flush points
+    assert tail_as_list(path, 2000)[0] == "line 8000"
+
+
+def test_tail_gzip_with_end_and_whole_file(tmp_path: Path):
+    write_log(tmp_path / "bot.log", 1000)
+    path = tmp_path / "bot.log.gz"
+    compress_log(tmp_path / "bot.log", path, interval=1000)
+    assert tail_as_text(path, 2, end=len("line 0\nline 1\nline 2\n")) == "line 1\nline 2"
+    assert tail_as_list(path, 5000) == [f"line {i}" for i in range(1000)]
+
+
+def test_tail_gzip_falls_back_without_checkpoints(tmp_path: Path):
+    write_log(tmp_path / "bot.log", 1000)
+    path = tmp_path / "bot.log.gz"
+    compress_log(tmp_path / "bot.log", path, interval=1000)
+    with gzip.open(path, "wb") as f:
+        f.write(b"other\nlines\n")
+    assert read_checkpoints(path) is None
+    assert tail_as_list(path, 1) == ["lines"]
+    build_checkpoints_path(path).unlink()
+    assert tail_as_list(path, 2) == ["other", "lines"]
+
+    (tmp_path / "empty.log").touch()
+    compress_log(tmp_path / "empty.log", tmp_path / "empty.log.gz")
+    assert tail_as_text(tmp_path / "empty.log.gz", 3) == ""
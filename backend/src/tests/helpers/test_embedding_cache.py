@@ -0,0 +1,95 @@
+from pathlib import Path
+
+import numpy as np
+
+from app.helpers.embedding_cache import EmbeddingCache, build_key
+
+DIM = 16
+MODEL = "text-embedding-ada-002"
+
+
+def build_vector(i: int) -> np.ndarray:
+    return np.full(DIM, i, dtype=np.float32)
+
+
+def test_build_key():
+    assert build_key(MODEL, "text") == build_key(MODEL, "text")
+    assert build_key(MODEL, "text") != build_key("other-model", "text")
+    assert len(build_key(MODEL, "text")) == 16
+
+
+def test_embedding_cache_get_many(tmp_path: Path):
+    cache = EmbeddingCache(tmp_path, 1024 * 1024)
+    keys = [build_key(MODEL, str(i)) for i in range(3)]
+    assert cache.get_many(keys) == [None, None, None]
+    cache.put_many([(keys[0], build_vector(0)), (keys[2], build_vector(2))])
+    vectors = cache.get_many(keys)
+    assert np.array_equal(vectors[0], build_vector(0))
+    assert vectors[1] is None
+    assert np.array_equal(vectors[2], build_vector(2))
+    assert (cache.hits, cache.misses) == (2, 4)
+    cache.close()
+
+    # Another process opening the same directory sees the same entries
+    cache = EmbeddingCache(tmp_path, 1024 * 1024)
+    assert np.array_equal(cache.get_many(keys[2:])[0], build_vector(2))
+    assert cache.get_size() == 2 * DIM * 4
+    cache.close()
+
+
+def test_embedding_cache_get_or_compute(tmp_path: Path):
+    cache = EmbeddingCache(tmp_path, 1024 * 1024)
+    calls = []
+
+    def compute(texts: list[str]) -> list[list[float]]:
+        calls.append(texts)
+        return [[float(len(text))] * DIM for text in texts]
+
+    vectors = cache.get_or_compute(MODEL, ["a", "bb"], compute)
+    assert [v[0] for v in vectors] == [1.0, 2.0]
+    vectors = cache.get_or_compute(MODEL, ["bb", "ccc", "a"], compute)
+    assert [v[0] for v in vectors] == [2.0, 3.0, 1.0]
+    assert all(v.dtype == np.float32 for v in vectors)
+    # Only the misses are computed, all at once
+    assert calls == [["a", "bb"], ["ccc"]]
+    assert (cache.hits, cache.misses) == (2, 3)
+    cache.close()
+
+
+def test_embedding_cache_evicts_oldest_segments(tmp_path: Path):
+    vector_size = DIM * 4
+    cache = EmbeddingCache(tmp_path, 10 * vector_size, segment_size=2 * vector_size)
+    keys = [build_key(MODEL, str(i)) for i in range(20)]
+    for i, key in enumerate(keys):
+        cache.put_many([(key, build_vector(i))])
+    assert cache.get_size() <= 10 * vector_size
+    assert len(list(tmp_path.glob("*.seg"))) == 5
+    vectors = cache.get_many(keys)
+    assert all(vector is None for vector in vectors[:10])
+    assert all(np.array_equal(vector, build_vector(i)) for i, vector in enumerate(vectors[10:], 10))
+    cache.close()
+
+
+def test_embedding_cache_keeps_used_entries(tmp_path: Path):
+    vector_size = DIM * 4
+    cache = EmbeddingCache(tmp_path, 10 * vector_size, segment_size=2 * vector_size)
+    keys = [build_key(MODEL, str(i)) for i in range(40)]
+    for i, key in enumerate(keys):
+        cache.put_many([(key, build_vector(i))])
+        # The first entry is used all along and gets carried forward before its segment goes
+        assert cache.get_many(keys[:1])[0] is not None
+    assert cache.get_size() <= 10 * vector_size + vector_size
+    assert cache.get_many(keys[1:2]) == [None]
+    cache.close()
+
+
+def test_embedding_cache_survives_missing_segment(tmp_path: Path):
+    cache = EmbeddingCache(tmp_path, 1024 * 1024)
+    key = build_key(MODEL, "text")
+    cache.put_many([(key, build_vector(1))])
+    for path in tmp_path.glob("*.seg"):
+        path.unlink()
+    assert cache.get_many([key]) == [None]
+    cache.put_many([(key, build_vector(2))])
+    assert np.array_equal(cache.get_many([key])[0], build_vector(2))
+    cache.close()
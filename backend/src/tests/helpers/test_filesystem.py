@@ -0,0 +1,60 @@
+import threading
+from pathlib import Path
+
+import anyio
+import pytest
+
+from app.helpers.filesystem import FilesystemPool, remove_path
+
+
+@pytest.mark.asyncio
+async def test_pool_bounds_threads_and_records_latency():
+    pool = FilesystemPool(threads=2)
+    release = threading.Event()
+    running = []
+    peak = 0
+
+    def slow_call() -> None:
+        nonlocal peak
+        running.append(None)
+        peak = max(peak, len(running))
+        release.wait(5)
+        running.pop()
+
+    async with anyio.create_task_group() as tg:
+        for _ in range(5):
+            tg.start_soon(pool.run, slow_call)
+        await anyio.sleep(0.1)
+        statistics = pool.statistics()
+        assert (statistics["running"], statistics["waiting"]) == (2, 3)
+        release.set()
+
+    assert peak == 2
+    operation = pool.statistics()["operations"]["test_pool_bounds_threads_and_records_latency.<locals>.slow_call"]
+    assert operation["count"] == 5
+    assert operation["errors"] == 0
+    assert operation["max_wait_ms"] >= 50
+
+
+@pytest.mark.asyncio
+async def test_pool_counts_errors(tmp_path: Path):
+    pool = FilesystemPool(threads=1)
+    with pytest.raises(FileNotFoundError):
+        await pool.run((tmp_path / "missing").stat, name="stat")
+    assert await pool.run(tmp_path.exists, name="stat")
+    assert pool.statistics()["operations"]["stat"]["errors"] == 1
+    assert pool.statistics()["operations"]["stat"]["count"] == 2
+
+
+def test_remove_path(tmp_path: Path):
+    (tmp_path / "dir" / "sub").mkdir(parents=True)
+    (tmp_path / "dir" / "sub" / "file").write_text("x")
+    (tmp_path / "file").write_text("x")
+    (tmp_path / "link").symlink_to(tmp_path / "dir")
+
+    remove_path(tmp_path / "link")
+    assert (tmp_path / "dir" / "sub" / "file").exists()
+    remove_path(tmp_path / "dir")
+    remove_path(tmp_path / "file")
+    remove_path(tmp_path / "missing")
+    assert list(tmp_path.iterdir()) == []
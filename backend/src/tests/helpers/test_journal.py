@@ -0,0 +1,86 @@
+from dataclasses import dataclass
+from pathlib import Path
+
+
+from app.helpers import journal
+from app.helpers.journal import HistoryJournal
+
+
+@dataclass
+class Message:
+    role: str
+    content: str
+
+
+def test_journal_appends_and_loads(tmp_path: Path):
+    path = tmp_path / "history.jsonl"
+    history = HistoryJournal(path)
+    history.rewrite([], {"summary": "I was created", "last_trimmed_index": 0})
+    history.append_message(Message("user", "hello"))
+    history.append_message(Message("assistant", "hi"))
+    history.write_state({"summary": "Said hello", "last_trimmed_index": 1})
+    size = path.stat().st_size
+    history.write_state({"summary": "Said hello", "last_trimmed_index": 1})
+    assert path.stat().st_size == size
+    history.close()
+
+    loaded = HistoryJournal(path)
+    messages, state = loaded.load()
+    assert messages == [{"role": "user", "content": "hello"}, {"role": "assistant", "content": "hi"}]
+    assert state == {"summary": "Said hello", "last_trimmed_index": 1}
+    assert loaded.live_bytes + loaded.dead_bytes == size
+    assert loaded.dead_bytes == len(b'{"state":{"summary":"I was created","last_trimmed_index":0}}\n')
+
+
+def test_journal_cuts_torn_record(tmp_path: Path):
+    path = tmp_path / "history.jsonl"
+    history = HistoryJournal(path)
+    history.append_message(Message("user", "hello"))
+    history.close()
+    intact_size = path.stat().st_size
+    with path.open("ab") as f:
+        f.write(b'{"message":{"role":"assis')
+
+    messages, state = history.load()
+    assert messages == [{"role": "user", "content": "hello"}]
+    assert state is None
+    assert path.stat().st_size == intact_size
+    history.append_message(Message("assistant", "hi"))
+    assert len(HistoryJournal(path).load()[0]) == 2
+
+
+def test_journal_needs_compaction_once_dead_weight_dominates(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr(journal, "COMPACT_MIN_BYTES", 100)
+    path = tmp_path / "history.jsonl"
+    history = HistoryJournal(path)
+    for i in range(3):
+        history.append_message(Message("user", f"message {i}"))
+    i = 0
+    while not history.needs_compaction:
+        history.write_state({"summary": f"summary {i}", "last_trimmed_index": i})
+        i += 1
+    assert history.dead_bytes >= history.live_bytes
+
+    history.rewrite([Message("user", f"message {i}") for i in range(3)], history.state)
+    assert history.dead_bytes == 0
+    assert history.live_bytes == path.stat().st_size
+    assert HistoryJournal(path).load()[1] == {"summary": f"summary {i - 1}", "last_trimmed_index": i - 1}
+
+
+def test_plan_truncation_keeps_newest_messages_under_size(tmp_path: Path):
+    path = tmp_path / "history.jsonl"
+    history = HistoryJournal(path)
+    messages = [Message("user", "x" * (i * 10)) for i in range(20)]
+    state = {"summary": "I was created", "last_trimmed_index": 0}
+    history.rewrite(messages, state)
+    assert history.plan_truncation(history.size + 1) == 0
+
+    max_size = history.size // 2
+    count = history.plan_truncation(max_size)
+    history.rewrite(messages[count:], state)
+    assert history.size == path.stat().st_size < max_size
+    # Keeping one more message would have been too much
+    history.rewrite(messages[count - 1 :], state)
+    assert history.size >= max_size
+
+    assert history.plan_truncation(1) == len(messages) - count + 1
@@ -0,0 +1,75 @@
+from pathlib import Path
+
+import pytest
+
+from app.helpers.line_index import LineIndex, build_index_path
+from app.helpers.writers import LogWriter
+
+
+def write_lines(path: Path, start: int, stop: int) -> None:
+    with path.open("ab") as f:
+        f.write(b"".join(f"line {i}\n".encode() for i in range(start, stop)))
+
+
+def test_line_index_pages(tmp_path: Path):
+    path = tmp_path / "bot.log"
+    write_lines(path, 0, 100)
+    index = LineIndex.open(path)
+    assert build_index_path(path).exists()
+    assert index.total_lines == 100
+    assert index.read_lines(10, 2) == "line 10\nline 11\n"
+    assert index.read_lines(99, 10) == "line 99\n"
+
+
+def test_line_index_catches_up_and_rebuilds(tmp_path: Path):
+    path = tmp_path / "bot.log"
+    write_lines(path, 0, 10)
+    LineIndex.open(path)
+    write_lines(path, 10, 20)
+    with path.open("ab") as f:
+        f.write(b"partial")
+    index = LineIndex.open(path)
+    assert index.total_lines == 21
+    assert index.read_lines(19, 5) == "line 19\npartial"
+
+    path.write_bytes(b"new\n")
+    assert LineIndex.open(path).read_lines(0, 5) == "new\n"
+
+
+def test_line_index_read_only_never_writes(tmp_path: Path):
+    path = tmp_path / "bot.log"
+    write_lines(path, 0, 10)
+    index = LineIndex.open(path, read_only=True)
+    assert not build_index_path(path).exists()
+    assert index.total_lines == 10
+    assert index.read_lines(8, 5) == "line 8\nline 9\n"
+
+    LineIndex.open(path)
+    write_lines(path, 10, 12)
+    index = LineIndex.open(path, read_only=True)
+    assert index.read_lines(9, 2) == "line 9\nline 10\n"
+    # A stale sidecar is left for the writer to rebuild
+    sidecar = build_index_path(path).read_bytes()
+    path.write_bytes(b"rotated\n")
+    assert LineIndex.open(path, read_only=True).read_lines(0, 5) == "rotated\n"
+    assert build_index_path(path).read_bytes() == sidecar
+
+
+def test_line_index_rebuilds_leave_no_temp_files(tmp_path: Path):
+    path = tmp_path / "bot.log"
+    write_lines(path, 0, 10)
+    LineIndex.open(path).rebuild()
+    LineIndex.open(path).rebuild()
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["bot.log", "bot.log.idx"]
+
+
+@pytest.mark.asyncio
+async def test_log_writer_maintains_index(tmp_path: Path):
+    path = tmp_path / "bot.log"
+    write_lines(path, 0, 5)
+    async with LogWriter(path, flush_size=1, index=True, index_flush_interval=0) as w:
+        for i in range(5, 10):
+            await w.write(f"line {i}\n".encode())
+    index = LineIndex(path)
+    assert index.read_header()[3] == 10
+    assert LineIndex.open(path).read_lines(4, 2) == "line 4\nline 5\n"
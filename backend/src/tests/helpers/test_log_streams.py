@@ -0,0 +1,25 @@
+import fakeredis.aioredis
+import pytest
+
+from app.helpers.log_streams import iter_log_events, publish_log_lines, read_log_stream
+
+
+pytestmark = pytest.mark.asyncio
+
+
+async def test_log_stream_replays_from_last_id():
+    redis = fakeredis.aioredis.FakeRedis()
+    await publish_log_lines(redis, 1, [b"first\n", b"second\n"], maxlen=100, ttl=60)
+    entries = await read_log_stream(redis, 1)
+    assert [line for _, line in entries] == ["first\n", "second\n"]
+
+    await publish_log_lines(redis, 1, [b"third\n"], maxlen=100, ttl=60)
+    assert [line for _, line in await read_log_stream(redis, 1, entries[-1][0])] == ["third\n"]
+
+
+async def test_log_stream_events():
+    redis = fakeredis.aioredis.FakeRedis()
+    await publish_log_lines(redis, 1, [b"10%\r"], maxlen=100, ttl=60)
+    entry_id, _ = (await read_log_stream(redis, 1))[0]
+    event = await iter_log_events(redis, 1).__anext__()
+    assert event == f'id: {entry_id}\ndata: "10%\\r"\n\n'
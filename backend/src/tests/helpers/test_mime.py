@@ -0,0 +1,54 @@
+import os
+from pathlib import Path
+
+import pytest
+
+from app.helpers import mime
+from app.helpers.mime import MimeCache
+
+
+@pytest.mark.asyncio
+async def test_mime_cache_sniffs_only_changed_files(tmp_path: Path, monkeypatch):
+    workspace = tmp_path / "workspace"
+    workspace.mkdir()
+    (workspace / "notes.txt").write_text("hello")
+    (workspace / "data.json").write_text('{"a": 1}')
+    (workspace / "sub").mkdir()
+    cache_path = tmp_path / "mime.json"
+
+    sniffed = []
+    sniff = mime.sniff
+    monkeypatch.setattr(mime, "sniff", lambda path: sniffed.append(Path(path).name) or sniff(path))
+
+    def listing():
+        return [(f, f.stat()) for f in sorted(workspace.iterdir())]
+
+    cache = MimeCache.load(cache_path)
+    assert await cache.get_mime_types(listing()) == ["application/json", "text/plain", None]
+    cache.save()
+    assert sorted(sniffed) == ["data.json", "notes.txt"]
+
+    sniffed.clear()
+    (workspace / "notes.txt").rename(workspace / "renamed.txt")
+    (workspace / "data.json").write_text("plain text now")
+    cache = MimeCache.load(cache_path)
+    assert await cache.get_mime_types(listing()) == ["text/plain", "text/plain", None]
+    cache.save()
+    assert sniffed == ["data.json"]
+
+
+def test_mime_cache_drops_least_recently_used(tmp_path: Path):
+    cache = MimeCache(tmp_path / "mime.json", max_entries=2)
+    stats = []
+    for i in range(3):
+        path = tmp_path / f"{i}.txt"
+        path.write_text(str(i))
+        stats.append(os.stat(path))
+    cache.set(stats[0], "text/plain")
+    cache.set(stats[1], "text/plain")
+    cache.get(stats[0])
+    cache.set(stats[2], "text/plain")
+    cache.save()
+    cache = MimeCache.load(tmp_path / "mime.json")
+    assert cache.get(stats[0]) and cache.get(stats[2])
+    assert cache.get(stats[1]) is None
@@ -0,0 +1,109 @@
+import os
+import time
+from pathlib import Path
+
+import orjson
+import pytest
+
+from app.helpers import persistence
+from app.helpers.persistence import WriteBehind, flush_all, write_atomic
+
+
+def test_write_atomic_replaces_file(tmp_path: Path):
+    path = tmp_path / "state.json"
+    path.write_bytes(b"old")
+    write_atomic(path, b"new")
+    assert path.read_bytes() == b"new"
+    assert os.listdir(tmp_path) == ["state.json"]
+
+
+def test_write_atomic_keeps_old_content_on_failure(tmp_path: Path, monkeypatch):
+    path = tmp_path / "state.json"
+    path.write_bytes(b"old")
+
+    def fail(*args):
+        raise OSError("No space left on device")
+
+    monkeypatch.setattr(persistence.os, "replace", fail)
+    with pytest.raises(OSError):
+        write_atomic(path, b"new")
+    assert path.read_bytes() == b"old"
+    assert os.listdir(tmp_path) == ["state.json"]
+
+
+def test_write_behind_coalesces_changes(tmp_path: Path):
+    data = {}
+    writer = WriteBehind(tmp_path / "state.json", lambda: orjson.dumps(data), interval=60)
+    for i in range(10):
+        data[str(i)] = i
+        writer.mark_dirty()
+    assert not writer.path.exists()
+    assert writer.is_dirty
+    writer.flush()
+    assert orjson.loads(writer.path.read_bytes()) == {str(i): i for i in range(10)}
+    assert writer.writes == 1
+    assert not writer.is_dirty
+    writer.flush()
+    assert writer.writes == 1
+
+
+def test_write_behind_flushes_after_max_changes(tmp_path: Path):
+    data = {}
+    writer = WriteBehind(tmp_path / "state.json", lambda: orjson.dumps(data), interval=60, max_changes=3)
+    for i in range(7):
+        data[str(i)] = i
+        writer.mark_dirty()
+    assert writer.writes == 2
+    assert orjson.loads(writer.path.read_bytes()) == {str(i): i for i in range(6)}
+    assert writer.changes == 1
+    writer.flush()
+
+
+def test_write_behind_flushes_after_interval(tmp_path: Path):
+    writer = WriteBehind(tmp_path / "state.json", lambda: b"{}", interval=0.05)
+    writer.mark_dirty()
+    deadline = time.monotonic() + 5
+    while not writer.path.exists() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert writer.path.read_bytes() == b"{}"
+    assert writer.writes == 1
+    assert not writer.is_dirty
+
+
+def test_write_behind_forced_flush(tmp_path: Path):
+    writer = WriteBehind(tmp_path / "state.json", lambda: b"{}")
+    writer.flush(force=True)
+    assert writer.path.read_bytes() == b"{}"
+
+
+def test_write_behind_stays_dirty_on_failure(tmp_path: Path):
+    writer = WriteBehind(tmp_path / "missing" / "state.json", lambda: b"{}", interval=60)
+    writer.mark_dirty()
+    with pytest.raises(OSError):
+        writer.flush()
+    assert writer.is_dirty
+    writer.path.parent.mkdir()
+    flush_all()
+    assert writer.path.read_bytes() == b"{}"
+
+
+def test_flush_all(tmp_path: Path):
+    writers = [WriteBehind(tmp_path / f"{i}.json", lambda: b"[]", interval=60) for i in range(3)]
+    writers[0].mark_dirty()
+    writers[2].mark_dirty()
+    flush_all()
+    assert [writer.writes for writer in writers] == [1, 0, 1]
+    assert not any(writer.is_dirty for writer in writers)
+
+
+def test_flush_all_flushes_past_failure(tmp_path: Path):
+    failing = WriteBehind(tmp_path / "missing" / "state.json", lambda: b"{}", interval=60)
+    writer = WriteBehind(tmp_path / "state.json", lambda: b"{}", interval=60)
+    failing.mark_dirty()
+    writer.mark_dirty()
+    with pytest.raises(OSError):
+        flush_all()
+    assert writer.writes == 1
+    failing.path.parent.mkdir()
+    flush_all()
+    assert failing.writes == 1
@@ -0,0 +1,107 @@
+import os
+from pathlib import Path
+
+import pytest
+
+from app.helpers import previews
+from app.helpers.previews import PreviewCache, is_image, is_text, read_text_preview
+from app.helpers.system import evict_least_recently_used
+
+
+def test_read_text_preview_stops_at_lines_or_bytes(tmp_path: Path):
+    path = tmp_path / "notes.txt"
+    path.write_text("".join(f"line {i}\n" for i in range(100)))
+
+    assert read_text_preview(path, 3, 1024) == ("line 0\nline 1\nline 2\n", True)
+    assert read_text_preview(path, 1000, 10) == ("line 0\nlin", True)
+    text, is_truncated = read_text_preview(path, 100, 1024 * 1024)
+    assert text == path.read_text()
+    assert not is_truncated
+
+
+def test_read_text_preview_drops_split_character(tmp_path: Path):
+    path = tmp_path / "notes.txt"
+    path.write_text("abécd", encoding="utf-8")
+    # "é" takes bytes 2 and 3
+    assert read_text_preview(path, 10, 3) == ("ab", True)
+    assert read_text_preview(path, 10, 4) == ("abé", True)
+
+
+def test_mime_type_kinds():
+    assert is_text("text/plain")
+    assert is_text("application/json")
+    assert is_text("application/ld+json")
+    assert not is_text("application/octet-stream")
+    assert not is_text(None)
+    assert is_image("image/png")
+    assert not is_image("image/svg+xml")
+
+
+def test_preview_cache_builds_thumbnails_once(tmp_path: Path):
+    image_module = pytest.importorskip("PIL.Image")
+    path = tmp_path / "photo.jpg"
+    image_module.new("RGB", (1200, 800), "red").save(path)
+    cache = PreviewCache(tmp_path / "previews", max_size=1024 * 1024)
+
+    data, mime_type = cache.get_thumbnail(path, path.stat(), 128)
+    assert mime_type == "image/jpeg"
+    with image_module.open(cache.build_path(path.stat(), 128)) as thumbnail:
+        assert max(thumbnail.size) == 128
+    assert cache.get(path.stat(), 128) == (data, mime_type)
+    assert cache.get(path.stat(), 256) is None
+
+    # A rewritten file gets a new thumbnail
+    image_module.new("RGBA", (64, 64), (0, 0, 255, 128)).save(path.with_suffix(".png"))
+    os.replace(path.with_suffix(".png"), path)
+    assert cache.get(path.stat(), 128) is None
+    assert cache.get_thumbnail(path, path.stat(), 128)[1] == "image/png"
+
+
+def test_preview_cache_evicts_least_recently_used(tmp_path: Path):
+    cache = PreviewCache(tmp_path / "previews", max_size=250)
+    files = []
+    for i in range(3):
+        path = tmp_path / f"{i}.bin"
+        path.write_bytes(bytes([i]))
+        files.append(path.stat())
+    cache.set(files[0], 64, b"0" * 100)
+    cache.set(files[1], 64, b"1" * 100)
+    os.utime(cache.build_path(files[0], 64), (0, 0))
+    os.utime(cache.build_path(files[1], 64), (1, 1))
+    cache.get(files[0], 64)
+    cache.set(files[2], 64, b"2" * 100)
+    assert cache.get(files[0], 64) is not None
+    assert cache.get(files[1], 64) is None
+    assert cache.get(files[2], 64) is not None
+
+
+def test_preview_cache_scans_only_over_budget(tmp_path: Path, monkeypatch):
+    scans = []
+
+    def evict(*args) -> int:
+        scans.append(args)
+        return evict_least_recently_used(*args)
+
+    monkeypatch.setattr(previews, "evict_least_recently_used", evict)
+    cache = PreviewCache(tmp_path / "previews", max_size=450)
+    for i in range(5):
+        path = tmp_path / f"{i}.bin"
+        path.write_bytes(bytes([i]))
+        cache.set(path.stat(), 64, b"x" * 100)
+    # The first write to learn the size, then the one that goes over
+    assert len(scans) == 2
+    assert cache.size == 400
+    assert len(list((tmp_path / "previews").glob("*.thumb"))) == 4
+
+
+def test_build_thumbnail_rejects_too_large_images(tmp_path: Path, monkeypatch):
+    image_module = pytest.importorskip("PIL.Image")
+    path = tmp_path / "photo.png"
+    image_module.new("RGB", (100, 100), "red").save(path)
+    monkeypatch.setattr(image_module, "MAX_IMAGE_PIXELS", 8000)
+    # Over the limit but under twice it, Pillow itself only warns
+    with pytest.raises(OSError), pytest.warns(image_module.DecompressionBombWarning):
+        previews.build_thumbnail(path, 64)
+    monkeypatch.setattr(image_module, "MAX_IMAGE_PIXELS", 1000)
+    with pytest.raises(OSError):
+        previews.build_thumbnail(path, 64)
@@ -0,0 +1,43 @@
+import gzip
+from pathlib import Path
+
+from app.helpers.readers import read_since, tail_as_list, tail_as_text
+
+
+def test_tail_as_text(tmp_path: Path):
+    path = tmp_path / "bot.log"
+    path.write_text("".join(f"line {i}\n" for i in range(100)))
+    assert tail_as_text(path, 3) == "line 97\nline 98\nline 99"
+    assert tail_as_text(path, 3, end=len("line 0\nline 1\n")) == "line 0\nline 1"
+
+
+def test_tail_long_lines_and_carriage_returns(tmp_path: Path):
+    path = tmp_path / "bot.log"
+    path.write_bytes(b"x" * 10000 + b"\n10%\r20%\ndone")
+    assert tail_as_list(path, 2) == ["20%", "done"]
+    assert tail_as_text(path, 3) == "x" * 10000 + "\n10%\n20%\ndone"
+
+
+def test_tail_empty_and_gzip(tmp_path: Path):
+    path = tmp_path / "bot.log"
+    path.touch()
+    assert tail_as_text(path, 3) == ""
+    with gzip.open(tmp_path / "bot.log.gz", "wb") as f:
+        f.write(b"".join(f"line {i}\n".encode() for i in range(100)))
+    assert tail_as_list(tmp_path / "bot.log.gz", 2) == ["line 98", "line 99"]
+
+
+def test_read_since_returns_complete_lines(tmp_path: Path):
+    path = tmp_path / "bot.log"
+    path.write_bytes(b"first\nsecond\r\nthird")
+    assert read_since(path, 0, 1024) == ("first\nsecond\r\n", 14)
+    assert read_since(path, 14, 1024) == ("", 14)
+    with path.open("ab") as f:
+        f.write(b"\n")
+    assert read_since(path, 14, 1024) == ("third\n", 20)
+
+
+def test_read_since_splits_oversize_lines(tmp_path: Path):
+    path = tmp_path / "bot.log"
+    path.write_bytes(b"0123456789")
+    assert read_since(path, 0, 4) == ("0123", 4)
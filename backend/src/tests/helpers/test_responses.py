@@ -0,0 +1,97 @@
+from pathlib import Path
+
+import pytest
+from fastapi import Request
+
+from app.api.helpers.responses import build_file_response, build_log_cursor, parse_range, read_log_since
+
+
+def build_request(**headers: str) -> Request:
+    raw_headers = [(name.replace("_", "-").encode(), value.encode()) for name, value in headers.items()]
+    return Request({"type": "http", "method": "GET", "headers": raw_headers})
+
+
+async def read_body(response) -> bytes:
+    return b"".join([chunk async for chunk in response.body_iterator])
+
+
+def test_parse_range():
+    assert parse_range("bytes=0-9", 100) == (0, 9)
+    assert parse_range("bytes=90-", 100) == (90, 99)
+    assert parse_range("bytes=-10", 100) == (90, 99)
+    assert parse_range("bytes=-1000", 100) == (0, 99)
+    assert parse_range("bytes=50-1000", 100) == (50, 99)
+    # Ignored, the whole file is sent
+    assert parse_range("bytes=0-1,5-6", 100) is None
+    assert parse_range("items=0-9", 100) is None
+    assert parse_range("bytes=9-0", 100) is None
+    assert parse_range("bytes=-", 100) is None
+    with pytest.raises(ValueError):
+        parse_range("bytes=100-", 100)
+    with pytest.raises(ValueError):
+        parse_range("bytes=-0", 100)
+
+
+@pytest.mark.asyncio
+async def test_file_response_serves_ranges(tmp_path: Path):
+    path = tmp_path / "data.txt"
+    path.write_bytes(bytes(range(256)) * 1024)
+
+    full = await build_file_response(build_request(), path)
+    assert full.status_code == 200
+    assert full.headers["accept-ranges"] == "bytes"
+    etag = full.headers["etag"]
+
+    partial = await build_file_response(build_request(range="bytes=1000-1999"), path)
+    assert partial.status_code == 206
+    assert partial.headers["content-range"] == f"bytes 1000-1999/{256 * 1024}"
+    assert partial.headers["content-length"] == "1000"
+    assert await read_body(partial) == path.read_bytes()[1000:2000]
+
+    resumed = await build_file_response(build_request(range="bytes=-5", if_range=etag), path)
+    assert await read_body(resumed) == path.read_bytes()[-5:]
+
+    unsatisfiable = await build_file_response(build_request(range=f"bytes={256 * 1024}-"), path)
+    assert unsatisfiable.status_code == 416
+    assert unsatisfiable.headers["content-range"] == f"bytes */{256 * 1024}"
+
+
+@pytest.mark.asyncio
+async def test_file_response_ignores_range_of_changed_file(tmp_path: Path):
+    path = tmp_path / "data.txt"
+    path.write_bytes(b"a" * 100)
+    etag = (await build_file_response(build_request(), path)).headers["etag"]
+    path.write_bytes(b"b" * 200)
+
+    response = await build_file_response(build_request(range="bytes=100-", if_range=etag), path)
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+
+
+def test_read_log_since_follows_cursor(tmp_path: Path):
+    path = tmp_path / "bot.log"
+    path.write_text("first\nsecond\n")
+    text, cursor, reset = read_log_since(path, None, 1)
+    assert (text, reset) == ("second", False)
+    with path.open("a") as f:
+        f.write("third\nfou")
+    text, cursor, reset = read_log_since(path, cursor, 1)
+    assert (text, cursor, reset) == ("third\n", build_log_cursor(path.stat().st_ino, 19), False)
+    # Taken while there was no log yet
+    assert read_log_since(path, build_log_cursor(0, 0), 1)[0] == "first\nsecond\nthird\n"
+
+
+def test_read_log_since_resets_on_rotation(tmp_path: Path):
+    path = tmp_path / "bot.log"
+    path.write_text("old 0\nold 1\nold 2\n")
+    _, cursor, _ = read_log_since(path, None, 1)
+    # Rotated, the new log already grew past the offset of the old one
+    path.rename(tmp_path / "bot.log.1")
+    path.write_text("new 0\nnew 1\nnew 2\nnew 3\n")
+    text, cursor, reset = read_log_since(path, cursor, 2)
+    assert (text, reset) == ("new 2\nnew 3", True)
+    assert cursor == build_log_cursor(path.stat().st_ino, path.stat().st_size)
+
+    # Truncated in place
+    path.write_text("x\n")
+    assert read_log_since(path, cursor, 1) == ("x", build_log_cursor(path.stat().st_ino, 2), True)
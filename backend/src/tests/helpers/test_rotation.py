@@ -0,0 +1,78 @@
+import os
+from pathlib import Path
+
+import pytest
+
+from app.helpers.compression import build_checkpoints_path
+from app.helpers.line_index import build_index_path
+from app.helpers.readers import tail_segments_as_text
+from app.helpers.rotation import (
+    build_segment_path,
+    compress_segment,
+    list_segments,
+    remove_log,
+    rotate_log,
+    should_rotate,
+)
+from app.helpers.writers import LogWriter
+
+
+def rotate(path: Path, text: str, keep: int = 3) -> None:
+    path.write_text(text)
+    segment_path = rotate_log(path, keep)
+    if segment_path:
+        compress_segment(segment_path)
+
+
+def test_rotate_log_shifts_and_drops_segments(tmp_path: Path):
+    path = tmp_path / "bot.log"
+    for i in range(4):
+        rotate(path, f"run {i}\n")
+    assert not path.exists()
+    assert list_segments(path) == [build_segment_path(path, n) for n in (1, 2, 3)]
+    assert build_checkpoints_path(build_segment_path(path, 3)).exists()
+    assert tail_segments_as_text(list_segments(path), 10) == "run 1\nrun 2\nrun 3"
+
+    remove_log(path)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_should_rotate(tmp_path: Path):
+    path = tmp_path / "bot.log"
+    assert not should_rotate(path, 1, 1)
+    path.write_text("0123456789")
+    assert should_rotate(path, max_size=10)
+    assert not should_rotate(path, max_size=11)
+    assert not should_rotate(path, max_age=60)
+    os.utime(path, (0, 0))
+    assert should_rotate(path, max_age=60)
+
+
+def test_tail_stitches_segments(tmp_path: Path):
+    path = tmp_path / "bot.log"
+    rotate(path, "".join(f"old {i}\n" for i in range(5)))
+    # An unfinished last line of a segment doesn't merge with the next one
+    rotate(path, "middle 0\nmiddle 1")
+    path.write_text("new 0\nnew 1\n")
+    paths = [path, *list_segments(path)]
+    assert tail_segments_as_text(paths, 2) == "new 0\nnew 1"
+    assert tail_segments_as_text(paths, 5) == "old 4\nmiddle 0\nmiddle 1\nnew 0\nnew 1"
+    assert tail_segments_as_text(paths, 100).count("\n") == 8
+    assert tail_segments_as_text([tmp_path / "missing.log", path], 1) == "new 1"
+
+
+@pytest.mark.asyncio
+async def test_log_writer_rotates(tmp_path: Path):
+    path = tmp_path / "bot.log"
+    path.write_bytes(b"x" * 100 + b"\n")
+    async with LogWriter(path, flush_size=1, rotate_size=100, rotate_keep=2, index=True) as w:
+        # Already too big, rotated on open
+        assert build_segment_path(path, 1, compressed=False).exists() or build_segment_path(path, 1).exists()
+        for i in range(30):
+            await w.write(f"line {i:02}\n".encode())
+    segments = list_segments(path)
+    assert segments == [build_segment_path(path, 1), build_segment_path(path, 2)]
+    text = tail_segments_as_text([path, *segments], 1000)
+    assert text.split("\n")[-1] == "line 29"
+    assert "x" * 100 not in text
+    assert build_index_path(path).exists()
@@ -0,0 +1,193 @@
+import sqlite3
+from pathlib import Path
+
+import orjson
+import pytest
+
+from app.helpers.journal import HistoryJournal
+from app.helpers.state_store import (
+    StateStore,
+    build_state_store_path,
+    migrate_from_json,
+    read_budget,
+    read_history,
+)
+
+INDEX = "auto-gpt"
+
+
+def build_message(i: int) -> dict:
+    return {"role": "user", "content": f"message {i}"}
+
+
+def test_state_store_messages(tmp_path: Path):
+    store = StateStore(tmp_path / "state.sqlite3")
+    for i in range(10):
+        store.append_message(build_message(i))
+    assert store.count_messages() == 10
+    assert store.load_messages() == [build_message(i) for i in range(10)]
+    assert store.load_messages(3, 5) == [build_message(3), build_message(4)]
+    assert store.load_messages(8) == [build_message(8), build_message(9)]
+
+    store.delete_messages(4)
+    assert store.count_messages() == 6
+    # Positions are counted from the oldest message left
+    assert store.load_messages(0, 2) == [build_message(4), build_message(5)]
+
+    store.replace_messages([build_message(i) for i in range(20, 23)], {"summary": "s", "last_trimmed_index": 1})
+    assert store.load_messages(1, 2) == [build_message(21)]
+    assert store.get_history_state() == {"summary": "s", "last_trimmed_index": 1}
+    store.close()
+
+    store = StateStore(tmp_path / "state.sqlite3")
+    assert store.load_messages() == [build_message(i) for i in range(20, 23)]
+    store.close()
+
+
+def test_state_store_plan_truncation(tmp_path: Path):
+    store = StateStore(tmp_path / "state.sqlite3")
+    for i in range(10):
+        store.append_message({"content": "x" * 90})
+    size = store.get_messages_size()
+    assert store.plan_truncation(size + 1) == 0
+    count = store.plan_truncation(size // 2)
+    store.delete_messages(count)
+    assert store.get_messages_size() < size // 2
+    assert store.count_messages() == 10 - count
+    store.close()
+
+
+def test_state_store_agents_and_budget(tmp_path: Path):
+    store = StateStore(tmp_path / "state.sqlite3")
+    assert store.get_budget() is None
+    store.set_agent(1, ["task", [build_message(0)], "gpt-3.5-turbo"])
+    store.set_agent(2, ["other", [], "gpt-4"])
+    store.delete_agent(1)
+    store.set_budget({"total_prompt_tokens": 10, "total_completion_tokens": 5, "total_cost": 0.5})
+    store.close()
+
+    store = StateStore(tmp_path / "state.sqlite3")
+    assert store.load_agents() == {2: ["other", [], "gpt-4"]}
+    assert store.get_budget() == {
+        "total_prompt_tokens": 10,
+        "total_completion_tokens": 5,
+        "total_cost": 0.5,
+        "total_budget": 0,
+        "embedding_cache_hits": 0,
+        "embedding_cache_misses": 0,
+    }
+    store.close()
+
+
+def test_state_store_rolls_back(tmp_path: Path):
+    store = StateStore(tmp_path / "state.sqlite3")
+    store.append_message(build_message(0))
+    with pytest.raises(RuntimeError):
+        with store.transaction():
+            store.delete_messages(1)
+            raise RuntimeError("Interrupted")
+    assert store.count_messages() == 1
+    store.close()
+
+
+def test_migrate_from_json(tmp_path: Path):
+    journal = HistoryJournal(tmp_path / f"{INDEX}-history.jsonl")
+    journal.rewrite([build_message(0), build_message(1)], {"summary": "s", "last_trimmed_index": 1})
+    journal.close()
+    (tmp_path / f"{INDEX}-agents.json").write_bytes(orjson.dumps({"3": ["task", [], "gpt-4"]}))
+    budget = {"total_prompt_tokens": 1, "total_completion_tokens": 2, "total_cost": 0.25, "total_budget": 1.0}
+    (tmp_path / f"{INDEX}-budget.json").write_bytes(orjson.dumps(budget))
+
+    store = StateStore(build_state_store_path(tmp_path, INDEX))
+    assert migrate_from_json(store, tmp_path, INDEX)
+    assert store.load_messages() == [build_message(0), build_message(1)]
+    assert store.get_history_state() == {"summary": "s", "last_trimmed_index": 1}
+    assert store.load_agents() == {3: ["task", [], "gpt-4"]}
+    assert store.get_budget() == {**budget, "embedding_cache_hits": 0, "embedding_cache_misses": 0}
+    assert not any(path.suffix in (".json", ".jsonl") for path in tmp_path.iterdir())
+    assert not migrate_from_json(store, tmp_path, INDEX)
+    store.close()
+
+
+def test_migrate_from_legacy_history(tmp_path: Path):
+    legacy = {"messages": [build_message(0)], "summary": "s", "last_trimmed_index": 0}
+    (tmp_path / f"{INDEX}-history.json").write_bytes(orjson.dumps(legacy))
+    store = StateStore(build_state_store_path(tmp_path, INDEX))
+    store.append_message(build_message(5))
+    assert migrate_from_json(store, tmp_path, INDEX)
+    assert store.load_messages() == [build_message(0)]
+    assert store.get_history_state() == {"summary": "s", "last_trimmed_index": 0}
+    assert store.get_budget() is None
+    store.close()
+
+
+def test_read_budget_and_history(tmp_path: Path):
+    assert read_budget(tmp_path, INDEX) is None
+    assert read_history(tmp_path, INDEX) == ([], 0)
+
+    journal = HistoryJournal(tmp_path / f"{INDEX}-history.jsonl")
+    journal.rewrite([build_message(i) for i in range(5)], {"summary": "", "last_trimmed_index": 0})
+    journal.close()
+    (tmp_path / f"{INDEX}-budget.json").write_bytes(orjson.dumps({"total_cost": 0.5}))
+    assert read_budget(tmp_path, INDEX) == {"total_cost": 0.5}
+    assert read_history(tmp_path, INDEX, 1, 3) == ([build_message(1), build_message(2)], 5)
+
+    store = StateStore(build_state_store_path(tmp_path, INDEX))
+    migrate_from_json(store, tmp_path, INDEX)
+    store.append_message(build_message(5))
+    # The agent keeps its connection open while the API reads
+    assert read_budget(tmp_path, INDEX)["total_cost"] == 0.5
+    assert read_history(tmp_path, INDEX, 4, 10) == ([build_message(4), build_message(5)], 6)
+    store.close()
+
+
+def test_read_history_leaves_torn_journal(tmp_path: Path):
+    path = tmp_path / f"{INDEX}-history.jsonl"
+    journal = HistoryJournal(path)
+    journal.append_message(build_message(0))
+    journal.close()
+    with path.open("ab") as f:
+        f.write(b'{"message": {"ro')
+    size = path.stat().st_size
+    assert read_history(tmp_path, INDEX) == ([build_message(0)], 1)
+    assert path.stat().st_size == size
+
+
+def test_state_store_adds_budget_columns(tmp_path: Path):
+    path = tmp_path / "state.sqlite3"
+    store = StateStore(path)
+    store.connection.executescript(
+        "DROP TABLE budget; CREATE TABLE budget (id INTEGER PRIMARY KEY CHECK (id = 0), "
+        "total_prompt_tokens INTEGER NOT NULL, total_completion_tokens INTEGER NOT NULL, "
+        "total_cost REAL NOT NULL, total_budget REAL NOT NULL);"
+        "INSERT INTO budget VALUES (0, 1, 2, 0.5, 1.0);"
+    )
+    store.close()
+    store = StateStore(path)
+    assert store.get_budget()["embedding_cache_hits"] == 0
+    store.set_budget({"embedding_cache_hits": 3})
+    assert store.get_budget()["embedding_cache_hits"] == 3
+    store.close()
+
+
+def test_read_only_state_store_leaves_database(tmp_path: Path):
+    path = tmp_path / "state.sqlite3"
+    store = StateStore(path)
+    store.connection.executescript(
+        "DROP TABLE budget; CREATE TABLE budget (id INTEGER PRIMARY KEY CHECK (id = 0), "
+        "total_prompt_tokens INTEGER NOT NULL, total_completion_tokens INTEGER NOT NULL, "
+        "total_cost REAL NOT NULL, total_budget REAL NOT NULL);"
+        "INSERT INTO budget VALUES (0, 1, 2, 0.5, 1.0);"
+    )
+    store.close()
+    store = StateStore(path, read_only=True)
+    assert store.get_budget()["embedding_cache_hits"] == 0
+    with pytest.raises(sqlite3.OperationalError):
+        store.append_message(build_message(0))
+    store.close()
+    columns = {row[1] for row in sqlite3.connect(path).execute("PRAGMA table_info(budget)")}
+    assert "embedding_cache_hits" not in columns
+
+    with pytest.raises(sqlite3.OperationalError):
+        StateStore(tmp_path / "missing" / "state.sqlite3", read_only=True).connection
+    assert not (tmp_path / "missing").exists()
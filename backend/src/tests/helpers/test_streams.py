@@ -0,0 +1,28 @@
+import asyncio
+
+import pytest
+
+from app.helpers.streams import LineSplitter
+
+
+pytestmark = pytest.mark.asyncio
+
+
+async def read_all(chunks: list[bytes], limit: int = 2**16) -> list[bytes]:
+    reader = asyncio.StreamReader()
+    for chunk in chunks:
+        reader.feed_data(chunk)
+    reader.feed_eof()
+    return [line async for line in LineSplitter(reader, limit=limit, chunk_size=4)]
+
+
+async def test_line_splitter_splits_on_both_separators():
+    assert await read_all([b"a\nb\rc\r", b"\nd"]) == [b"a\n", b"b\r", b"c\r", b"\n", b"d"]
+
+
+async def test_line_splitter_joins_lines_across_reads():
+    assert await read_all([b"he", b"llo wor", b"ld\n"]) == [b"hello world\n"]
+
+
+async def test_line_splitter_chunks_oversize_lines():
+    assert await read_all([b"0123456789\n"], limit=4) == [b"0123", b"4567", b"89\n"]
@@ -0,0 +1,70 @@
+import os
+import time
+from pathlib import Path
+
+import pytest
+
+from app.helpers.uploads import ResumableUploads, UploadConflict, UploadNotFound, UploadTooLarge, save_stream
+
+
+async def iter_chunks(*chunks: bytes):
+    for chunk in chunks:
+        yield chunk
+
+
+@pytest.mark.asyncio
+async def test_save_stream_replaces_atomically(tmp_path: Path):
+    destination = tmp_path / "data.csv"
+    destination.write_bytes(b"old")
+    assert await save_stream(destination, iter_chunks(b"a,b\n", b"1,2\n"), max_size=100) == 8
+    assert destination.read_bytes() == b"a,b\n1,2\n"
+
+    with pytest.raises(UploadTooLarge):
+        await save_stream(destination, iter_chunks(b"x" * 60, b"x" * 60), max_size=100)
+    assert destination.read_bytes() == b"a,b\n1,2\n"
+    assert [p.name for p in tmp_path.iterdir()] == ["data.csv"]
+
+
+@pytest.mark.asyncio
+async def test_resumable_upload(tmp_path: Path):
+    uploads = ResumableUploads(tmp_path / "uploads", ttl=60)
+    destination = tmp_path / "dataset.bin"
+    upload = uploads.create(destination, 10)
+
+    async def broken_off():
+        yield b"0123"
+        raise ConnectionResetError()
+
+    with pytest.raises(ConnectionResetError):
+        await uploads.append(upload.id, 0, broken_off())
+    assert uploads.get(upload.id).offset == 4
+    with pytest.raises(UploadConflict):
+        await uploads.append(upload.id, 0, iter_chunks(b"0123"))
+    with pytest.raises(UploadTooLarge):
+        await uploads.append(upload.id, 4, iter_chunks(b"4567890"))
+    assert not destination.exists()
+
+    upload = await uploads.append(upload.id, 4, iter_chunks(b"45", b"6789"))
+    assert upload.is_complete
+    assert upload.replaced_size is None
+    assert destination.read_bytes() == b"0123456789"
+    with pytest.raises(UploadNotFound):
+        uploads.get(upload.id)
+    with pytest.raises(UploadNotFound):
+        uploads.get("../../etc/passwd")
+
+    upload = uploads.create(destination, 3)
+    upload = await uploads.append(upload.id, 0, iter_chunks(b"abc"))
+    assert upload.replaced_size == 10
+    assert destination.read_bytes() == b"abc"
+
+
+def test_resumable_uploads_expire(tmp_path: Path):
+    uploads = ResumableUploads(tmp_path / "uploads", ttl=60)
+    stale = uploads.create(tmp_path / "stale.bin", 10)
+    old = time.time() - 120
+    os.utime(uploads.build_data_path(stale.id), (old, old))
+    fresh = uploads.create(tmp_path / "fresh.bin", 10)
+    with pytest.raises(UploadNotFound):
+        uploads.get(stale.id)
+    assert uploads.get(fresh.id).offset == 0
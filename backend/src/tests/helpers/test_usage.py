@@ -0,0 +1,60 @@
+from pathlib import Path
+
+import fakeredis.aioredis
+import pytest
+
+from app.helpers import usage
+from app.helpers.usage import add_usage, delete_usage, get_usage, measure, reconcile_usage
+
+
+def build_workspace(path: Path) -> Path:
+    (path / "sub").mkdir(parents=True)
+    (path / "notes.txt").write_bytes(b"a" * 100)
+    (path / "sub" / "data.json").write_bytes(b"b" * 50)
+    (path / "link").symlink_to(path / "notes.txt")
+    return path
+
+
+def test_measure(tmp_path: Path):
+    workspace = build_workspace(tmp_path / "workspace")
+    assert measure(workspace) == (150, 2)
+    assert measure(workspace / "sub") == (50, 1)
+    assert measure(workspace / "notes.txt") == (100, 1)
+    assert measure(workspace / "link") == (0, 0)
+    assert measure(workspace / "missing") == (0, 0)
+
+
+@pytest.mark.asyncio
+async def test_usage_is_measured_once_and_then_counted(tmp_path: Path, monkeypatch):
+    redis = fakeredis.aioredis.FakeRedis()
+    workspace = build_workspace(tmp_path / "workspace")
+    measured = []
+    monkeypatch.setattr(usage, "measure", lambda path: measured.append(path) or measure(path))
+
+    first = await get_usage(redis, 1, workspace)
+    assert (first.size, first.files) == (150, 2)
+    await add_usage(redis, 1, 30, 1)
+    await add_usage(redis, 1, -50, -1)
+    second = await get_usage(redis, 1, workspace)
+    assert (second.size, second.files) == (130, 2)
+    assert second.reconciled_at == first.reconciled_at
+    assert len(measured) == 1
+
+    # Agents write behind the counters' back until the next reconciliation
+    (workspace / "output.txt").write_bytes(b"c" * 1000)
+    reconciled = await reconcile_usage(redis, 1, workspace)
+    assert (reconciled.size, reconciled.files) == (1150, 3)
+    assert (await get_usage(redis, 1, workspace)).size == 1150
+
+
+@pytest.mark.asyncio
+async def test_counters_without_measurement_are_replaced(tmp_path: Path):
+    redis = fakeredis.aioredis.FakeRedis()
+    workspace = build_workspace(tmp_path / "workspace")
+    await add_usage(redis, 1, 10, 1)
+    workspace_usage = await get_usage(redis, 1, workspace)
+    assert (workspace_usage.size, workspace_usage.files) == (150, 2)
+
+    await delete_usage(redis, 1)
+    (workspace / "notes.txt").unlink()
+    assert (await get_usage(redis, 1, workspace)).size == 50
@@ -0,0 +1,149 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from app.helpers import vectors
+from app.helpers.vectors import VectorIndex, hash_embedding
+
+DIM = 64
+TEXTS = [
+    "the cat sat on the mat",
+    "python is a programming language",
+    "stock prices fell sharply today",
+    "a recipe for chocolate cake",
+]
+
+
+def build_index(path: Path) -> VectorIndex:
+    index = VectorIndex(path, DIM)
+    index.load()
+    return index
+
+
+def test_hash_embedding():
+    vector = hash_embedding("some words here", DIM)
+    assert vector.dtype == np.float32
+    assert np.isclose(np.linalg.norm(vector), 1.0)
+    assert np.array_equal(vector, hash_embedding("Some words, here!", DIM))
+    assert not hash_embedding("", DIM).any()
+
+
+def test_vector_index_search(tmp_path: Path):
+    index = build_index(tmp_path)
+    for i, text in enumerate(TEXTS):
+        index.add(f"key{i}", hash_embedding(text, DIM), {"text": text})
+    results = index.search(hash_embedding("python programming", DIM), 2)
+    assert len(results) == 2
+    item_id, score, scores = results[0]
+    assert index.items[item_id] == {"text": TEXTS[1]}
+    assert score == pytest.approx(float(scores[0]))
+    assert results[0][1] >= results[1][1]
+    assert len(index.search(hash_embedding("cake", DIM), 10)) == len(TEXTS)
+
+
+def test_vector_index_scores_items_by_best_row(tmp_path: Path):
+    index = build_index(tmp_path)
+    index.add("a", np.vstack([hash_embedding("summary of nothing", DIM), hash_embedding("chocolate cake", DIM)]), {})
+    index.add("b", hash_embedding("stock prices", DIM), {})
+    [(item_id, score, scores)] = index.search(hash_embedding("chocolate cake", DIM), 1)
+    assert item_id == index.keys["a"]
+    assert len(scores) == 2
+    assert score == pytest.approx(1.0, abs=1e-5)
+    assert scores[1] == pytest.approx(1.0, abs=1e-5)
+
+
+def test_vector_index_persists(tmp_path: Path):
+    index = build_index(tmp_path)
+    # Past the initial capacity, so the matrix has to grow
+    for i in range(300):
+        index.add(f"key{i}", hash_embedding(f"item number {i}", DIM) * 3, {"i": i})
+    index.discard("key5")
+    index.add("key7", hash_embedding("replaced", DIM), {"i": "replaced"})
+    assert len(index) == 299
+
+    index = build_index(tmp_path)
+    assert len(index) == 299
+    assert "key5" not in index
+    assert index.items[index.keys["key7"]] == {"i": "replaced"}
+    vectors = index.get_vectors(index.keys["key9"])
+    # Stored normalized
+    assert np.allclose(vectors, hash_embedding("item number 9", DIM), atol=1e-6)
+    [(item_id, _, _)] = index.search(hash_embedding("replaced", DIM), 1)
+    assert item_id == index.keys["key7"]
+
+
+def test_vector_index_cuts_torn_record(tmp_path: Path):
+    index = build_index(tmp_path)
+    index.add("a", hash_embedding("first", DIM), {})
+    with index.items_path.open("ab") as f:
+        f.write(b'{"key": "b", "st')
+    index = build_index(tmp_path)
+    assert len(index) == 1
+    index.add("b", hash_embedding("second", DIM), {})
+    assert len(build_index(tmp_path)) == 2
+
+
+def test_vector_index_clear(tmp_path: Path):
+    index = build_index(tmp_path)
+    index.add("a", hash_embedding("first", DIM), {})
+    index.clear()
+    assert len(index) == 0
+    assert index.search(hash_embedding("first", DIM), 1) == []
+    index.add("b", hash_embedding("second", DIM), {})
+    assert list(build_index(tmp_path).keys) == ["b"]
+
+
+def test_vector_index_rejects_wrong_vectors(tmp_path: Path):
+    index = build_index(tmp_path)
+    with pytest.raises(ValueError):
+        index.add("a", np.zeros(DIM + 1), {})
+    with pytest.raises(ValueError):
+        index.add("a", np.zeros((0, DIM)), {})
+
+
+def test_vector_index_compacts(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr(vectors, "COMPACT_MIN_BYTES", 100 * DIM * 4)
+    index = build_index(tmp_path)
+    for i in range(300):
+        index.add(f"key{i}", hash_embedding(f"item number {i}", DIM), {"i": i})
+    for i in range(0, 298, 2):
+        index.discard(f"key{i}")
+    assert index.rows == 300
+    # The last removal makes the dead rows as many as the live ones
+    index.discard("key298")
+    assert index.rows == index.live_rows == 150
+    index.add("key1", hash_embedding("replaced", DIM), {"i": "replaced"})
+    assert [path.name for path in tmp_path.glob("*.f32")] == [index.vectors_path.name]
+
+    index = build_index(tmp_path)
+    assert len(index) == 150
+    assert index.rows == 151
+    assert index.items[index.keys["key1"]] == {"i": "replaced"}
+    assert np.allclose(index.get_vectors(index.keys["key9"]), hash_embedding("item number 9", DIM), atol=1e-6)
+    [(item_id, _, _)] = index.search(hash_embedding("item number 9", DIM), 1)
+    assert item_id == index.keys["key9"]
+    index.add("key300", hash_embedding("after", DIM), {})
+    assert len(build_index(tmp_path)) == 151
+
+
+def test_vector_index_removes_stray_vectors(tmp_path: Path):
+    index = build_index(tmp_path)
+    index.add("a", hash_embedding("first", DIM), {})
+    # Left by a compaction interrupted before the items were replaced
+    (tmp_path / "vectors-0.f32").write_bytes(b"\0" * DIM * 4)
+    index = build_index(tmp_path)
+    assert len(index) == 1
+    assert [path.name for path in tmp_path.glob("*.f32")] == ["vectors.f32"]
+
+
+def test_vector_index_truncate_to_size(tmp_path: Path):
+    index = build_index(tmp_path)
+    for i in range(10):
+        index.add(f"key{i}", hash_embedding(f"item number {i}", DIM), {"i": i})
+    assert index.truncate_to_size(index.rows * index.row_size + 1) == 0
+    assert index.truncate_to_size(8 * index.row_size, 4 * index.row_size) == 7
+    assert sorted(index.keys) == ["key7", "key8", "key9"]
+    index = build_index(tmp_path)
+    assert sorted(index.keys) == ["key7", "key8", "key9"]
+    assert index.rows == 3
@@ -0,0 +1,73 @@
+import os
+from pathlib import Path
+
+import pytest
+
+from app.helpers.workspace import fingerprint_entries, list_workspace, scan_directory
+
+
+@pytest.fixture
+def workspace(tmp_path: Path) -> Path:
+    for name, size in (("b.txt", 30), ("a.txt", 10), ("c.txt", 20)):
+        (tmp_path / name).write_bytes(b"x" * size)
+    (tmp_path / "sub" / "deep").mkdir(parents=True)
+    (tmp_path / "sub" / "d.txt").write_text("d")
+    (tmp_path / "sub" / "deep" / "e.txt").write_text("e")
+    (tmp_path / ".gpt_cache").mkdir()
+    (tmp_path / ".gpt_cache" / "history.json").write_text("{}")
+    return tmp_path
+
+
+def paths(page) -> list[str]:
+    return [entry.path for entry in page.entries]
+
+
+def test_list_workspace_sorts(workspace: Path):
+    exclude = {".gpt_cache"}
+    assert paths(list_workspace(workspace, workspace, exclude)) == ["a.txt", "b.txt", "c.txt", "sub"]
+    by_size = list_workspace(workspace, workspace, exclude, sort="size", order="desc")
+    assert [path for path in paths(by_size) if path != "sub"] == ["b.txt", "c.txt", "a.txt"]
+    os.utime(workspace / "c.txt", ns=(1, 1))
+    assert paths(list_workspace(workspace, workspace, exclude, sort="mtime"))[0] == "c.txt"
+    assert paths(list_workspace(workspace, workspace / ".gpt_cache", exclude)) == []
+
+
+def test_list_workspace_paginates_with_cursor(workspace: Path):
+    exclude = {".gpt_cache"}
+    page = list_workspace(workspace, workspace, exclude, limit=2, depth=8)
+    assert paths(page) == ["a.txt", "b.txt"]
+    seen = paths(page)
+    while page.next_cursor:
+        # Sorts before the cursor, so it doesn't shift the next pages
+        (workspace / "0-new.txt").touch()
+        page = list_workspace(workspace, workspace, exclude, limit=2, cursor=page.next_cursor, depth=8)
+        seen += paths(page)
+    assert seen == ["a.txt", "b.txt", "c.txt", "sub", "sub/d.txt", "sub/deep", "sub/deep/e.txt"]
+    cursor = list_workspace(workspace, workspace, exclude, limit=2).next_cursor
+    with pytest.raises(ValueError):
+        list_workspace(workspace, workspace, exclude, sort="size", limit=2, cursor=cursor)
+    with pytest.raises(ValueError):
+        list_workspace(workspace, workspace, exclude, limit=2, cursor="not a cursor")
+
+
+def test_scan_directory_depth(workspace: Path):
+    entries = {entry.path: entry for entry in scan_directory(workspace, workspace, {".gpt_cache"}, depth=2)}
+    assert set(entries) == {"a.txt", "b.txt", "c.txt", "sub", "sub/d.txt", "sub/deep"}
+    assert entries["sub/deep"].is_dir and not entries["sub/d.txt"].is_dir
+    deep = {entry.path for entry in scan_directory(workspace, workspace / "sub", depth=8)}
+    assert deep == {"sub/d.txt", "sub/deep", "sub/deep/e.txt"}
+
+
+def test_fingerprint_entries_tracks_changes(workspace: Path):
+    def fingerprint() -> str:
+        return fingerprint_entries(list_workspace(workspace, workspace).entries)
+
+    original = fingerprint()
+    assert fingerprint() == original
+    (workspace / "a.txt").write_bytes(b"y" * 11)
+    changed = fingerprint()
+    assert changed != original
+    (workspace / "a.txt").rename(workspace / "z.txt")
+    assert fingerprint() != changed
+    os.symlink(workspace / "missing", workspace / "dangling")
+    assert "dangling" in paths(list_workspace(workspace, workspace))
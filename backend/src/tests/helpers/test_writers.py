@@ -0,0 +1,34 @@
+import asyncio
+from pathlib import Path
+
+import pytest
+
+from app.helpers.writers import LogWriter
+
+
+pytestmark = pytest.mark.asyncio
+
+
+async def test_log_writer_collapses_carriage_lines(tmp_path: Path):
+    path = tmp_path / "bot.log"
+    async with LogWriter(path) as w:
+        for line in [b"start\n", b"10%\r", b"20%\r", b"30%\r", b"done\n", b"40%\r"]:
+            await w.write(line)
+    assert path.read_bytes() == b"start\n10%\rdone\n40%\r"
+
+
+async def test_log_writer_flushes_by_size(tmp_path: Path):
+    path = tmp_path / "bot.log"
+    async with LogWriter(path, flush_size=10, flush_interval=60) as w:
+        await w.write(b"12345\n")
+        assert path.read_bytes() == b""
+        await w.write(b"67890\n")
+        assert path.read_bytes() == b"12345\n67890\n"
+
+
+async def test_log_writer_flushes_by_interval(tmp_path: Path):
+    path = tmp_path / "bot.log"
+    async with LogWriter(path, flush_size=1024, flush_interval=0.01) as w:
+        await w.write(b"line\n")
+        await asyncio.sleep(0.1)
+        assert path.read_bytes() == b"line\n"